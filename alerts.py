@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+import metrics
+
+ALERTS_FILE = os.environ.get("ALERTS_FILE", "alerts.json")  # alert rules, see load_rules
+ALERTS_LOG = os.environ.get("ALERTS_LOG", "alerts.jsonl")  # notifications, one json object per line
+ALERTS_MAX_BYTES = 10 * 1024 * 1024  # size of the notifications file before it is rotated
+COOLDOWN = 300  # seconds before a rule notifies again for the same stock
+TIMEFRAME = "1Min"  # bars the indicators of the rules are computed on
+DEFAULT_RULES = ["RSI < 30", "RSI > 70", "MA5 crosses above MA10", "MA5 crosses below MA10", "change > 2",
+                 "change < -2"]  # the 30 / 70 rsi lines of the dashboard, sma crossovers and large moves
+
+FIELDS = ["price", "change", "open", "high", "low", "close", "MA5", "MA10", "MA20", "RSI", "volume_diff"]
+ALIASES = {"rsi14": "RSI", "rsi": "RSI", "pct change": "change", "pct_change": "change", "last": "price"}
+OPERATORS = [">", "<", ">=", "<=", "crosses above", "crosses below", "crosses"]  # position is the operator code
+RULE_PATTERN = re.compile(r"^\s*(.+?)\s*(>=|<=|>|<|crosses above|crosses below|crosses)\s*(.+?)\s*%?\s*$")
+CHANGE_PATTERN = re.compile(r"\(([-+]?[\d.]+)\)%")  # percentage of a change text, ex: "-6.79 (-4.07)%"
+
+
+def field_index(name):
+    """
+    :param name: field name or alias, ex: "RSI14"
+    :return: column of the field in the value matrix, None if the name is not a field
+    """
+    name = ALIASES.get(name.strip().lower(), name.strip())
+    return FIELDS.index(name) if name in FIELDS else None
+
+
+def parse_rule(text):
+    """
+    Parse a declarative rule, ex: "RSI14 < 30", "MA5 crosses MA10", "pct change > 2%"
+    :param text: "<field> <operator> <field or number>"
+    :return: (left column, operator code, right column or None, right number)
+    """
+    match = RULE_PATTERN.match(text)
+    if match is None:
+        raise ValueError("Invalid alert rule: %r, expected <field> <operator> <field or number>" % text)
+    left, operator, right = match.groups()
+    left_column = field_index(left)
+    if left_column is None:
+        raise ValueError("Unknown field %r in alert rule %r, fields: %s" % (left, text, ", ".join(FIELDS)))
+    right_column = field_index(right)
+    if right_column is not None:
+        return left_column, OPERATORS.index(operator), right_column, np.nan
+    try:
+        return left_column, OPERATORS.index(operator), None, float(right)
+    except ValueError:
+        raise ValueError("Unknown field %r in alert rule %r, fields: %s" % (right, text, ", ".join(FIELDS)))
+
+
+def load_rules(path=ALERTS_FILE):
+    """
+    Load the alert rules from the config file
+    :param path: json file with {"rules": ["RSI < 30", ...]}
+    :return: list of rules, the default rules if the file does not exist
+    """
+    if not os.path.exists(path):
+        return list(DEFAULT_RULES)
+    with open(path) as f:
+        config = json.load(f)
+    rules = config["rules"] if isinstance(config, dict) else config
+    return list(dict.fromkeys(rule.strip() for rule in rules if rule.strip()))
+
+
+def change_percent(change):
+    """
+    :param change: change text of a quote, ex: "-6.79 (-4.07)%"
+    :return: change in percent, nan if the text has no percentage
+    """
+    match = CHANGE_PATTERN.search(str(change))
+    return float(match.group(1)) if match else np.nan
+
+
+class AlertSink:
+    """
+    Local notification sink: appends every notification as a json line, rotated like the metrics file
+    """
+
+    def __init__(self, path=ALERTS_LOG, max_bytes=ALERTS_MAX_BYTES, echo=False):
+        """
+        :param path: json lines file (empty: print only)
+        :param max_bytes: size of the file before it is rotated
+        :param echo: also print the notifications
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.echo = echo or not path
+
+    def send(self, notifications):
+        """
+        :param notifications: list of dicts
+        """
+        if self.echo:
+            for notification in notifications:
+                print("Alert %(symbol)s: %(rule)s (%(value)s)" % notification)
+        if self.path:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                metrics.rotate(self.path)
+            with open(self.path, "a") as f:
+                f.writelines(json.dumps(notification) + "\n" for notification in notifications)
+
+
+class AlertEngine:
+    """
+    Rules evaluated together over every stock: the latest values of the stocks are the rows of a matrix,
+    every rule is a column comparison, so an update costs a few array operations whatever the number of
+    stocks and rules.
+    Notifications are deduplicated: a rule notifies when it becomes true for a stock (a crossing is true for
+    one update), then not again for that stock before the cooldown.
+    """
+
+    def __init__(self, symbols, rules=None, cooldown=COOLDOWN, sink=None):
+        """
+        :param symbols: stock universe
+        :param rules: rule texts (default: load_rules())
+        :param cooldown: seconds before a rule notifies again for the same stock
+        :param sink: notification sink with a send(notifications) method, ex: AlertSink()
+                     (None: the notifications are only returned, so that only one process writes them)
+        """
+        self.symbols = list(symbols)
+        self.positions = {symbol: n for n, symbol in enumerate(self.symbols)}
+        self.rules = load_rules() if rules is None else list(rules)
+        self.cooldown = cooldown
+        self.sink = sink
+
+        parsed = [parse_rule(rule) for rule in self.rules]
+        self.left = np.array([rule[0] for rule in parsed], dtype=np.intp)
+        self.operator = np.array([rule[1] for rule in parsed], dtype=np.intp)
+        self.right_is_field = np.array([rule[2] is not None for rule in parsed])
+        self.right = np.array([rule[2] or 0 for rule in parsed], dtype=np.intp)
+        self.constant = np.array([rule[3] for rule in parsed], dtype=np.float64)
+        # Rules grouped by operator, every group is evaluated with one array comparison
+        self.crossing = np.flatnonzero(self.operator >= OPERATORS.index("crosses above"))
+        self.groups = []  # (operator, rules, positions of the rules among the crossings)
+        for code, operator in enumerate(OPERATORS):
+            columns = np.flatnonzero(self.operator == code)
+            if len(columns):
+                self.groups.append((operator, columns, np.searchsorted(self.crossing, columns)))
+
+        shape = (len(self.symbols), len(self.rules))
+        self.values = np.full((len(self.symbols), len(FIELDS)), np.nan)  # latest values of every stock
+        self.previous = self.values.copy()  # values at the previous evaluation, for the crossings
+        self.active = np.zeros(shape, dtype=bool)  # rules true at the previous evaluation
+        self.last_notified = np.full(shape, -np.inf)  # time of the last notification
+
+    def update(self, symbol, values):
+        """
+        Set the latest values of a stock
+        :param symbol: stock symbol
+        :param values: dict field: value, ex: {"price": 160.07, "RSI": 28.4}
+        """
+        row = self.values[self.positions[symbol]]
+        for name, value in values.items():
+            column = field_index(name)
+            if column is not None:
+                row[column] = value
+
+    def operands(self, values, columns=slice(None)):
+        """
+        :param values: value matrix
+        :param columns: rules to evaluate
+        :return: (left, right) matrices, one column per rule
+        """
+        right = np.where(self.right_is_field[columns], values[:, self.right[columns]], self.constant[columns])
+        return values[:, self.left[columns]], right
+
+    def evaluate(self, now=None):
+        """
+        Evaluate every rule for every stock and send the new notifications
+        :param now: time in seconds (default: time.time())
+        :return: list of notifications
+        """
+        now = time.time() if now is None else now
+        left, right = self.operands(self.values)
+        crossed_above = crossed_below = None
+        if len(self.crossing):  # crossings compare with the values of the previous evaluation
+            previous_left, previous_right = self.operands(self.previous, self.crossing)
+            with np.errstate(invalid="ignore"):
+                crossed_above = previous_left <= previous_right
+                crossed_below = previous_left >= previous_right
+
+        active = np.empty(self.active.shape, dtype=bool)
+        with np.errstate(invalid="ignore"):  # nan values (no data yet) never match
+            for operator, columns, crossing in self.groups:
+                group_left, group_right = left[:, columns], right[:, columns]
+                if operator == ">":
+                    active[:, columns] = group_left > group_right
+                elif operator == "<":
+                    active[:, columns] = group_left < group_right
+                elif operator == ">=":
+                    active[:, columns] = group_left >= group_right
+                elif operator == "<=":
+                    active[:, columns] = group_left <= group_right
+                else:
+                    above = crossed_above[:, crossing] & (group_left > group_right)
+                    below = crossed_below[:, crossing] & (group_left < group_right)
+                    active[:, columns] = (above if operator == "crosses above" else
+                                          below if operator == "crosses below" else above | below)
+
+        notify = active & ~self.active & (now - self.last_notified >= self.cooldown)
+        self.active = active
+        self.previous[:] = self.values
+        if not notify.any():
+            return []
+
+        self.last_notified[notify] = now
+        rows, columns = np.nonzero(notify)
+        notifications = [{"time": now, "symbol": self.symbols[row], "rule": self.rules[column],
+                          "value": float(left[row, column])} for row, column in zip(rows, columns)]
+        for notification in notifications:
+            metrics.inc("alerts_total", symbol=notification["symbol"], rule=notification["rule"])
+        if self.sink is not None:
+            self.sink.send(notifications)
+        return notifications
+
+
+def bar_values(cache, latest=None, freq=TIMEFRAME):
+    """
+    Values of the rule fields for one stock
+    :param cache: BarCache of the stock
+    :param latest: (latest price, latest change, volume) of the stock
+    :param freq: timeframe of the indicators
+    :return: dict field: value
+    """
+    engine = cache.engines[freq]
+    values = {}
+    if engine.bars:
+        values = dict(zip(engine.columns, engine.bar_values(len(engine.bars) - 1)))  # newest bar, even unfinished
+    if latest is not None:
+        values["price"] = float(latest[0])
+        values["change"] = change_percent(latest[1])
+    return values
+
+
+if __name__ == "__main__":
+    # Usage: python alerts.py --symbols 500 --rules 30   time the evaluation of random updates
+    parser = argparse.ArgumentParser(description="Time the alert rule engine on random data")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--rules", type=int, default=30)
+    parser.add_argument("--updates", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rules = [DEFAULT_RULES[n % len(DEFAULT_RULES)].replace("30", str(30 - n // len(DEFAULT_RULES)))
+             for n in range(args.rules)]
+    engine = AlertEngine(["S%d" % n for n in range(args.symbols)], rules)
+    engine.values[:] = rng.normal(50, 20, engine.values.shape)
+    start = time.perf_counter()
+    sent = 0
+    for update in range(args.updates):
+        engine.values[rng.integers(0, args.symbols, 10)] += rng.normal(0, 5, (10, len(FIELDS)))
+        sent += len(engine.evaluate(now=update))
+    elapsed = (time.perf_counter() - start) / args.updates
+    print("%d symbols x %d rules: %.3f ms per update, %d notifications" % (args.symbols, len(rules), elapsed * 1000,
+                                                                          sent))
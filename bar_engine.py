@@ -0,0 +1,483 @@
+import bisect
+import math
+
+import numpy as np
+import pandas as pd
+
+NAN = float("nan")
+TIMEFRAMES = ("1s", "1Min", "5Min", "1h")  # timeframes kept by the bar cache
+SPARSE_TIMEFRAMES = ("1s",)  # timeframes shorter than the tick interval, empty bars are skipped
+KEEP_TICKS = 3600  # seconds of market time before the newest tick in which the bars keep every tick for late ticks
+SAVED_STATES = 256  # indicator states of the newest bars kept when an engine is pickled, older ones are recomputed
+
+
+class RollingMean:
+    """
+    Rolling mean state, updated the same way as pandas rolling(window).mean()
+    (running sum with Kahan compensation), so results are identical to the pandas path.
+    """
+
+    def __init__(self, window):
+        """
+        :param window: window size, also used as minimum number of observations
+        """
+        self.window = window
+        # sum_x, compensation_add, compensation_remove, nobs, neg_ct, num_consecutive_same_value, prev_value
+        self.initial = (0.0, 0.0, 0.0, 0, 0, 0, NAN)
+
+    @staticmethod
+    def add(state, val):
+        """
+        Add a value to the window
+        :param state: state tuple
+        :param val: value entering the window
+        :return: new state tuple
+        """
+        if val != val:  # nan values are not counted
+            return state
+        sum_x, comp_add, comp_remove, nobs, neg_ct, same_ct, prev = state
+        y = val - comp_add
+        t = sum_x + y
+        comp_add = t - sum_x - y
+        same_ct = same_ct + 1 if val == prev else 1
+        return t, comp_add, comp_remove, nobs + 1, neg_ct + (math.copysign(1, val) < 0), same_ct, val
+
+    @staticmethod
+    def remove(state, val):
+        """
+        Remove a value from the window
+        :param state: state tuple
+        :param val: value leaving the window
+        :return: new state tuple
+        """
+        if val != val:
+            return state
+        sum_x, comp_add, comp_remove, nobs, neg_ct, same_ct, prev = state
+        y = -val - comp_remove
+        t = sum_x + y
+        comp_remove = t - sum_x - y
+        return t, comp_add, comp_remove, nobs - 1, neg_ct - (math.copysign(1, val) < 0), same_ct, prev
+
+    def mean(self, state):
+        """
+        Current mean of the window
+        :param state: state tuple
+        :return: mean or nan if the window is not full
+        """
+        sum_x, comp_add, comp_remove, nobs, neg_ct, same_ct, prev = state
+        if nobs < self.window or nobs == 0:
+            return NAN
+        result = sum_x / nobs
+        if same_ct >= nobs:
+            result = prev
+        elif neg_ct == 0 and result < 0:
+            result = 0.0
+        elif neg_ct == nobs and result > 0:
+            result = 0.0
+        return result
+
+
+class ExponentialMean:
+    """
+    Exponentially weighted mean state, updated the same way as pandas ewm(com=..., min_periods=...).mean()
+    """
+
+    def __init__(self, com, min_periods):
+        """
+        :param com: center of mass
+        :param min_periods: minimum number of observations
+        """
+        self.old_wt_factor = 1. - 1. / (1. + com)
+        self.min_periods = min_periods
+        # weighted average, old weight, number of observations
+        self.initial = (NAN, 1., 0)
+
+    def add(self, state, val):
+        """
+        Add an observation
+        :param state: state tuple
+        :param val: new value
+        :return: new state tuple
+        """
+        weighted, old_wt, nobs = state
+        if nobs == 0:
+            return val, 1., 1
+        old_wt *= self.old_wt_factor
+        if weighted != val:  # avoid numerical errors on constant series
+            weighted = old_wt * weighted + val
+            weighted /= (old_wt + 1.)
+        return weighted, old_wt + 1., nobs + 1
+
+    def mean(self, state):
+        """
+        Current mean
+        :param state: state tuple
+        :return: mean or nan if there are not enough observations
+        """
+        weighted, old_wt, nobs = state
+        return weighted if nobs >= self.min_periods else NAN
+
+
+def kahan_add(sum_x, compensation, val):
+    """
+    Add a value to a Kahan sum, same steps as the pandas resample().mean() aggregation
+    :param sum_x: running sum
+    :param compensation: running compensation
+    :param val: value to add
+    :return: (sum, compensation)
+    """
+    y = val - compensation
+    t = sum_x + y
+    return t, t - sum_x - y
+
+
+def compute_rsi_value(up, down):
+    """
+    Rsi from the average gain and loss, same as dashboard.compute_rsi
+    :param up: average gain
+    :param down: average loss (negative)
+    :return: rsi value
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = abs(np.float64(up) / np.float64(down))
+        return float(100 - 100 / (1 + rs))
+
+
+class BarEngine:
+    """
+    Streaming OHLC bar and indicator engine (SMA 5/10/20, RSI 14).
+    Ticks update the current bar and only the indicators of the changed bars are recomputed,
+    so a tick costs O(1) instead of recomputing the whole session.
+    The output is identical to dashboard.prepare_data_ohlc, which stays the reference implementation.
+    """
+
+    def __init__(self, freq="1Min", ma_windows=(5, 10, 20), rsi_window=14, skip_gaps=False):
+        """
+        :param freq: bar timeframe
+        :param ma_windows: moving average windows, in bars
+        :param rsi_window: rsi time window, in bars
+        :param skip_gaps: only keep bars with ticks (False: empty bars break the indicators like resample does)
+        """
+        self.freq = pd.Timedelta(freq).value  # bar length in ns
+        self.skip_gaps = skip_gaps
+        self.ma_windows = ma_windows
+        self.rolling = [RollingMean(w) for w in ma_windows]
+        self.ewm = ExponentialMean(rsi_window - 1, rsi_window)
+        self.columns = (["open", "high", "low", "close", "time"] + ["MA" + str(w) for w in ma_windows] +
+                        ["RSI", "volume_diff"])  # names of the row values
+
+        self.base = None  # start time of the first bar in ns
+        self.starts = []  # start time of every bar in ns, only used when empty bars are skipped
+        self.ticks = []  # ticks of every bar: list of (time, sequence, price, volume), empty list for a gap,
+        # (first tick, last tick) for the bars older than KEEP_TICKS
+        self.evicted = 0  # bars before this index keep only their first and last tick (see evict)
+        self.newest = None  # time of the newest tick in ns
+        self.bars = []  # per bar: (open, high, low, close, volume mean, volume sum, compensation, number of volumes)
+        self.states = []  # indicator state after every bar, None for the old bars of a restored checkpoint
+        self.rows = []  # prepared row of every bar, None if the bar is dropped from the output
+        self.sequence = 0  # arrival counter, keeps the file order for ticks with the same time stamp
+        self.changed = 0  # first row changed since the last take_changes()
+        self._frame = None  # cached output dataframe
+
+    def __getstate__(self):
+        """
+        Pickled state (dashboard checkpoint): the indicator states are most of the size, only the states of the
+        newest bars are kept, the first late tick before them recomputes the indicators from the first bar
+        :return: dict of the attributes
+        """
+        state = self.__dict__.copy()
+        dropped = len(self.states) - SAVED_STATES
+        if dropped > 0:
+            state["states"] = [None] * dropped + self.states[dropped:]
+        state["_frame"] = None  # built again from the rows
+        state["changed"] = 0  # every row is new to the process restoring it
+        return state
+
+    def take_changes(self):
+        """
+        Rows changed since the last call, ex: the rows the compute worker publishes again
+        :return: index of the first changed row, len(rows) if none changed
+        """
+        changed, self.changed = self.changed, len(self.rows)
+        return min(changed, len(self.rows))
+
+    def update(self, time, price, volume):
+        """
+        Add one tick
+        :param time: tick time (Timestamp, datetime64 or ns integer)
+        :param price: price
+        :param volume: volume
+        """
+        if not isinstance(time, (int, np.integer)):
+            time = pd.Timestamp(time).value
+        time = int(time)
+        start = time - time % self.freq  # start time of the bar ("1Min" floor)
+
+        if self.newest is None or time > self.newest:
+            self.newest = time
+            self.evict()
+
+        if self.skip_gaps:
+            index = bisect.bisect_left(self.starts, start)
+            if index == len(self.starts) or self.starts[index] != start:  # first tick of this bar
+                self.starts.insert(index, start)
+                self.ticks.insert(index, [])
+                self.bars.insert(index, None)
+                if index < self.evicted:
+                    self.evicted += 1
+            self.correct(index, time, price, volume)
+            return
+
+        if self.base is None:
+            self.base = start
+        if start < self.base:  # tick before the first bar, shift every bar
+            shift = (self.base - start) // self.freq
+            self.ticks[0:0] = [[] for _ in range(shift)]
+            self.bars[0:0] = [None] * shift
+            self.states.clear()
+            self.rows.clear()
+            self.base = start
+            self.evicted += shift
+
+        index = (start - self.base) // self.freq
+        if index >= len(self.ticks):  # new bar, fill the gap with empty bars
+            self.ticks.extend([] for _ in range(index + 1 - len(self.ticks)))
+            self.bars.extend([None] * (index + 1 - len(self.bars)))
+
+        self.correct(index, time, price, volume)
+
+    def correct(self, index, time, price, volume):
+        """
+        Add a tick to a bar and update the prepared rows it changes.
+        The indicators only depend on the closes: a tick that leaves the close of an existing bar unchanged
+        (ex: a late tick inside the bar) only changes the row of its bar and the volume difference of the next
+        bar, the later bars are not recomputed.
+        :param index: bar index
+        :param time: tick time in ns
+        :param price: price
+        :param volume: volume
+        """
+        bar = self.bars[index]
+        self.add_tick(index, time, price, volume)
+        if (bar is not None and index < len(self.states) and self.states[index] is not None
+                and self.bars[index][3] == bar[3]):
+            for n in range(index, min(index + 2, len(self.rows))):
+                self.rows[n] = self.make_row(n)
+            self.changed = min(self.changed, index)
+            self._frame = None
+        else:
+            self.recompute(min(index, len(self.states)))
+
+    def update_frame(self, df, symbol):
+        """
+        Add the ticks of a symbol frame (as returned by CsvTickSnapshot.symbol_frame)
+        :param df: dataframe indexed by time with the columns [symbol, "change", "volume"]
+        :param symbol: short stock name symbol, price column name
+        """
+        # Python numbers: faster scalar arithmetic than numpy scalars and a compact checkpoint (see dashboard.py)
+        for time, price, volume in zip(df.index.asi8.tolist(), df[symbol].to_numpy(float).tolist(),
+                                       df["volume"].to_numpy(float).tolist()):
+            self.update(time, price, volume)
+
+    def add_tick(self, index, time, price, volume):
+        """
+        Add a tick to a bar. An in order tick extends the bar, a late tick aggregates the bar again,
+        so long bars (ex: "1h") do not rescan their ticks on every update.
+        :param index: bar index
+        :param time: tick time in ns
+        :param price: price
+        :param volume: volume
+        """
+        ticks = self.ticks[index]
+        tick = (time, self.sequence, price, volume)
+        self.sequence += 1
+        bar = self.bars[index]
+        if isinstance(ticks, tuple):  # old bar without its ticks, the first and last tick give the open and close
+            first, last = min(ticks[0], tick), max(ticks[1], tick)
+            self.ticks[index] = (first, last)
+            _, high, low, _, mean, sum_x, compensation, count = bar
+            if volume == volume:  # added in arrival order, not time order: may differ from pandas in the last bits
+                sum_x, compensation = kahan_add(sum_x, compensation, volume)
+                count += 1
+                mean = sum_x / count
+            self.bars[index] = (first[2], max(high, price), min(low, price), last[2], mean, sum_x, compensation, count)
+            return
+        ticks.append(tick)
+        if bar is None or time < ticks[-2][0]:
+            self.bars[index] = self.aggregate(ticks)
+            return
+        open_price, high, low, _, mean, sum_x, compensation, count = bar
+        if volume == volume:  # unknown (nan) volumes are not counted, as in the pandas mean
+            sum_x, compensation = kahan_add(sum_x, compensation, volume)
+            count += 1
+            mean = sum_x / count
+        self.bars[index] = (open_price, max(high, price), min(low, price), price, mean, sum_x, compensation, count)
+
+    def evict(self):
+        """
+        Forget the ticks of the bars older than KEEP_TICKS, only kept to aggregate a bar again when a late tick
+        arrives: an old bar keeps its first and last tick, so the memory no longer grows with every tick of the session
+        """
+        limit = self.newest - KEEP_TICKS * 1000000000
+        while self.evicted < len(self.ticks) and self.bar_start(self.evicted) + self.freq <= limit:
+            ticks = self.ticks[self.evicted]
+            if isinstance(ticks, list) and ticks:
+                self.ticks[self.evicted] = (min(ticks), max(ticks))
+            self.evicted += 1
+
+    @staticmethod
+    def aggregate(ticks):
+        """
+        Aggregate the ticks of one bar
+        :param ticks: list of (time, sequence, price, volume)
+        :return: (open, high, low, close, volume mean, volume sum, compensation, number of known volumes)
+        """
+        if len(ticks) > 1 and ticks[-1][0] < ticks[-2][0]:  # out of order, sort by time but keep file order
+            ticks.sort()
+        prices = [tick[2] for tick in ticks]
+        volumes = [tick[3] for tick in ticks if tick[3] == tick[3]]  # unknown (nan) volumes are not counted
+        sum_x, compensation = 0.0, 0.0
+        for volume in volumes:
+            sum_x, compensation = kahan_add(sum_x, compensation, volume)
+        mean = sum_x / len(volumes) if volumes else NAN
+        return prices[0], max(prices), min(prices), prices[-1], mean, sum_x, compensation, len(volumes)
+
+    def recompute(self, start):
+        """
+        Recompute the indicators from a bar to the last bar
+        :param start: index of the first changed bar
+        """
+        while start and self.states[start - 1] is None:  # state dropped from a checkpoint, see __getstate__
+            start -= 1
+        del self.states[start:]
+        del self.rows[start:]
+        self.changed = min(self.changed, start)
+        self._frame = None
+
+        for index in range(start, len(self.bars)):
+            if index:
+                rolling_states, ewm_up, ewm_down = self.states[index - 1]
+                previous = self.bars[index - 1]
+            else:
+                rolling_states = [r.initial for r in self.rolling]
+                ewm_up = ewm_down = self.ewm.initial
+                previous = None
+
+            bar = self.bars[index]
+            close = bar[3] if bar else NAN
+
+            # Moving averages
+            new_states = []
+            for rolling, state in zip(self.rolling, rolling_states):
+                if index >= rolling.window:
+                    leaving = self.bars[index - rolling.window]
+                    state = rolling.remove(state, leaving[3] if leaving else NAN)
+                new_states.append(rolling.add(state, close))
+
+            # Rsi, only bars with a close change are observed
+            if bar and previous:
+                diff = close - previous[3]
+                ewm_up = self.ewm.add(ewm_up, diff if diff > 0 else 0 * diff)
+                ewm_down = self.ewm.add(ewm_down, diff if diff < 0 else 0 * diff)
+
+            self.states.append((new_states, ewm_up, ewm_down))
+            self.rows.append(self.make_row(index))
+
+    def bar_values(self, index):
+        """
+        Bar and indicator values of a bar, also for a bar dropped from the prepared rows
+        :param index: bar index
+        :return: (open, high, low, close, time, MAs..., rsi, volume_diff) or None if the bar has no tick
+        """
+        bar = self.bars[index]
+        if not bar:
+            return None
+        previous = self.bars[index - 1] if index else None
+        rolling_states, ewm_up, ewm_down = self.states[index]
+        averages = tuple(rolling.mean(state) for rolling, state in zip(self.rolling, rolling_states))
+        rsi = compute_rsi_value(self.ewm.mean(ewm_up), self.ewm.mean(ewm_down)) if previous else NAN
+        volume_diff = bar[4] - previous[4] if previous else NAN
+        return bar[:4] + (self.bar_start(index),) + averages + (rsi, volume_diff)
+
+    def make_row(self, index):
+        """
+        Prepared row of a bar from its indicator state
+        :param index: bar index
+        :return: (open, high, low, close, time, MAs..., rsi, volume_diff) or None if the bar is dropped
+        """
+        values = self.bar_values(index)
+        if values is None:
+            return None
+
+        # Incomplete indicators and negative volume differences drop the bar, as does a missing volume difference
+        # of the first bar after a gap. A bar with an unknown volume (see ingest.TickIngest) keeps its candle.
+        if (any(math.isnan(v) for v in values[:4] + values[5:-1]) or values[-1] < 0
+                or math.isnan(values[-1]) and not (index and self.bars[index - 1])):
+            return None
+        return values
+
+    def bar_start(self, index):
+        """
+        :param index: bar index
+        :return: start time of the bar in ns
+        """
+        return self.starts[index] if self.skip_gaps else self.base + index * self.freq
+
+    def to_frame(self):
+        """
+        Prepared data in the same layout as dashboard.prepare_data_ohlc
+        :return: dataframe
+        """
+        if self._frame is None:
+            data = pd.DataFrame([row for row in self.rows if row is not None], columns=self.columns)
+            data["time"] = pd.to_datetime(data["time"])
+            self._frame = data
+        return self._frame
+
+
+class BarCache:
+    """
+    Bars of one stock in several timeframes (1s, 1m, 5m, 1h), kept in step as ticks arrive.
+    Switching the timeframe of a chart reads the cached bars instead of rescanning the raw ticks.
+    """
+
+    def __init__(self, timeframes=TIMEFRAMES, **kwargs):
+        """
+        :param timeframes: bar timeframes
+        :param kwargs: indicator settings passed to every BarEngine
+        """
+        self.engines = {freq: BarEngine(freq, skip_gaps=freq in SPARSE_TIMEFRAMES, **kwargs) for freq in timeframes}
+
+    def update(self, time, price, volume):
+        """
+        Add one tick to every timeframe
+        :param time: tick time
+        :param price: price
+        :param volume: volume
+        """
+        for engine in self.engines.values():
+            engine.update(time, price, volume)
+
+    def update_frame(self, df, symbol):
+        """
+        Add the ticks of a symbol frame to every timeframe
+        :param df: dataframe indexed by time with the columns [symbol, "change", "volume"]
+        :param symbol: short stock name symbol, price column name
+        """
+        for engine in self.engines.values():
+            engine.update_frame(df, symbol)
+
+    @property
+    def version(self):
+        """
+        :return: number of ticks added, changes whenever the bars of any timeframe change
+        """
+        return next(iter(self.engines.values())).sequence
+
+    def to_frame(self, freq="1Min"):
+        """
+        Prepared data of one timeframe
+        :param freq: timeframe
+        :return: dataframe in the same layout as dashboard.prepare_data_ohlc
+        """
+        return self.engines[freq].to_frame()
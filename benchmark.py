@@ -0,0 +1,204 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")  # headless frames, set before the dashboard creates its figure
+
+import numpy as np
+import pandas as pd
+
+STOCKS = ["AAPL", "MSFT", "NFLX", "PYPL", "FB", "TWTR", "AMZN"]
+START_PRICES = [166.15, 383.44, 105.33, 291.55, 33.275, 205.04, 3035.26]
+
+
+def symbol_names(count):
+    """
+    Names of the synthetic stocks, the dashboard stocks first
+    :param count: number of stocks
+    :return: list of symbols
+    """
+    return (STOCKS + ["SYM%03d" % n for n in range(len(STOCKS), count)])[:count]
+
+
+def generate_session(filename, rows=1560, symbols=7, seed=0, start="2022-02-23 09:30:18", step=13):
+    """
+    Write a synthetic session in the wide csv layout of the scrapers
+    (index, time, then price, change and volume of every stock).
+    Modeled on stock_data.csv: about one sweep every 13 s, a few rows out of order,
+    and volumes that often repeat a stale value.
+    :param filename: csv file to write
+    :param rows: number of sweeps
+    :param symbols: number of stocks
+    :param seed: random seed, the same seed writes the same file
+    :param start: time of the first sweep
+    :param step: mean seconds between two sweeps
+    :return: list of the symbols
+    """
+    rng = random.Random(seed)
+    names = symbol_names(symbols)
+    prices = [START_PRICES[n] if n < len(START_PRICES) else rng.uniform(10, 500) for n in range(symbols)]
+    closes = list(prices)  # previous close, reference of the changes
+    volumes = [rng.randint(10000, 100000) for _ in range(symbols)]
+    time_stamp = pd.Timestamp(start)
+
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        for _ in range(rows):
+            time_stamp += pd.Timedelta(seconds=rng.randint(step - 3, step + 3))
+            row_time = time_stamp
+            if rng.random() < 0.01:  # late sweep, written after a newer one
+                row_time -= pd.Timedelta(seconds=rng.randint(step, step + 12))
+
+            row = [0, row_time.strftime("%Y-%m-%d %H:%M:%S")]
+            stale = rng.random() < 0.5  # most stocks repeat the volume of the first one
+            for n in range(symbols):
+                prices[n] = round(prices[n] * (1 + rng.gauss(0, 0.0008)), 2)
+                change = round(prices[n] - closes[n], 2)
+                pct = round(change / closes[n] * 100, 2)
+                volumes[n] += rng.randint(0, 50000)
+                volume = volumes[0] if stale and n else volumes[n]
+                row.extend([prices[n], f"{change:+} ({pct:+})%", f"{volume:,}"])
+            writer.writerow(row)
+    return names
+
+
+def time_it(function, repeat):
+    """
+    Time a function
+    :param function: function without arguments
+    :param repeat: number of runs
+    :return: dict with the timings in ms
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"runs": repeat, "mean_ms": sum(timings) / repeat, "median_ms": timings[repeat // 2],
+            "min_ms": timings[0], "max_ms": timings[-1]}
+
+
+def run_benchmarks(filename, names, repeat=5, fixtures="fixtures"):
+    """
+    Time the pipeline stages on a session file
+    :param filename: csv session file
+    :param names: symbols of the session
+    :param repeat: number of runs of every benchmark
+    :param fixtures: folder with saved quote pages for the html extraction
+    :return: dict with the results of every benchmark
+    """
+    import dashboard
+    import get_data_bs4
+    from alerts import DEFAULT_RULES, AlertEngine
+    from bar_engine import BarCache, BarEngine
+    from downsample import lttb
+    from ingest import TickIngest
+    from tick_snapshot import open_snapshot
+
+    results = {}
+    symbol = names[0]
+
+    # Data preparation
+    results["read_data_ohlc"] = time_it(lambda: dashboard.read_data_ohlc(filename, symbol, [1, 2, 3, 4]), repeat)
+    data = dashboard.read_data_ohlc(filename, symbol, [1, 2, 3, 4])[0]
+    results["compute_rsi"] = time_it(lambda: dashboard.compute_rsi(data["close"], 14), repeat)
+    raw = pd.read_csv(filename, header=None, usecols=[1, 4], names=["time", "volume"], index_col="time")
+    results["string_to_number"] = time_it(lambda: dashboard.string_to_number(raw.copy(), "volume"), repeat)
+
+    snapshot = open_snapshot(filename)
+    results["snapshot_refresh"] = time_it(lambda: open_snapshot(filename).refresh(), repeat)
+    snapshot.refresh()
+    ticks = snapshot.symbol_frame(0, symbol)
+    results["bar_engine"] = time_it(lambda: BarEngine().update_frame(ticks, symbol), repeat)
+    results["bar_cache"] = time_it(lambda: BarCache().update_frame(ticks, symbol), repeat)  # every timeframe
+    frames = {name: snapshot.symbol_frame(n, name) for n, name in enumerate(names)}
+    results["ingest"] = time_it(lambda: TickIngest().push(frames), repeat)  # reorder, dedup and stale volumes
+    alert_engine = AlertEngine(symbol_names(500), DEFAULT_RULES * 5)
+    alert_engine.values[:] = np.random.default_rng(0).normal(50, 20, alert_engine.values.shape)
+    alert_engine.evaluate()  # notifications of the initial values, the timed updates only evaluate
+    results["alerts_500x30"] = time_it(alert_engine.evaluate, repeat)  # 500 stocks, 30 rules
+    close = data["close"].to_numpy()
+    results["lttb"] = time_it(lambda: lttb(np.arange(len(close)), close, 160), repeat)  # width of a small window
+
+    # Html extraction of get_data on saved pages
+    if os.path.isdir(fixtures):
+        for name, result in get_data_bs4.compare_extractors(fixtures, repeat).items():
+            for extractor in get_data_bs4.EXTRACTORS:
+                results["extract_%s_%s" % (extractor, name)] = {"runs": repeat, "mean_ms": result[extractor]["ms"]}
+
+    # Headless dashboard frames, the small windows page through the whole universe
+    if len(names) > dashboard.PANELS:
+        def reset():
+            dashboard.Stock[:] = names
+            dashboard.snapshot = open_snapshot(filename)
+            dashboard.engines = {name: BarCache() for name in names}
+            dashboard.ingest = TickIngest()
+            dashboard.alert_engine = AlertEngine(names)
+            dashboard.latest.clear()
+            dashboard.latest_times.clear()
+
+        reset()
+        figure = dashboard.create_figure()
+        live = dashboard.LiveDashboard(figure)
+        results["live_first_frame"] = time_it(live.refresh, 1)
+        results["live_full_redraw"] = time_it(lambda: live.blit.update(True), repeat)
+        results["live_blit"] = time_it(lambda: live.blit.update(False), repeat)
+        figure.canvas.mpl_disconnect(live.blit.cid)  # animate clears the axes with the live artists
+
+        reset()
+        results["animate_first_frame"] = time_it(lambda: dashboard.animate(0), 1)
+        results["animate_frame"] = time_it(lambda: (dashboard.animate(0), figure.canvas.draw()), repeat)
+
+        # Restart: the whole session read again against a restored checkpoint
+        reset()
+        results["rebuild_session"] = time_it(lambda: dashboard.read_snapshot_ohlc([]), 1)
+        checkpoint = filename + ".checkpoint"
+        results["checkpoint_save"] = time_it(lambda: dashboard.save_checkpoint(checkpoint), repeat)
+        results["checkpoint_restore"] = time_it(lambda: dashboard.load_checkpoint(checkpoint, open_snapshot(filename)),
+                                                repeat)
+        dashboard.checkpoint_file = None  # no periodic checkpoint in the other benchmarks
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline on a synthetic session")
+    parser.add_argument("--rows", type=int, default=1560, help="number of sweeps in the session")
+    parser.add_argument("--symbols", type=int, default=7, help="number of stocks in the session")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the session")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of every benchmark")
+    parser.add_argument("--output", help="json file to write the results to (default: print)")
+    parser.add_argument("--keep", help="also save the generated session to this csv file")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        session = os.path.join(directory, "stock_data.csv")
+        symbols = generate_session(session, args.rows, args.symbols, args.seed)
+        if args.keep:
+            shutil.copy(session, args.keep)
+        report = {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "config": {"rows": args.rows, "symbols": args.symbols, "seed": args.seed, "repeat": args.repeat,
+                       "size_bytes": os.path.getsize(session)},
+            "results": run_benchmarks(session, symbols, args.repeat),
+        }
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
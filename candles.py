@@ -0,0 +1,149 @@
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+
+COLOR_UP = "#18b800"
+COLOR_DOWN = "#ff3503"
+
+
+def candle_colors(up, colorup=COLOR_UP, colordown=COLOR_DOWN):
+    """
+    Color of every candle
+    :param up: boolean array, True when the price went up
+    :param colorup: color of a rising candle
+    :param colordown: color of a falling candle
+    :return: (n, 4) rgba array
+    """
+    return np.where(np.asarray(up)[:, None], to_rgba(colorup), to_rgba(colordown))
+
+
+def candle_geometry(x, _open, high, low, close, width=0.4):
+    """
+    Build the bodies and wicks of candles from arrays
+    :param x: x positions
+    :param _open: open prices
+    :param high: high prices
+    :param low: low prices
+    :param close: close prices
+    :param width: body width
+    :return: (bodies (n, 4, 2), wicks (n, 2, 2), up (n,))
+    """
+    x = np.asarray(x, dtype=float)
+    _open, close = np.asarray(_open, dtype=float), np.asarray(close, dtype=float)
+    up = close >= _open  # same rule as mplfinance candlestick_ohlc
+    lower = np.minimum(_open, close)
+    upper = np.maximum(_open, close)
+    left = x - width / 2
+    right = x + width / 2
+
+    bodies = np.empty((len(x), 4, 2))
+    bodies[:, :, 0] = np.stack([left, right, right, left], axis=1)
+    bodies[:, :, 1] = np.stack([lower, lower, upper, upper], axis=1)
+
+    wicks = np.empty((len(x), 2, 2))
+    wicks[:, :, 0] = x[:, None]
+    wicks[:, 0, 1] = low
+    wicks[:, 1, 1] = high
+    return bodies, wicks, up
+
+
+def bar_geometry(x, height, width=1.0):
+    """
+    Build vertical bars from arrays
+    :param x: x positions (bar centers)
+    :param height: bar heights
+    :param width: bar width
+    :return: (n, 4, 2) array
+    """
+    x = np.asarray(x, dtype=float)
+    height = np.asarray(height, dtype=float)
+    bars = np.zeros((len(x), 4, 2))
+    bars[:, :, 0] = np.stack([x - width / 2, x + width / 2, x + width / 2, x - width / 2], axis=1)
+    bars[:, 2:, 1] = height[:, None]
+    return bars
+
+
+class CandleRenderer:
+    """
+    Candle chart drawn as one PolyCollection (bodies) and one LineCollection (wicks).
+    The collections are created once and updated in place from numpy arrays.
+    """
+
+    def __init__(self, ax, width=0.4, colorup=COLOR_UP, colordown=COLOR_DOWN):
+        """
+        :param ax: subplot to draw on
+        :param width: body width
+        :param colorup: color of a rising candle
+        :param colordown: color of a falling candle
+        """
+        self.ax = ax
+        self.width = width
+        self.colorup = colorup
+        self.colordown = colordown
+        self.wicks = ax.add_collection(LineCollection([], linewidths=0.5, antialiaseds=True))
+        self.bodies = ax.add_collection(PolyCollection([]))
+        self.values = np.empty((0, 5))  # last drawn x, open, high, low, close
+
+    def update(self, x, _open, high, low, close):
+        """
+        Redraw the candles
+        :param x: x positions
+        :param _open: open prices
+        :param high: high prices
+        :param low: low prices
+        :param close: close prices
+        :return: True if the candles changed
+        """
+        values = np.column_stack([x, _open, high, low, close]).astype(float)
+        if values.shape == self.values.shape and np.array_equal(values, self.values):  # unchanged
+            return False
+        self.values = values
+
+        bodies, wicks, up = candle_geometry(x, _open, high, low, close, self.width)
+        colors = candle_colors(up, self.colorup, self.colordown)
+        self.bodies.set_verts(bodies)
+        self.bodies.set_facecolor(colors)
+        self.bodies.set_edgecolor(colors)
+        self.wicks.set_segments(wicks)
+        self.wicks.set_color(colors)
+        if len(values):
+            self.ax.update_datalim(np.concatenate([wicks.reshape(-1, 2), bodies.reshape(-1, 2)]))
+        return True
+
+
+class VolumeRenderer:
+    """
+    Volume bars drawn as one PolyCollection, updated in place from numpy arrays
+    """
+
+    def __init__(self, ax, width=1.0, colorup=COLOR_UP, colordown=COLOR_DOWN):
+        """
+        :param ax: subplot to draw on
+        :param width: bar width
+        :param colorup: color of a bar when the price went up
+        :param colordown: color of a bar when the price went down
+        """
+        self.ax = ax
+        self.width = width
+        self.colorup = colorup
+        self.colordown = colordown
+        self.bars = ax.add_collection(PolyCollection([], linewidths=0))
+        self.values = np.empty((0, 3))  # last drawn x, height, up
+
+    def update(self, x, height, up):
+        """
+        Redraw the bars
+        :param x: x positions
+        :param height: bar heights (nan or 0 for no bar)
+        :param up: boolean array, True when the price went up
+        :return: True if the bars changed
+        """
+        height = np.nan_to_num(np.asarray(height, dtype=float))
+        values = np.column_stack([x, height, up]).astype(float)
+        if values.shape == self.values.shape and np.array_equal(values, self.values):  # unchanged
+            return False
+        self.values = values
+
+        self.bars.set_verts(bar_geometry(x, height, self.width))
+        self.bars.set_facecolor(candle_colors(np.asarray(up, dtype=bool), self.colorup, self.colordown))
+        return True
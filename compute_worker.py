@@ -0,0 +1,296 @@
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from bar_engine import TIMEFRAMES
+
+INITIAL_BARS = 1024  # bars of every stock allocated per timeframe, the buffer of a timeframe grows with the session
+READ_RETRIES = 5  # reads retried when the worker was writing at the same time
+COLUMNS = ["open", "high", "low", "close", "time", "MA5", "MA10", "MA20", "RSI", "volume_diff"]  # time in ms
+TIME_COLUMN = COLUMNS.index("time")
+EMPTY_ROW = (np.nan,) * len(COLUMNS)  # row of a bar dropped from the output
+META_DTYPE = [("version", "<i8"), ("rows", "<i8", (len(TIMEFRAMES),)), ("price", "S24"), ("change", "S40"),
+              ("volume", "<f8")]
+
+
+class SharedBars:
+    """
+    Prepared bars of every stock and timeframe in shared memory, written by the compute process
+    and read by the render loop without copying the ticks or the bar engines between the processes.
+    A global version counter works as a sequence lock: it is odd while the worker writes, a reader copies
+    the rows it needs and retries if the version changed in between, so it only sees completed updates.
+    Row n of the buffer is row n of the bar engine (NaN for a dropped bar), so an update only writes the rows
+    from the first changed bar. Every timeframe has its own buffer, replaced by a twice larger one when a stock
+    has more bars than it holds: the header has its generation and capacity, readers attach to the new one.
+    """
+
+    def __init__(self, symbols, name=None, timeframes=TIMEFRAMES, capacity=INITIAL_BARS):
+        """
+        :param symbols: stock universe, same order in both processes
+        :param name: name of an existing buffer to attach to (None: create a new buffer)
+        :param timeframes: bar timeframes
+        :param capacity: bars of every stock allocated per timeframe at start
+        """
+        self.symbols = list(symbols)
+        self.positions = {symbol: n for n, symbol in enumerate(self.symbols)}
+        self.timeframes = list(timeframes)
+
+        meta_dtype = np.dtype(META_DTYPE)
+        header_size = 8 * (1 + 2 * len(self.timeframes))
+        size = header_size + len(self.symbols) * meta_dtype.itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+
+        # version, then generation and capacity of the bar buffer of every timeframe
+        self.header = np.ndarray((1 + 2 * len(self.timeframes),), dtype="<i8", buffer=self.shm.buf)
+        self.meta = np.ndarray((len(self.symbols),), dtype=meta_dtype, buffer=self.shm.buf, offset=header_size)
+        self.segments = [None] * len(self.timeframes)  # attached bar buffer of every timeframe
+        self.bars = [None] * len(self.timeframes)  # (stock, bar, column) view of every bar buffer
+        self.generations = [0] * len(self.timeframes)  # generation of the attached bar buffers
+        if self.owner:
+            self.header[:] = 0
+            self.meta[:] = np.zeros(len(self.symbols), dtype=meta_dtype)
+            for m in range(len(self.timeframes)):
+                self.grow(m, capacity)
+        self.frames = {}  # (symbol, freq): (symbol version, dataframe) built by the reader
+
+    @property
+    def name(self):
+        """
+        :return: name of the shared memory buffer
+        """
+        return self.shm.name
+
+    @property
+    def version(self):
+        """
+        :return: number of completed updates
+        """
+        return int(self.header[0]) // 2
+
+    def segment_name(self, m, generation):
+        """
+        :param m: timeframe position
+        :param generation: generation of the bar buffer
+        :return: name of the bar buffer
+        """
+        return "%s_%d_%d" % (self.name, m, generation)
+
+    def attach(self, m):
+        """
+        Attach to the current bar buffer of a timeframe
+        :param m: timeframe position
+        :return: (stock, bar, column) view
+        """
+        generation, capacity = int(self.header[1 + 2 * m]), int(self.header[2 + 2 * m])
+        if self.generations[m] != generation:
+            segment = shared_memory.SharedMemory(name=self.segment_name(m, generation))
+            self.detach(m)
+            self.segments[m], self.generations[m] = segment, generation
+            self.bars[m] = np.ndarray((len(self.symbols), capacity, len(COLUMNS)), dtype="<f8", buffer=segment.buf)
+        return self.bars[m]
+
+    def detach(self, m, unlink=False):
+        """
+        Detach from the bar buffer of a timeframe
+        :param m: timeframe position
+        :param unlink: also remove the buffer (replaced by the writer, or closed by the creating process)
+        """
+        if self.segments[m] is not None:
+            self.bars[m] = None
+            self.segments[m].close()
+            if unlink:
+                self.segments[m].unlink()
+            self.segments[m] = None
+
+    # --- Writer (compute process) ---
+
+    def grow(self, m, capacity):
+        """
+        Replace the bar buffer of a timeframe by a larger one, a reader still using the old one attaches again
+        :param m: timeframe position
+        :param capacity: bars of every stock
+        """
+        generation = int(self.header[1 + 2 * m]) + 1
+        segment = shared_memory.SharedMemory(name=self.segment_name(m, generation), create=True,
+                                             size=len(self.symbols) * capacity * len(COLUMNS) * 8)
+        bars = np.ndarray((len(self.symbols), capacity, len(COLUMNS)), dtype="<f8", buffer=segment.buf)
+        if self.bars[m] is not None:
+            bars[:, :self.bars[m].shape[1]] = self.bars[m]
+        self.detach(m, unlink=True)  # readers keep the old buffer mapped until they attach again
+        self.segments[m], self.bars[m], self.generations[m] = segment, bars, generation
+        self.header[1 + 2 * m], self.header[2 + 2 * m] = generation, capacity
+
+    def write(self, updates):
+        """
+        Publish the bars of the changed stocks, only the rows from the first changed bar are written
+        :param updates: dict symbol: (BarCache, (latest price, latest change, volume))
+        """
+        self.header[0] += 1  # odd: update in progress
+        for symbol, (cache, latest) in updates.items():
+            n = self.positions[symbol]
+            meta = self.meta[n]
+            for m, freq in enumerate(self.timeframes):
+                engine = cache.engines[freq]
+                start, rows = engine.take_changes(), engine.rows
+                capacity = self.attach(m).shape[1]
+                if len(rows) > capacity:
+                    self.grow(m, max(2 * capacity, len(rows)))
+                if start < len(rows):
+                    self.bars[m][n, start:len(rows)] = np.array(
+                        [row[:TIME_COLUMN] + (row[TIME_COLUMN] // 1000000,) + row[TIME_COLUMN + 1:]
+                         if row is not None else EMPTY_ROW for row in rows[start:]], dtype=np.float64)
+                meta["rows"][m] = len(rows)
+            meta["price"] = str(latest[0]).encode()
+            meta["change"] = str(latest[1]).encode()
+            meta["volume"] = latest[2]
+            meta["version"] += 1
+            self.meta[n] = meta
+        self.header[0] += 1  # even: update completed
+
+    # --- Reader (render loop) ---
+
+    def read(self, symbols, focus_freq="1Min", freq="1Min"):
+        """
+        Latest completed data of some stocks, same layout as dashboard.read_snapshot_ohlc
+        :param symbols: stocks
+        :param focus_freq: timeframe of the first stock
+        :param freq: timeframe of the other stocks
+        :return: list with (data, latest_price, latest_change, volume) for every stock
+        """
+        freqs = [focus_freq] + [freq] * (len(symbols) - 1)
+        for _ in range(READ_RETRIES):
+            start = int(self.header[0])
+            if start % 2:  # worker is writing
+                time.sleep(0.001)
+                continue
+            copied = []
+            try:
+                for symbol, frame_freq in zip(symbols, freqs):
+                    n, m = self.positions[symbol], self.timeframes.index(frame_freq)
+                    meta = self.meta[n].copy()
+                    cached = self.frames.get((symbol, frame_freq))
+                    values = None
+                    if cached is None or cached[0] != meta["version"]:  # only changed stocks are copied
+                        values = self.attach(m)[n, :meta["rows"][m]].copy()
+                    copied.append((symbol, frame_freq, meta, values))
+            except FileNotFoundError:  # bar buffer replaced and removed while attaching
+                continue
+            if int(self.header[0]) == start:  # nothing was written while copying
+                break
+        else:
+            copied = None
+
+        result = []
+        for symbol, frame_freq in zip(symbols, freqs):
+            entry = self.frames.get((symbol, frame_freq))
+            meta = None
+            if copied is not None:
+                _, _, meta, values = copied[len(result)]
+                if values is not None:
+                    values = values[~np.isnan(values[:, TIME_COLUMN])]  # dropped bars
+                    data = pd.DataFrame(values, columns=COLUMNS)
+                    data["time"] = pd.to_datetime(data["time"].astype(np.int64), unit="ms")
+                    latest = (meta["price"].decode(), meta["change"].decode(), meta["volume"])
+                    entry = self.frames[(symbol, frame_freq)] = (meta["version"], data, latest)
+            if entry is None or meta is not None and meta["version"] == 0:  # no tick yet
+                result.append((pd.DataFrame(columns=COLUMNS), "...", "...", 0))
+            else:
+                result.append((entry[1],) + entry[2])
+        return result
+
+    def close(self):
+        """
+        Detach from the buffers, the creating process also removes them
+        """
+        for m in range(len(self.timeframes)):
+            if self.owner:
+                self.attach(m)  # the last buffer created by the writer
+            self.detach(m, unlink=self.owner)
+        self.header = self.meta = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def compute_loop(name, symbols, interval, stop, checkpoint=None):
+    """
+    Compute process: read the new ticks, update the bar caches and publish the changed stocks
+    :param name: name of the shared buffer
+    :param symbols: stock universe
+    :param interval: seconds between two reads of new ticks
+    :param stop: multiprocessing.Event ending the loop
+    :param checkpoint: checkpoint file restored at start and written periodically (None: always rebuild)
+    """
+    import dashboard  # no figure is created, the window stays in the render process
+    from alerts import AlertSink
+
+    shared = SharedBars(symbols, name)
+    if dashboard.alert_engine is not None:
+        dashboard.alert_engine.sink = AlertSink()  # the only process evaluating the rules of the dashboard
+    versions = {}  # symbol: (bar cache version, latest quote) of the published data
+    if checkpoint:
+        dashboard.load_checkpoint(checkpoint)
+    try:
+        while not stop.is_set():
+            dashboard.read_snapshot_ohlc([])  # new ticks into the bar caches, no dataframe is built
+            # A held tick changes the latest quote without changing the bars, both are compared
+            updates = {symbol: (dashboard.engines[symbol], dashboard.latest[symbol]) for symbol in symbols
+                       if symbol in dashboard.latest
+                       and (dashboard.engines[symbol].version, dashboard.latest[symbol]) != versions.get(symbol)}
+            if updates:
+                shared.write(updates)
+                versions.update((symbol, (cache.version, quote)) for symbol, (cache, quote) in updates.items())
+            time.sleep(interval)
+    finally:
+        if checkpoint:
+            dashboard.save_checkpoint(checkpoint)
+        shared.close()
+
+
+class ComputeWorker:
+    """
+    Process ingesting the ticks and computing the bars and indicators of every stock (see compute_loop).
+    The render loop reads the latest completed data from the shared buffer, so a slow read or computation
+    never blocks the window.
+    """
+
+    def __init__(self, symbols, interval=0.25, checkpoint=None):
+        """
+        :param symbols: stock universe
+        :param interval: seconds between two reads of new ticks
+        :param checkpoint: checkpoint file of the worker state (None: always rebuild)
+        """
+        context = multiprocessing.get_context("spawn")  # fresh process, a fork of a gui process is not safe
+        self.shared = SharedBars(symbols)
+        self.stop = context.Event()
+        self.process = context.Process(target=compute_loop, daemon=True,
+                                       args=(self.shared.name, symbols, interval, self.stop, checkpoint))
+        self.process.start()
+
+    @property
+    def version(self):
+        """
+        :return: number of updates published by the worker
+        """
+        return self.shared.version
+
+    def read(self, symbols, focus_freq="1Min", freq="1Min"):
+        """
+        :param symbols: stocks
+        :param focus_freq: timeframe of the first stock
+        :param freq: timeframe of the other stocks
+        :return: list with (data, latest_price, latest_change, volume) for every stock
+        """
+        return self.shared.read(symbols, focus_freq, freq)
+
+    def close(self):
+        """
+        Stop the worker and remove the shared buffer
+        """
+        self.stop.set()
+        self.process.join(timeout=5)
+        self.shared.close()
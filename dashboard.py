@@ -1,13 +1,20 @@
 import time
-import pandas as pd
+import pandas as pd  # not deferred: the prepared bars are dataframes and every data module below imports pandas
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.gridspec import GridSpec
-import matplotlib.ticker as ticker
-from mplfinance.original_flavor import candlestick_ohlc
 import datetime
 import math
+import os
+import pickle
+
+import metrics
+from alerts import AlertEngine, AlertSink, bar_values
+from bar_engine import TIMEFRAMES, BarCache
+from compute_worker import ComputeWorker
+from downsample import lttb
+from ingest import TickIngest
+from symbols import load_symbols
+from live_feed import FEED_PATH
+from tick_snapshot import FeedSnapshot, open_snapshot
 
 # Size visualization
 #----------------------------------------------#-------------------------#
@@ -24,23 +31,85 @@ import math
 #            ax9 Line chart [5, 0:4]           # ax7 Line chart [5, 4:6] #
 #----------------------------------------------#-------------------------#
 
-# Configure window size
-fig = plt.figure(figsize=(8, 6), dpi=100)  # Set figure size figsize=(W, H)
-fig.patch.set_facecolor("#121416")  # Set face color to bluish black
-gs = fig.add_gridspec(6, 6)  # Grid will be 6x6
-ax1 = fig.add_subplot(gs[0:4, 0:4])  # Set ax1 HxW
-ax2 = fig.add_subplot(gs[0, 4:6])
-ax3 = fig.add_subplot(gs[1, 4:6])
-ax4 = fig.add_subplot(gs[2, 4:6])
-ax5 = fig.add_subplot(gs[3, 4:6])
-ax6 = fig.add_subplot(gs[4, 4:6])
-ax7 = fig.add_subplot(gs[5, 4:6])
-ax8 = fig.add_subplot(gs[4, 0:4])
-ax9 = fig.add_subplot(gs[5, 0:4])
+# Subplots of the window, created by create_figure() (importing pyplot and building the figure is slow, modules
+# only reading the data like the compute process or the web dashboard never do it)
+fig = None
+ax1 = ax2 = ax3 = ax4 = ax5 = ax6 = ax7 = ax8 = ax9 = None
 
 # Constant
-Stock = ["AAPL", "MSFT", "NFLX", "PYPL", "FB", "TWTR", "AMZN"]
+Stock = load_symbols()  # stock universe, see symbols.json. The first stock is in focus
 FILE_NAME = "stock_data.csv"
+STORE_NAME = "stock_data.ticks"  # binary tick store written by the scrapers, used instead of the csv if it exists
+STORE_DIR = "stock_data"  # partitioned tick store written by the scrapers, used first if it exists
+HISTORY_WINDOW = pd.Timedelta(days=1)  # history loaded from the partitioned store at start up
+BLIT = True  # update the artists in place and only redraw them when new ticks arrived
+REFRESH_INTERVAL = 250  # ms between two checks for new ticks
+USE_FEED = True  # take the ticks pushed by the collectors over the live feed socket when a collector runs
+PANELS = 6  # number of small windows (ax2 to ax7)
+ROTATE_INTERVAL = 10  # seconds before the small windows show the next stocks of the universe
+TIMEFRAME = "1Min"  # bar timeframe of the focus chart, press 1 to 4 to switch between the TIMEFRAMES
+TIME_FORMATS = {"1s": "%H:%M:%S", "1h": "%d %H:%M"}  # x-axis labels of the timeframes (default: "%H:%M")
+ALERTS = True  # evaluate the alert rules of alerts.json on every update, notifications appended to alerts.jsonl
+COMPUTE_PROCESS = False  # read the ticks and compute the bars in a worker process, the window only draws
+CHECKPOINT_FILE = "dashboard.checkpoint"  # bars, indicators and read position saved to restart without a full rebuild
+CHECKPOINT_INTERVAL = 60  # seconds between two checkpoints
+CHECKPOINT_VERSION = 3  # changed whenever the saved state changes, older checkpoints are ignored
+
+
+def create_figure():
+    """
+    Create the dashboard window with the subplots ax1 to ax9 (only once)
+    :return: figure
+    """
+    global fig, ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8, ax9
+    if fig is None:
+        import matplotlib.pyplot as plt
+
+        # Configure window size
+        fig = plt.figure(figsize=(8, 6), dpi=100)  # Set figure size figsize=(W, H)
+        fig.patch.set_facecolor("#121416")  # Set face color to bluish black
+        gs = fig.add_gridspec(6, 6)  # Grid will be 6x6
+        ax1 = fig.add_subplot(gs[0:4, 0:4])  # Set ax1 HxW
+        ax2 = fig.add_subplot(gs[0, 4:6])
+        ax3 = fig.add_subplot(gs[1, 4:6])
+        ax4 = fig.add_subplot(gs[2, 4:6])
+        ax5 = fig.add_subplot(gs[3, 4:6])
+        ax6 = fig.add_subplot(gs[4, 4:6])
+        ax7 = fig.add_subplot(gs[5, 4:6])
+        ax8 = fig.add_subplot(gs[4, 0:4])
+        ax9 = fig.add_subplot(gs[5, 0:4])
+    return fig
+
+
+def open_dashboard_snapshot():
+    """
+    Open the tick source of the dashboard: the live feed pushed by a running collector,
+    else the partitioned tick store, the tick store or the csv file
+    :return: snapshot
+    """
+    store = next((name for name in [STORE_DIR, STORE_NAME] if os.path.exists(name)), None)
+    if USE_FEED and os.path.exists(FEED_PATH):
+        try:
+            return FeedSnapshot(FEED_PATH, store, HISTORY_WINDOW, keep=False)
+        except OSError as e:  # socket left by a stopped collector
+            print("Live feed not available: " + repr(e))
+    return open_snapshot(store or FILE_NAME, HISTORY_WINDOW, keep=False)  # only the new ticks go to the ingest
+
+
+# Shared tick snapshot, tailed from the last read offset (or fed by the live feed) every frame.
+# Opened by the first read, so render workers importing this module do not load the ticks.
+snapshot = None
+engines = {symbol: BarCache() for symbol in Stock}  # streaming bars and indicators of every stock and timeframe
+latest = {}  # symbol: (latest price, latest change, volume), updated only when new ticks arrived
+latest_times = {}  # symbol: time of the latest tick
+ingest = TickIngest()  # reorder window, duplicate and stale volume detection in front of the bar caches
+# Rules evaluated over every stock at once. Notifications are only written by the process running the dashboard
+# (see start_dashboard and compute_worker), render and web processes evaluate the rules without writing them
+alert_engine = AlertEngine(Stock) if ALERTS else None
+timeframe = TIMEFRAME  # timeframe of the focus chart, switched with the keys 1 to 4
+compute = None  # ComputeWorker publishing the bars in shared memory, started by start_dashboard(compute_process=True)
+checkpoint_file = None  # checkpoint written every CHECKPOINT_INTERVAL, set by load_checkpoint
+checkpoint_time = 0  # time of the last checkpoint
 
 
 def figure_design(ax):
@@ -68,10 +137,10 @@ def subplot_plot(ax, symbol, data, latest_price, latest_changes):
     """
     # Clear previous values
     ax.clear()
-    # Plot graph
+    # Plot graph, downsampled to the width of the window
     # x-axis: list(range(1, len(data["close"]) + 1))
     # y-axis: data["close"]
-    ax.plot(list(range(1, len(data["close"]) + 1)), data["close"], color="white", linewidth=2)
+    ax.plot(*sparkline(ax, data["close"]), color="white", linewidth=2)
 
     # Calculate data to plot
     ymin = data["close"].min()
@@ -106,6 +175,34 @@ def subplot_plot(ax, symbol, data, latest_price, latest_changes):
     ax.axes.yaxis.set_visible(False)  # y-axis visibility
 
 
+def sparkline(ax, close):
+    """
+    Points of a small window line, at most one point per pixel of the window
+    :param ax: location
+    :param close: close prices
+    :return: (x, y) arrays, x starts at 1
+    """
+    return lttb(np.arange(1, len(close) + 1), close, max(int(ax.bbox.width), 3))
+
+
+def time_format(freq):
+    """
+    :param freq: bar timeframe
+    :return: strftime format of the x-axis labels
+    """
+    return TIME_FORMATS.get(freq, "%H:%M")
+
+
+def on_key(event):
+    """
+    Switch the timeframe of the focus chart with the keys 1 to 4, the bars of every timeframe are kept up to date
+    :param event: key press event
+    """
+    global timeframe
+    if event.key and event.key.isdigit() and 1 <= int(event.key) <= len(TIMEFRAMES):
+        timeframe = TIMEFRAMES[int(event.key) - 1]
+
+
 def string_to_number(df, column):
     """
     Convert string into float
@@ -158,11 +255,22 @@ def read_data_ohlc(filename, symbol, use_cols):
     :param use_cols: input column
     :return:
     """
-    # read file and convert it to a dataframe
-    df = pd.read_csv(filename, header=None, usecols=use_cols,
-                     names=["time", symbol, "change", "volume"],
-                     index_col="time", parse_dates=["time"])
+    with metrics.timer("read_data_ohlc_seconds", symbol=symbol):
+        # read file and convert it to a dataframe
+        df = pd.read_csv(filename, header=None, usecols=use_cols,
+                         names=["time", symbol, "change", "volume"],
+                         index_col="time", parse_dates=["time"])
 
+        return prepare_data_ohlc(df, symbol)
+
+
+def prepare_data_ohlc(df, symbol):
+    """
+    Prepare the ticks of one stock into processable values.
+    :param df: dataframe indexed by time with the columns [symbol, "change", "volume"]
+    :param symbol: short stock name symbol
+    :return:
+    """
     # Check if the dataframe has any null value and return the column that contain the null column
     index_with_nan = df.index[df.isnull().any(axis=1)]
     # Drop index with the null value
@@ -206,6 +314,153 @@ def read_data_ohlc(filename, symbol, use_cols):
     return data, latest_price, latest_change, df["volume"][-1]
 
 
+def shown_symbols(now=None):
+    """
+    Stocks shown by the dashboard: the stock in focus, then the stocks of the small windows.
+    The small windows page through the universe, the next page is shown every ROTATE_INTERVAL seconds.
+    :param now: current time in seconds (default: time.time())
+    :return: list of symbols
+    """
+    others = Stock[1:]
+    if len(others) <= PANELS:
+        return Stock[:PANELS + 1]
+    pages = math.ceil(len(others) / PANELS)
+    page = int((time.time() if now is None else now) // ROTATE_INTERVAL) % pages
+    return [Stock[0]] + [others[(page * PANELS + n) % len(others)] for n in range(PANELS)]
+
+
+def read_snapshot_ohlc(symbols=None, focus_freq=None, freq="1Min"):
+    """
+    Refresh the shared tick snapshot and prepare the data of the shown stocks.
+    The file is parsed once for all stocks and only the new ticks are fed into the bar caches,
+    data frames are only built for the requested stocks.
+    :param symbols: stocks to return (default: shown_symbols())
+    :param focus_freq: timeframe of the first stock (default: the selected timeframe)
+    :param freq: timeframe of the other stocks
+    :return: list with (data, latest_price, latest_change, volume) for every requested stock
+    """
+    if compute is not None:  # bars computed by the worker process, only the latest completed update is read
+        symbols = shown_symbols() if symbols is None else symbols
+        return compute.read(symbols, timeframe if focus_freq is None else focus_freq, freq)
+
+    global snapshot
+    if snapshot is None:
+        snapshot = open_dashboard_snapshot()
+    with metrics.timer("snapshot_refresh_seconds"):
+        new_rows = snapshot.refresh()  # read only the rows appended since the last frame
+
+    positions = {symbol: n for n, symbol in enumerate(Stock)}
+    frames = {}
+    for symbol in snapshot.symbols_in(new_rows, Stock):  # only the stocks with new ticks
+        df = snapshot.symbol_frame(positions[symbol], symbol, new_rows)
+        if not len(df):  # no complete tick for this stock
+            continue
+        frames[symbol] = df
+        metrics.set_gauge("last_tick_timestamp", time.time(), symbol=symbol)  # staleness of the shown data
+
+        # Get information in the newest row (the latest information), rows may arrive out of order
+        newest = df.index.max()
+        if newest >= latest_times.get(symbol, newest):
+            latest_info = df[df.index == newest].iloc[-1, :]  # grab last row of the newest time
+            latest[symbol] = (str(latest_info.iloc[0]), str(latest_info.iloc[1]), latest_info.iloc[2])
+            latest_times[symbol] = newest
+            metrics.set_gauge("tick_time", newest.timestamp(), symbol=symbol)  # market time of the latest tick
+
+    # Reordered, deduplicated ticks into the bar caches, held ticks are released on later frames
+    released = ingest.push(frames)
+    for symbol, df in released.items():
+        with metrics.timer("bar_engine_seconds", symbol=symbol):
+            engines[symbol].update_frame(df, symbol)
+    metrics.set_gauge("ingest_held_ticks", ingest.held)
+
+    # Alert rules on the latest values of the changed stocks
+    changed = set(frames) | set(released)
+    if alert_engine is not None and changed:
+        with metrics.timer("alerts_seconds"):
+            for symbol in changed:
+                alert_engine.update(symbol, bar_values(engines[symbol], latest.get(symbol)))
+            alert_engine.evaluate()
+
+    if checkpoint_file is not None and time.time() - checkpoint_time >= CHECKPOINT_INTERVAL:
+        save_checkpoint(checkpoint_file)
+
+    symbols = shown_symbols() if symbols is None else symbols
+    freqs = [timeframe if focus_freq is None else focus_freq] + [freq] * (len(symbols) - 1)
+    return [(engines[symbol].to_frame(freq),) + latest.get(symbol, ("...", "...", 0))
+            for symbol, freq in zip(symbols, freqs)]
+
+
+def save_checkpoint(path=CHECKPOINT_FILE):
+    """
+    Save the bars and indicators of every stock with the read position of the tick source,
+    a restarted dashboard continues from there instead of rebuilding the whole session
+    :param path: checkpoint file, replaced atomically
+    """
+    global checkpoint_time
+    if snapshot is None:
+        return
+    with metrics.timer("checkpoint_seconds", mode="save"):
+        state = {"version": CHECKPOINT_VERSION, "symbols": Stock, "timeframes": TIMEFRAMES,
+                 "position": snapshot.position(), "engines": engines, "ingest": ingest, "latest": latest,
+                 "latest_times": latest_times, "alerts": None}
+        if alert_engine is not None:
+            state["alerts"] = (alert_engine.rules, alert_engine.values, alert_engine.previous, alert_engine.active,
+                               alert_engine.last_notified)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)  # a crash while writing never leaves a truncated checkpoint
+    checkpoint_time = time.time()
+
+
+def load_checkpoint(path=CHECKPOINT_FILE, source=None):
+    """
+    Restore the state saved by save_checkpoint if it still matches the tick source, the first refresh then
+    only reads the ticks appended since. Checkpoints are written to the same file from now on.
+    :param path: checkpoint file
+    :param source: unread tick snapshot to continue (default: open_dashboard_snapshot())
+    :return: True if the checkpoint was restored (False: the session is rebuilt from the tick source)
+    """
+    global snapshot, engines, ingest, latest, latest_times, checkpoint_file, checkpoint_time
+    checkpoint_file = path
+    checkpoint_time = time.time()
+    if not os.path.exists(path):
+        return False
+    with metrics.timer("checkpoint_seconds", mode="load"):
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            print("Checkpoint ignored: " + repr(e))
+            return False
+        if (state.get("version") != CHECKPOINT_VERSION or state["symbols"] != Stock
+                or state["timeframes"] != TIMEFRAMES):  # other code version or configuration
+            return False
+        snapshot = open_dashboard_snapshot() if source is None else source
+        if not snapshot.seek(state["position"]):  # tick source replaced, truncated or of another kind, read it all
+            return False
+
+        engines, ingest = state["engines"], state["ingest"]
+        latest, latest_times = state["latest"], state["latest_times"]
+        # Held ticks wait for a wall time of the previous process, release them now
+        for symbol, df in ingest.flush().items():
+            engines[symbol].update_frame(df, symbol)
+        if alert_engine is not None and state["alerts"] is not None and state["alerts"][0] == alert_engine.rules:
+            (_, alert_engine.values, alert_engine.previous, alert_engine.active,
+             alert_engine.last_notified) = state["alerts"]
+    return True
+
+
+def data_version():
+    """
+    :return: value changing whenever new ticks arrived or held ticks were released: read offset of the snapshot with
+        the number of ticks in the bar caches, or version of the worker
+    """
+    if compute is not None:
+        return compute.version
+    return snapshot.offset, sum(cache.version for cache in engines.values())
+
+
+@metrics.timed("frame_seconds", mode="animate")
 def animate(i):
     """
     Plot the data into a live chart
@@ -217,25 +472,66 @@ def animate(i):
     # time_stamp = time_stamp.strftime("%Y-%m-%d")  # change time format
     # filename = str(time_stamp) + " stock_data.csv"  # define filename file
 
-    # --- PLOT AX1 ---
-    # Preparing data for ax1
-    data, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[0], [1, 2, 3, 4])
+    # Read the new ticks once for all stocks
+    shown = shown_symbols()
+    all_data = read_snapshot_ohlc(shown)
+
+    # Time stamp text on the right top corner of the window
+    time_stamp = datetime.datetime.now()  # set value
+    time_stamp = time_stamp.strftime("%Y-%m-%d %H:%M:%S")  # set format
+    draw_board(shown, all_data, timeframe, time_stamp)
+
 
-    # capture the range of the data
-    candle_counter = range(len(data["open"]) - 1)  # numbers of candles
+def draw_board(shown, all_data, freq=TIMEFRAME, clock=None):
+    """
+    Draw the whole dashboard (ax1 to ax9) from prepared data, used by animate and the render service
+    :param shown: stock in focus, then the stocks of the small windows
+    :param all_data: (data, latest_price, latest_change, volume) of every shown stock
+    :param freq: timeframe of the focus data
+    :param clock: time stamp text on the right top corner (None: no time stamp)
+    """
+    create_figure()  # first draw of a render process
 
-    # create empty list for adding data
-    ohlc = []  # empty list for creating a candle chart
-    for candle in candle_counter:
-        # x-axis: candle_counter[candle]
-        # open, high, low, and close: respectively from data["open"][candle] to data["close"][candle]
-        append_me = candle_counter[candle], data["open"][candle], data["high"][candle], data["low"][candle], \
-                    data["close"][candle]
-        ohlc.append(append_me)  # append values to ohlc list
+    # --- PLOT AX1, AX8, AX9 ---
+    draw_focus(ax1, ax8, ax9, shown[0], *all_data[0], freq)
+
+    # Plot time stamp
+    if clock is not None:
+        ax1.text(1.32, 1.05, clock, transform=ax1.transAxes, color="white", fontsize=10, fontweight="bold",
+                 horizontalalignment="center", verticalalignment="center")
+
+    # --- PLOT AX2 - AX7 ---
+    # Small windows of the stocks on the current page
+    for ax, symbol, (data_ax, latest_price, latest_change, _) in zip([ax2, ax3, ax4, ax5, ax6, ax7], shown[1:],
+                                                                      all_data[1:]):
+        subplot_plot(ax, symbol, data_ax, latest_price, latest_change)
+
+
+def draw_focus(ax1, ax8, ax9, symbol, data, latest_price, latest_change, volume, freq=TIMEFRAME):
+    """
+    Draw the stock in focus: candles with the MA lines, volume bars and rsi line
+    :param ax1: location of the candles
+    :param ax8: location of the volume bars
+    :param ax9: location of the rsi line
+    :param symbol: stock symbol
+    :param data: prepared data
+    :param latest_price: latest price
+    :param latest_change: latest change
+    :param volume: latest volume
+    :param freq: timeframe of the data
+    """
+    import matplotlib.ticker as ticker  # drawing modules are only imported by the processes that draw
+    from candles import CandleRenderer, VolumeRenderer
+
+    # --- PLOT AX1 ---
+    # capture the candles, the last (still open) bar is not drawn
+    closed = data.iloc[:-1]
 
     ax1.clear()  # clear previous data
 
-    candlestick_ohlc(ax1, ohlc, width=0.4, colorup="#18b800", colordown="#ff3503")  # set candle
+    # set candles, drawn from the arrays as two collections
+    CandleRenderer(ax1).update(np.arange(len(closed)), closed["open"], closed["high"], closed["low"],
+                               closed["close"])
 
     # Plot MA lines into ax1
     ax1.plot(data["MA5"], color="pink", linestyle="-", linewidth=1, label="5 min SMA")
@@ -245,14 +541,17 @@ def animate(i):
     # Plot legends box
     leg = ax1.legend(loc="upper left", facecolor="#121416", fontsize=8)
     for text in leg.get_texts():
-        plt.setp(text, color="w")
+        text.set_color("w")
+    # Timeframe of the candles in the top-right corner
+    ax1.text(0.99, 0.97, freq, transform=ax1.transAxes, color="grey", fontsize=8, fontweight="bold",
+             horizontalalignment="right", verticalalignment="top")
 
     # Setup subplot
     figure_design(ax1)
 
     # Setup text above window
     # Stock symbol
-    ax1.text(0.005, 1.05, Stock[0], transform=ax1.transAxes, color="black", fontsize=16, fontweight="bold",
+    ax1.text(0.005, 1.05, symbol, transform=ax1.transAxes, color="black", fontsize=16, fontweight="bold",
              horizontalalignment="left", verticalalignment="center", bbox=dict(facecolor="#FFBF00"))
     # Stock latest price
     ax1.text(0.35, 1.05, latest_price, transform=ax1.transAxes, color="white", fontsize=16, fontweight="bold",
@@ -267,51 +566,10 @@ def animate(i):
     ax1.text(0.75, 1.05, latest_change, transform=ax1.transAxes, color=colorcode, fontsize=16, fontweight="bold",
              horizontalalignment="center", verticalalignment="center")
 
-    # Time stamp text on the right top corner of the window
-    time_stamp = datetime.datetime.now()  # set value
-    time_stamp = time_stamp.strftime("%Y-%m-%d %H:%M:%S")  # set format
-    # Plot time stamp
-    ax1.text(1.32, 1.05, time_stamp, transform=ax1.transAxes, color="white", fontsize=10, fontweight="bold",
-             horizontalalignment="center", verticalalignment="center")
-
     # Set up graph for ax1
     ax1.grid(True, color="grey", linestyle="-", which="major", axis="both", linewidth=0.3)  # set grid
     ax1.set_xticklabels([])  # x-axis labels to empty
 
-    # --- PLOT AX2 ---
-    # Prepare data for ax2
-    data_ax2, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[1], [1, 5, 6, 7])
-    # Plot ax2
-    subplot_plot(ax2, Stock[1], data_ax2, latest_price, latest_change)
-
-    # --- PLOT AX3 ---
-    # Prepare data for ax3
-    data_ax3, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[2], [1, 8, 9, 10])
-    # Plot ax3
-    subplot_plot(ax3, Stock[2], data_ax3, latest_price, latest_change)
-
-    # --- PLOT AX4 ---
-    # Prepare data for ax4
-    data_ax4, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[3], [1, 11, 12, 13])
-    # Plot ax4
-    subplot_plot(ax4, Stock[3], data_ax4, latest_price, latest_change)
-
-    # --- PLOT AX5 ---
-    # Prepare data for ax5
-    data_ax5, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[4], [1, 14, 15, 16])
-    # Plot ax5
-    subplot_plot(ax5, Stock[4], data_ax5, latest_price, latest_change)
-
-    # --- PLOT AX6 ---
-    # Prepare data for ax6
-    data_ax6, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[5], [1, 17, 18, 19])
-    subplot_plot(ax6, Stock[5], data_ax6, latest_price, latest_change)
-
-    # --- PLOT AX7 ---
-    # Prepare data for ax7
-    data_ax7, latest_price, latest_change, volume = read_data_ohlc(FILE_NAME, Stock[6], [1, 20, 21, 22])
-    subplot_plot(ax7, Stock[6], data_ax7, latest_price, latest_change)
-
     # --- PLOT AX8 BAR CHART ---
     ax8.clear()  # clear previous values
 
@@ -324,16 +582,15 @@ def animate(i):
     neg = data["open"] - data["close"] > 0  # negatives values
     data["x_axis"] = list(range(0, len(data["volume_diff"])))  # create x-axis values
 
-    # Create bar chart
-    # x-axis: data["x_axis"][pos]
-    # y-axis: data["volume_diff"][pos]
-    ax8.bar(data["x_axis"][pos], data["volume_diff"][pos], color="#18b800", width=1, align="center")  # positives
-    ax8.bar(data["x_axis"][neg], data["volume_diff"][neg], color="#ff3503", width=1, align="center")  # negatives
+    # Create bar chart, bars without price change have no height
+    # x-axis: data["x_axis"]
+    # y-axis: data["volume_diff"]
+    VolumeRenderer(ax8).update(data["x_axis"], data["volume_diff"].where(pos | neg, 0), pos)
 
     ymax = data["volume_diff"].max()  # volume max value
     ystd = data["volume_diff"].std()  # standard deviation
 
-    if not math.isnan(ymax):  # check if there is a nan value
+    if not math.isnan(ymax) and ystd > 0:  # check if there is a nan value, a flat series has no range
         ax8.set_ylim([0, ymax + ystd * 3])  # set y-axis limit
 
     # Volume text
@@ -378,7 +635,7 @@ def animate(i):
     # Process time value for the x-axis
     def mydate(x, pos=None):
         try:
-            t = xdate[int(x)].strftime("%H:%M")
+            t = xdate[int(x)].strftime(time_format(freq))
             return t
         except IndexError:
             return ""
@@ -389,13 +646,330 @@ def animate(i):
     ax9.tick_params(axis="x", which="major", labelsize=8)  # show x-axis value
 
 
-def start_dashboard():
+class BlitManager:
+    """
+    Redraw only the animated artists on top of a cached background of the figure
+    """
+
+    def __init__(self, canvas):
+        """
+        :param canvas: figure canvas
+        """
+        self.canvas = canvas
+        self.background = None  # cached figure without the animated artists
+        self.artists = []  # animated artists
+        self.cid = canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        """
+        Cache the background after a full redraw (window resize, axis limit changes)
+        :param event: draw event
+        """
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_animated()
+
+    def add_artist(self, artist):
+        """
+        Add an artist that is updated in place every frame
+        :param artist: artist created once
+        :return: artist
+        """
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def draw_animated(self):
+        """
+        Draw all animated artists
+        """
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self, full=False):
+        """
+        Show the current state of the animated artists
+        :param full: redraw the whole figure (needed when tick labels or grids changed)
+        """
+        if full or self.background is None:
+            self.canvas.draw()  # triggers on_draw, which caches the new background
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_animated()
+            self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
+
+
+class LiveDashboard:
+    """
+    Render loop that creates the artists once and updates them in place.
+    Only the animated artists are redrawn (blitting) and only when new ticks arrived.
+    """
+
+    def __init__(self, figure):
+        """
+        :param figure: dashboard figure with the subplots ax1 to ax9
+        """
+        self.blit = BlitManager(figure.canvas)
+        self.offset = None  # data_version() of the last drawn data
+        self.clock = ""  # last drawn time stamp
+        self.xmax = 0  # right x limit of ax1, ax8 and ax9
+        self.ylim = (0, 0)  # y limits of ax1
+        self.xdate = []  # time of every row for the x-axis labels
+        self.shown = []  # symbols of the drawn windows
+        self.freq = timeframe  # timeframe of the drawn focus chart
+        self.setup()
+
+    def setup(self):
+        """
+        Create the static layout and every animated artist
+        """
+        import matplotlib.ticker as ticker
+        from matplotlib.patches import Rectangle
+        from candles import CandleRenderer, VolumeRenderer
+
+        add = self.blit.add_artist
+
+        # --- AX1 ---
+        figure_design(ax1)
+        self.candles = CandleRenderer(ax1)  # candles of the closed bars, part of the background
+        self.ma_lines = [add(ax1.plot([], [], color=color, linestyle="-", linewidth=1, label=label)[0])
+                         for color, label in [("pink", "5 min SMA"), ("orange", "10 min SMA"),
+                                              ("#08a0e9", "20 min SMA")]]
+        leg = ax1.legend(loc="upper left", facecolor="#121416", fontsize=8)
+        for text in leg.get_texts():
+            text.set_color("w")
+        self.freq_text = ax1.text(0.99, 0.97, self.freq, transform=ax1.transAxes, color="grey", fontsize=8,
+                                  fontweight="bold", horizontalalignment="right", verticalalignment="top")
+        self.symbol_text = ax1.text(0.005, 1.05, "", transform=ax1.transAxes, color="black", fontsize=16,
+                                    fontweight="bold", horizontalalignment="left", verticalalignment="center",
+                                    bbox=dict(facecolor="#FFBF00"))
+        self.price_text = add(ax1.text(0.35, 1.05, "", transform=ax1.transAxes, color="white", fontsize=16,
+                                       fontweight="bold", horizontalalignment="center", verticalalignment="center"))
+        self.change_text = add(ax1.text(0.75, 1.05, "", transform=ax1.transAxes, color="white", fontsize=16,
+                                        fontweight="bold", horizontalalignment="center", verticalalignment="center"))
+        self.clock_text = add(ax1.text(1.32, 1.05, "", transform=ax1.transAxes, color="white", fontsize=10,
+                                       fontweight="bold", horizontalalignment="center", verticalalignment="center"))
+        ax1.grid(True, color="grey", linestyle="-", which="major", axis="both", linewidth=0.3)
+        ax1.tick_params(axis="x", labelbottom=False)  # x-axis labels to empty
+
+        # --- AX2 - AX7 ---
+        self.panels = []
+        for ax in [ax2, ax3, ax4, ax5, ax6, ax7]:
+            figure_design(ax)
+            ax.axes.xaxis.set_visible(False)  # x-axis visibility
+            ax.axes.yaxis.set_visible(False)  # y-axis visibility
+            title = add(ax.text(0.02, 0.95, "", transform=ax.transAxes, color="#FFBF00", fontsize=7,
+                                fontweight="bold", horizontalalignment="left", verticalalignment="top"))
+            line = add(ax.plot([], [], color="white", linewidth=2)[0])
+            price = add(ax.text(0.25, 0.95, "", transform=ax.transAxes, color="white", fontsize=7,
+                                fontweight="bold", horizontalalignment="left", verticalalignment="top"))
+            change = add(ax.text(0.5, 0.95, "", transform=ax.transAxes, color="white", fontsize=7,
+                                 fontweight="bold", horizontalalignment="left", verticalalignment="top"))
+            self.panels.append((ax, title, line, price, change))
+
+        # --- AX8 ---
+        figure_design(ax8)
+        ax8.axes.yaxis.set_visible(False)  # hide y-axis values
+        self.bars = VolumeRenderer(ax8)  # volume bars of the closed bars, part of the background
+        self.last_bar = add(ax8.add_patch(Rectangle(xy=(-0.5, 0), width=1, height=0)))  # bar of the open bar
+        self.volume_text = add(ax8.text(0.01, 0.95, "", transform=ax8.transAxes, color="white", fontsize=10,
+                                        fontweight="bold", horizontalalignment="left", verticalalignment="top"))
+        ax8.grid(True, color="grey", linestyle="-", which="major", axis="both", linewidth=0.3)
+        ax8.tick_params(axis="x", labelbottom=False)  # hide x-axis label values
+
+        # --- AX9 ---
+        figure_design(ax9)
+        ax9.axes.yaxis.set_visible(False)  # hide y-axis values
+        ax9.set_ylim([-5, 105])  # normally [0, 100] but add room for margin
+        ax9.axhline(30, linestyle="-", color="green", linewidth=0.5)  # lower line
+        ax9.axhline(50, linestyle="-", color="white", linewidth=0.5)  # middle line
+        ax9.axhline(70, linestyle="-", color="red", linewidth=0.5)  # higher line
+        self.rsi_line = add(ax9.plot([], [], color="#08a0e9", linewidth=1.5)[0])
+        self.rsi_text = add(ax9.text(0.01, 0.95, "", transform=ax9.transAxes, color="white", fontsize=10,
+                                     fontweight="bold", horizontalalignment="left", verticalalignment="top"))
+
+        # Process time value for the x-axis, reads the times of the latest data
+        def mydate(x, pos=None):
+            try:
+                return self.xdate[int(x)].strftime(time_format(self.freq))
+            except IndexError:
+                return ""
+
+        ax9.xaxis.set_major_formatter(ticker.FuncFormatter(mydate))
+        ax9.grid(True, color="grey", linestyle="-", which="major", axis="both", linewidth=0.3)
+        ax9.tick_params(axis="x", which="major", labelsize=8)  # show x-axis value
+
+    def refresh(self):
+        """
+        Timer callback: read new ticks and redraw the changed artists
+        """
+        start = time.perf_counter()
+        shown = shown_symbols()
+        all_data = read_snapshot_ohlc(shown, timeframe)
+        clock = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if timeframe != self.freq:  # timeframe switched, the focus chart is rescaled from scratch
+            self.freq = timeframe
+            self.offset = None
+            self.xmax = 0
+            self.ylim = (0, 0)
+        version = data_version()
+        if version == self.offset and clock == self.clock and shown == self.shown:  # nothing changed
+            return
+        full = False
+        if shown[0] != self.symbol_text.get_text() or self.freq != self.freq_text.get_text():  # part of the background
+            self.symbol_text.set_text(shown[0])
+            self.freq_text.set_text(self.freq)
+            full = True
+        if version != self.offset or shown != self.shown:  # new ticks arrived or the windows rotated
+            self.offset = version
+            self.shown = shown
+            full |= self.update_focus(*all_data[0])
+            for panel, symbol, stock in zip(self.panels, shown[1:], all_data[1:]):
+                self.update_panel(panel, symbol, *stock[:3])
+        self.clock = clock
+        self.clock_text.set_text(clock)
+        self.blit.update(full)
+        metrics.observe("frame_seconds", time.perf_counter() - start, mode="full" if full else "blit")
+
+    def update_focus(self, data, latest_price, latest_change, volume):
+        """
+        Update ax1, ax8 and ax9 with the data of the stock in focus
+        :param data: prepared data
+        :param latest_price: latest price
+        :param latest_change: latest change
+        :param volume: latest volume
+        :return: True if the axis limits changed and the whole figure has to be redrawn
+        """
+        full = False
+        rows = len(data)
+        x = np.arange(rows)
+
+        # Candles, the last (still open) bar is not drawn
+        closed = data.iloc[:-1]
+        full |= self.candles.update(x[:-1], closed["open"], closed["high"], closed["low"], closed["close"])
+
+        for line, column in zip(self.ma_lines, ["MA5", "MA10", "MA20"]):
+            line.set_data(x, data[column].to_numpy())
+
+        # Texts above the window
+        self.price_text.set_text(latest_price)
+        self.change_text.set_text(latest_change)
+        self.change_text.set_color("#18b800" if latest_change[0] == "+" else "#ff3503")
+
+        # Axis limits, only changed when the data leaves them to avoid full redraws
+        if rows:
+            low = min(data["low"].min(), data[["MA5", "MA10", "MA20"]].min().min())
+            high = max(data["high"].max(), data[["MA5", "MA10", "MA20"]].max().max())
+            if low < self.ylim[0] or high > self.ylim[1]:
+                margin = (high - low) * 0.1 or 1
+                self.ylim = (low - margin, high + margin)
+                ax1.set_ylim(self.ylim)
+                full = True
+        if rows + 1 > self.xmax:
+            self.xmax = (rows // 30 + 1) * 30  # grow in steps of 30 bars
+            for ax in [ax1, ax8, ax9]:
+                ax.set_xlim(-1, self.xmax)
+            full = True
+
+        # --- AX8 volume bars ---
+        pos = (data["open"] - data["close"] < 0).to_numpy()  # positive values
+        neg = (data["open"] - data["close"] > 0).to_numpy()  # negatives values
+        volume_diff = data["volume_diff"].to_numpy(float)
+        heights = np.where((pos | neg) & ~np.isnan(volume_diff), volume_diff, 0)  # no bar for an unknown volume
+        full |= self.bars.update(x[:-1], heights[:-1], pos[:-1])
+        if rows:
+            self.last_bar.set_x(rows - 1.5)
+            self.last_bar.set_height(heights[-1])
+            self.last_bar.set_color("#18b800" if pos[-1] else "#ff3503")
+
+        ymax = data["volume_diff"].max()  # volume max value
+        ystd = data["volume_diff"].std()  # standard deviation
+        if not math.isnan(ymax) and ystd > 0:  # check if there is a nan value
+            top = ymax + ystd * 3
+            current = ax8.get_ylim()[1]
+            if top > current or top < current * 0.5:  # only rescale when the bars leave the limits
+                ax8.set_ylim([0, top])  # set y-axis limit
+                full = True  # the bars in the background have to be redrawn
+        self.volume_text.set_text("Volume: " + "{:,}".format(int(volume)))
+
+        # --- AX9 rsi line ---
+        self.rsi_line.set_data(x, data["RSI"].to_numpy())
+        try:
+            rsi = str(round(data["RSI"].iloc[-1], 2))
+        except IndexError:
+            rsi = "..."
+        self.rsi_text.set_text("RSI(14): " + rsi)
+        xdate = list(data["time"])
+        if xdate[:len(self.xdate)] != self.xdate[:len(xdate)]:  # labels of drawn rows changed
+            full = True
+        self.xdate = xdate
+        return full
+
+    @staticmethod
+    def update_panel(panel, symbol, data, latest_price, latest_changes):
+        """
+        Update a small window in place
+        :param panel: (ax, symbol text, line, price text, change text)
+        :param symbol: stock shown in the window
+        :param data: prepared data
+        :param latest_price: latest price
+        :param latest_changes: latest change
+        """
+        ax, title, line, price, change = panel
+        title.set_text(symbol)
+        close = data["close"]
+        line.set_data(*sparkline(ax, close.to_numpy()))  # at most one point per pixel of the window
+        if len(close):
+            ax.set_xlim(1, max(len(close), 2))
+
+        # Set y-axis limit, the axis is hidden so no full redraw is needed
+        ymin, ymax, ystd = close.min(), close.max(), close.std()
+        if not math.isnan(ymax) and ymax != 0 and ystd > 0:  # check if value is null (at the beginning)
+            ax.set_ylim([ymin - ystd * 0.5, ymax + ystd * 3])  # set boundary
+
+        price.set_text(latest_price)
+        change.set_text(latest_changes)
+        change.set_color("#18b800" if latest_changes[0] == "+" else "#ff3503")
+
+
+def start_dashboard(blit=BLIT, compute_process=COMPUTE_PROCESS, checkpoint=CHECKPOINT_FILE):
     """
     Init and run dashboard
+    :param blit: update the artists in place and redraw them with blitting (False: redraw everything every frame)
+    :param compute_process: read the ticks and compute the bars in a worker process
+    :param checkpoint: checkpoint file restored at start and written periodically (None: always rebuild)
     """
-    anim = animation.FuncAnimation(fig, animate, interval=1)
-    plt.show()
+    global compute
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+
+    metrics.start()  # exporters configured with METRICS_PORT / METRICS_FILE, no-op otherwise
+    if compute_process:  # the worker evaluates the alert rules and writes the notifications
+        compute = ComputeWorker(Stock, REFRESH_INTERVAL / 1000, checkpoint)
+    else:
+        if alert_engine is not None:
+            alert_engine.sink = AlertSink()  # notifications appended to alerts.jsonl
+        if checkpoint:
+            print("Checkpoint restored" if load_checkpoint(checkpoint) else
+                  "Building the session from the tick source")
+    create_figure()
+    fig.canvas.mpl_connect("key_press_event", on_key)  # keys 1 to 4 switch the timeframe of the focus chart
+    if blit:
+        live = LiveDashboard(fig)
+        timer = fig.canvas.new_timer(interval=REFRESH_INTERVAL)
+        timer.add_callback(live.refresh)
+        timer.start()
+    else:
+        anim = animation.FuncAnimation(fig, animate, interval=1)
+    try:
+        plt.show()
+    finally:
+        if compute is not None:
+            compute.close()
+        elif checkpoint_file is not None:
+            save_checkpoint(checkpoint_file)
 
 
-# Run dashboard
-start_dashboard()
+if __name__ == "__main__":
+    # Run dashboard
+    start_dashboard()
@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keep the points that preserve the shape of a line
+    :param x: x values, sorted
+    :param y: y values
+    :param threshold: maximum number of points to keep (ex: width of the plot in pixels)
+    :return: (x, y) arrays with at most threshold points, first and last points are always kept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # Buckets between the first and the last point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average point of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Point of this bucket forming the largest triangle with the previous point and the next average
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+import os
+import sys
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Serve saved quote pages: /quote/<SYMBOL> returns <directory>/quote_<SYMBOL>.html
+    Pages have an ETag and a Last-Modified header, conditional requests get a 304 when the file did not change,
+    and the pages are gzip compressed when the client accepts it. Edit a file to simulate a new quote.
+    """
+    directory = "fixtures"
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real site
+    validators = True  # send ETag / Last-Modified and answer conditional requests
+    stats = None  # dict path: {"requests", "not_modified", "bytes"}, shared by the handlers of a server
+
+    def do_GET(self):
+        """
+        Handle a GET request
+        """
+        path = urlparse(self.path).path
+        parts = path.strip("/").split("/")
+        filename = None
+        if len(parts) == 2 and parts[0] == "quote":
+            filename = os.path.join(self.directory, "quote_" + os.path.basename(parts[1]) + ".html")
+        elif path == "/":
+            filename = os.path.join(self.directory, "index.html")
+
+        if filename is None or not os.path.exists(filename):
+            self.send_error(404)
+            return
+
+        with open(filename, "rb") as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        last_modified = formatdate(int(os.path.getmtime(filename)), usegmt=True)
+        stats = (self.stats if self.stats is not None else {}).setdefault(path, {"requests": 0, "not_modified": 0,
+                                                                                "bytes": 0})
+        stats["requests"] += 1
+
+        if self.validators and (self.headers.get("If-None-Match") == etag or
+                                (self.headers.get("If-None-Match") is None and
+                                 self.headers.get("If-Modified-Since") == last_modified)):
+            stats["not_modified"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            return
+
+        compressed = "gzip" in self.headers.get("Accept-Encoding", "")
+        if compressed:
+            body = gzip.compress(body)
+        stats["bytes"] += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        if self.validators:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        Keep the console quiet
+        """
+
+
+def serve_fixtures(directory="fixtures", port=0, validators=True):
+    """
+    Start a local http server with the saved quote pages in a background thread
+    :param directory: folder with the quote_<SYMBOL>.html pages
+    :param port: port to listen on (0: any free port)
+    :param validators: send ETag / Last-Modified and answer conditional requests
+    :return: (server, base url), stop the server with server.shutdown(), counts per page in server.stats
+    """
+    stats = {}
+    handler = type("Handler", (FixtureHandler,), {"directory": directory, "validators": validators, "stats": stats})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+if __name__ == "__main__":
+    # Usage: python fixture_server.py [directory] [port]
+    server, url = serve_fixtures(*(sys.argv[1:2] or ["fixtures"]), port=int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
+    print("Serving quote fixtures on " + url + "/quote/<SYMBOL>")
+    threading.Event().wait()
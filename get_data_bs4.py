@@ -1,83 +1,445 @@
 import random
 import time
 import datetime
+import threading
+import html
+import json
+import os
+import re
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
-from bs4 import BeautifulSoup
+
+import metrics
+from live_feed import FEED_PATH, start_feed
+from partitions import PartitionedTickStore
+from scheduler import SweepScheduler
+from symbols import load_symbols
+from tick_store import TickStore
 
 HEADER = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
                   "Chrome/98.0.4758.109 Safari/537.36",
-    "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8"
+    "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8",
+    "Accept-Encoding": "gzip, deflate"
 }
+url_home = "https://finance.yahoo.com/"
 
-Stock = ["AAPL", "MSFT", "NFLX", "PYPL", "FB", "TWTR", "AMZN"]
+Stock = load_symbols()  # stock universe, see symbols.json
 
 FILE_NAME = "stock_data.csv"
+STORE_NAME = "stock_data.ticks"  # binary tick store, export it with: python tick_store.py export
+STORE_DIR = "stock_data"  # partitioned tick store, one partition per day compacted when the day is over
+PARTITIONED = True  # write to STORE_DIR instead of STORE_NAME
+WRITE_CSV = False  # also append every sweep to the csv file
+PUBLISH = True  # push every sweep to the dashboard over the live feed socket
+
+# Polling
+TIME_DELAY = 12  # seconds between two sweeps
+SYMBOL_DELAY = {}  # poll interval of single stocks in seconds, ex: {"AMZN": 30}
+MAX_BACKOFF = 300  # longest delay in seconds before retrying a failing stock
+
+# Concurrent fetching
+CONCURRENT = True  # fetch all stocks of a sweep at the same time
+MAX_WORKERS = 7  # number of parallel requests (and pooled connections)
+REQUEST_RATE = 1.0  # average number of requests per second
+REQUEST_BURST = 7  # number of requests allowed at once
+
+# Response cache
+CACHE_TTL = 5  # seconds a quote page is reused without a request, keep it below TIME_DELAY
+CONDITIONAL = True  # revalidate expired pages with If-None-Match / If-Modified-Since when the server allows it
+
+# Quote extraction
+EXTRACTOR = "fast"  # "fast": targeted scan of the fin-streamer tags, "bs4": full BeautifulSoup parse
+PRICE_CLASS = "Fw(b) Fz(36px) Mb(-4px) D(ib)"
+CHANGE_CLASS = "Fw(500) Pstart(8px) Fz(24px)"
+FIN_STREAMER = re.compile(r"<fin-streamer\b([^>]*)>(.*?)</fin-streamer>", re.S)
+ATTRIBUTE = re.compile(r'([\w:-]+)\s*=\s*"([^"]*)"')
+TAG = re.compile(r"<[^>]*>")
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by the fetching threads.
+    Replaces the blind sleeps between requests: a request only waits when the configured rate is exceeded.
+    """
 
+    def __init__(self, rate, capacity):
+        """
+        :param rate: tokens added per second
+        :param capacity: maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_update = time.monotonic()
+        self.lock = threading.Lock()
 
-def get_data(_symbol):
+    def acquire(self):
+        """
+        Take one token, wait until one is available
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate)
+                self.last_update = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate  # time until the next token
+            time.sleep(wait)
+
+
+def create_session(pool_size=MAX_WORKERS):
+    """
+    Create a http session with keep-alive connection pooling
+    :param pool_size: number of connections kept open
+    :return: session
+    """
+    session = requests.Session()
+    session.headers.update(HEADER)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def quote_url(_symbol, base_url=url_home):
+    """
+    Url of the quote page of a stock
+    :param _symbol: stock symbol
+    :param base_url: website, ex: a local fixture server
+    :return: url
+    """
+    return base_url.rstrip("/") + "/quote/" + _symbol + "?p=" + _symbol + "&.tsrc=fin-srch"
+
+
+class QuoteFetcher:
+    """
+    Fetch layer of the quote pages:
+    - pages are cached per stock for CACHE_TTL seconds, consumers asking again within the ttl get the cached page
+    - expired pages are revalidated with a conditional request (ETag / Last-Modified), a 304 reuses the cached page
+    - concurrent requests for the same stock share one request
+    - compressed responses are negotiated and the bytes received are counted per sweep
+    """
+
+    def __init__(self, session=None, bucket=None, base_url=url_home, ttl=CACHE_TTL, conditional=CONDITIONAL):
+        """
+        :param session: http session (default: new pooled session)
+        :param bucket: TokenBucket limiting the requests sent, cache hits are not limited (optional)
+        :param base_url: website, ex: a local fixture server
+        :param ttl: seconds a page is reused without a request
+        :param conditional: send conditional requests for the expired pages
+        """
+        self.session = session or create_session()
+        self.bucket = bucket
+        self.base_url = base_url
+        self.ttl = ttl
+        self.conditional = conditional
+        self.urls = {}  # symbol: url, built once
+        self.cache = {}  # symbol: (time of the response, ETag, Last-Modified, page)
+        self.in_flight = {}  # symbol: future of the running request
+        self.bytes = 0  # bytes received since the last take_bytes()
+        self.lock = threading.Lock()
+
+    def fetch(self, _symbol):
+        """
+        Get the quote page of a stock
+        :param _symbol: stock symbol
+        :return: html text of the page
+        """
+        with self.lock:
+            entry = self.cache.get(_symbol)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                metrics.inc("fetch_cache_hits_total", symbol=_symbol)
+                return entry[3]
+            future = self.in_flight.get(_symbol)
+            owner = future is None
+            if owner:  # first consumer, the others wait for its response
+                future = self.in_flight[_symbol] = Future()
+        if not owner:
+            metrics.inc("fetch_shared_total", symbol=_symbol)
+            return future.result()
+
+        try:
+            page = self.request(_symbol, entry)
+            future.set_result(page)
+            return page
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[_symbol]
+
+    def request(self, _symbol, entry):
+        """
+        Send the request of a page, conditional if the cached page has validators
+        :param _symbol: stock symbol
+        :param entry: cached (time, ETag, Last-Modified, page) or None
+        :return: html text of the page
+        """
+        url = self.urls.get(_symbol)
+        if url is None:
+            url = self.urls[_symbol] = quote_url(_symbol, self.base_url)
+        headers = {}
+        if self.conditional and entry is not None:
+            if entry[1]:
+                headers["If-None-Match"] = entry[1]
+            if entry[2]:
+                headers["If-Modified-Since"] = entry[2]
+
+        if self.bucket is not None:
+            self.bucket.acquire()  # wait for the rate limiter instead of sleeping blindly
+        with metrics.timer("fetch_seconds", symbol=_symbol):
+            response = self.session.get(url, headers=headers)
+            if response.status_code == 304 and entry is None:  # nothing cached to reuse, ask for the whole page
+                self.count_bytes(_symbol, response)
+                response = self.session.get(url, headers={"If-None-Match": None, "If-Modified-Since": None})
+                if response.status_code == 304:
+                    raise requests.HTTPError("304 Not Modified without a cached page: " + url, response=response)
+            page = response.text if response.status_code != 304 else entry[3]
+        self.count_bytes(_symbol, response)
+        if response.status_code != 304:
+            response.raise_for_status()
+        else:
+            metrics.inc("fetch_not_modified_total", symbol=_symbol)
+
+        with self.lock:
+            self.cache[_symbol] = (time.monotonic(), response.headers.get("ETag") or (entry and entry[1]),
+                                   response.headers.get("Last-Modified") or (entry and entry[2]), page)
+        return page
+
+    def count_bytes(self, _symbol, response):
+        """
+        Count the bytes received with a response
+        :param _symbol: stock symbol
+        :param response: read response
+        """
+        received = response.raw.tell() if response.raw is not None else len(response.content)  # compressed size
+        metrics.inc("fetch_bytes_total", received, symbol=_symbol)
+        with self.lock:
+            self.bytes += received
+
+    def take_bytes(self):
+        """
+        :return: bytes received since the last call (ex: bytes of a sweep)
+        """
+        with self.lock:
+            received, self.bytes = self.bytes, 0
+        return received
+
+
+def extract_quote_bs4(page):
+    """
+    Extract the quote fields by parsing the whole page with beautifulsoup
+    :param page: html text of the quote page
+    :return: (price, volume, change, changes in percentage) texts
+    """
+    from bs4 import BeautifulSoup  # only imported when the bs4 extractor is selected
+
+    soup = BeautifulSoup(page, "html.parser")
+    _price = soup.find('fin-streamer', {'class': PRICE_CLASS}).text
+    _volume = soup.find('fin-streamer', {'data-field': 'regularMarketVolume'}).text
+    _changes_list = soup.find_all('fin-streamer', {'class': CHANGE_CLASS})
+    return _price, _volume, _changes_list[0].text, _changes_list[1].text
+
+
+def extract_quote_fast(page):
+    """
+    Extract the quote fields by scanning only the fin-streamer tags, stops as soon as all fields are found
+    :param page: html text of the quote page
+    :return: (price, volume, change, changes in percentage) texts, None if a field is missing
+    """
+    _price = _volume = None
+    _changes_list = []
+    for match in FIN_STREAMER.finditer(page):
+        attributes = dict(ATTRIBUTE.findall(match.group(1)))
+        if _price is None and attributes.get("class") == PRICE_CLASS:
+            _price = match.group(2)
+        elif _volume is None and attributes.get("data-field") == "regularMarketVolume":
+            _volume = match.group(2)
+        elif len(_changes_list) < 2 and attributes.get("class") == CHANGE_CLASS:
+            _changes_list.append(match.group(2))
+        else:
+            continue
+        if _price is not None and _volume is not None and len(_changes_list) == 2:
+            # Inner text without nested tags, same as beautifulsoup .text
+            _price, _volume, _change_real, _changes_pct = [html.unescape(TAG.sub("", text)) for text in
+                                                           [_price, _volume] + _changes_list]
+            return _price, _volume, _change_real, _changes_pct
+    return None
+
+
+EXTRACTORS = {"fast": extract_quote_fast, "bs4": extract_quote_bs4}
+
+
+def extract_quote(page, extractor=EXTRACTOR):
+    """
+    Extract the quote fields with the chosen backend, beautifulsoup is used as fallback
+    :param page: html text of the quote page
+    :param extractor: name of the backend, see EXTRACTORS
+    :return: (price, volume, change, changes in percentage) texts
+    """
+    fields = EXTRACTORS[extractor](page)
+    if fields is None:  # page layout not recognized by the fast scanner
+        fields = extract_quote_bs4(page)
+    return fields
+
+
+def get_data(_symbol, fetcher=None, extractor=EXTRACTOR):
     """
     Get live data with beautifulsoup
     :param _symbol: stock symbol. Ex: For Apple => AAPL
+    :param fetcher: QuoteFetcher reusing connections and cached pages (optional)
+    :param extractor: quote extraction backend, see EXTRACTORS
     :return:
     """
     # Retrieve live data
-    url = "https://finance.yahoo.com/quote/" + _symbol + "?p=" + _symbol + "&.tsrc=fin-srch"
-    response = requests.get(url, headers=HEADER)
-    soup = BeautifulSoup(response.text, "html.parser")
+    if fetcher is None:
+        with metrics.timer("fetch_seconds", symbol=_symbol):
+            page = requests.get(quote_url(_symbol), headers=HEADER).text
+    else:
+        page = fetcher.fetch(_symbol)
+    with metrics.timer("parse_seconds", symbol=_symbol):
+        return parse_quote(*extract_quote(page, extractor))
+
 
+def parse_quote(_price, _volume, _change_real, _changes_pct):
+    """
+    Convert the extracted texts into the values saved by the scraper
+    :param _price: price text
+    :param _volume: volume text
+    :param _change_real: change text
+    :param _changes_pct: changes in percentage text
+    :return: (price, change, volume)
+    """
     # Get price data
-    _price = soup.find('fin-streamer', {'class': 'Fw(b) Fz(36px) Mb(-4px) D(ib)'}).text
     _price = _price.replace(",", "")
     _price = pd.to_numeric(_price, downcast="float")
 
     # Get volume data
-    _volume = soup.find('fin-streamer', {'data-field': 'regularMarketVolume'}).text
     _volume = _volume.replace(",", "")
     _volume = int(_volume)
     _volume = f"{_volume:,}"
 
     # Get changes data
-    _changes_list = soup.find_all('fin-streamer', {'class': 'Fw(500) Pstart(8px) Fz(24px)'})
-    _change_real = _changes_list[0].text
-    _changes_pct = _changes_list[1].text
     _change = f"{_change_real} {_changes_pct}"
 
     return _price, _change, _volume
 
 
-def start_get_data_bs4():
+def get_data_safe(_symbol, fetcher=None):
+    """
+    Get live data, failures are printed instead of stopping the loop
+    :param _symbol: stock symbol
+    :param fetcher: QuoteFetcher reusing connections and cached pages (optional)
+    :return: (price, change, volume), None if the data could not be retrieved
+    """
+    try:
+        return get_data(_symbol, fetcher)
+    except Exception as e:
+        print(_symbol + ": " + repr(e))
+        return None
+
+
+def get_data_concurrent(symbols, fetcher, executor):
+    """
+    Get live data of several stocks at the same time
+    :param symbols: list of stock symbols
+    :param fetcher: QuoteFetcher shared by all requests, its token bucket limits the request rate
+    :param executor: thread pool running the requests
+    :return: list of (price, change, volume) or None for a failure, in the order of symbols
+    """
+    return list(executor.map(lambda symbol: get_data_safe(symbol, fetcher), symbols))
+
+
+def start_get_data_bs4(concurrent=CONCURRENT, base_url=url_home):
     """
     Main loop for getting live data
+    :param concurrent: fetch all stocks of a sweep at the same time (False: one after another)
+    :param base_url: website, ex: a local fixture server
     """
+    metrics.start()  # exporters configured with METRICS_PORT / METRICS_FILE, no-op otherwise
+    if concurrent:
+        fetcher = QuoteFetcher(create_session(MAX_WORKERS), TokenBucket(REQUEST_RATE, REQUEST_BURST), base_url)
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    else:
+        fetcher = QuoteFetcher(create_session(1), base_url=base_url)
+
+    # Every sweep is published once, the tick store and the csv file are persistence subscribers of the feed
+    store = PartitionedTickStore(STORE_DIR) if PARTITIONED else TickStore(STORE_NAME)
+    feed = start_feed(store, FILE_NAME if WRITE_CSV else None, Stock, FEED_PATH if PUBLISH else None)
+    scheduler = SweepScheduler(Stock, TIME_DELAY, SYMBOL_DELAY, MAX_BACKOFF)
+
     # Loop getting live data
     while True:
+        deadline, due = scheduler.wait()  # sleep until the next sweep is due
+
         time_stamp = datetime.datetime.now() - datetime.timedelta(hours=6)  # current time of the stock market
         time_stamp = time_stamp.strftime("%Y-%m-%d %H:%M:%S")  # format time string
 
-        info = []  # create empty list for the data
+        # Getting data for each stock due in this sweep
+        with metrics.timer("sweep_seconds"):
+            if concurrent:
+                quotes = dict(zip(due, get_data_concurrent(due, fetcher, executor)))
+            else:
+                quotes = {}
+                for symbol in due:
+                    quotes[symbol] = get_data_safe(symbol, fetcher)  # get live data
+                    time.sleep(random.randint(1, 3))  # delay before getting next stock data. Prevents server ban
+        for symbol, values in quotes.items():
+            scheduler.report(symbol, values is not None)  # failing stocks are retried with a backoff
+            metrics.record_quote(symbol, values)  # failures and staleness of every stock
+        metrics.set_gauge("sweep_bytes", fetcher.take_bytes())  # bytes received for this sweep
 
-        # Getting data for each stock
+        info = []  # create empty list for the data
         for symbol in Stock:
-            price, change, volume = get_data(symbol)  # get live data
-            info.append(price)  # add price to info list
-            info.extend([change])  # add changes to info list
-            info.extend([volume])  # add volume to info list
-            time.sleep(random.randint(1, 3))  # delay before getting next stock data. Here to prevent server ban
+            info.extend(quotes.get(symbol) or ["", "", ""])  # add price, changes and volume to info list
+
+        # Publish the sweep to the dashboard and the persistence subscribers (tick store, csv file)
+        feed.publish(time_stamp, [(symbol,) + tuple(values) for symbol, values in quotes.items() if values])
 
-        # Save data to a csv file
         col = [time_stamp]  # new list with timestamp as first data
         col.extend(info)  # add stock info to list
-        df = pd.DataFrame(col)  # create dataframe
-        df = df.T  # transpose dataframe
-        df.to_csv(FILE_NAME, mode="a", header=False)  # save data to csv file
         print(col)  # print stock data to console
 
-        # Delay before getting next loop. Here to prevent server ban
-        time.sleep(random.randint(10, 12))
+
+def compare_extractors(directory, repeat=20):
+    """
+    Validate and time the extraction backends on saved quote pages
+    :param directory: folder with saved html pages
+    :param repeat: number of timed runs per page and backend
+    :return: dict with the results of every page
+    """
+    results = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".html"):
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            page = f.read()
+
+        result = {}
+        for name, extractor in EXTRACTORS.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fields = extractor(page)
+            result[name] = {"fields": fields, "ms": (time.perf_counter() - start) / repeat * 1000}
+        result["match"] = len({tuple(r["fields"] or ()) for r in result.values()}) == 1
+        results[filename] = result
+    return results
 
 
-# Start and loop getting live data
-start_get_data_bs4()
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1].startswith("http"):
+        # python get_data_bs4.py http://127.0.0.1:8000 reads the pages of a local fixture server instead
+        start_get_data_bs4(base_url=sys.argv[1])
+    elif len(sys.argv) > 1:  # python get_data_bs4.py fixtures: compare the extraction backends offline
+        print(json.dumps(compare_extractors(sys.argv[1]), indent=2))
+    else:
+        # Start and loop getting live data
+        start_get_data_bs4()
@@ -1,31 +1,112 @@
 import time
-import pandas as pd
 import datetime
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
+import metrics
+from live_feed import FEED_PATH, start_feed
+from partitions import PartitionedTickStore
+from scheduler import SweepScheduler
+from symbols import load_symbols
+from tick_store import TickStore
 
 
 chrome_driver_path = "/Users/markschwarz/My Files/Python Projects/ChromeDriver/chromedriver"
-service = Service(executable_path=chrome_driver_path)
-option = webdriver.ChromeOptions()
-driver = webdriver.Chrome(service=service, options=option)
+driver = None  # visible driver used when the pool is disabled, created by start_get_data_selenium
 url_home = "https://finance.yahoo.com/"
 
-Stock = ["AAPL", "MSFT", "NFLX", "PYPL", "FB", "TWTR", "AMZN"]
-TIME_DELAY = 30
+Stock = load_symbols()  # stock universe, see symbols.json
+TIME_DELAY = 30  # seconds between two sweeps
+SYMBOL_DELAY = {}  # poll interval of single stocks in seconds, ex: {"AMZN": 60}
+MAX_BACKOFF = 300  # longest delay in seconds before retrying a failing stock
 FILE_NAME = "stock_data.csv"
+STORE_NAME = "stock_data.ticks"  # binary tick store, export it with: python tick_store.py export
+STORE_DIR = "stock_data"  # partitioned tick store, one partition per day compacted when the day is over
+PARTITIONED = True  # write to STORE_DIR instead of STORE_NAME
+WRITE_CSV = False  # also append every sweep to the csv file
+PUBLISH = True  # push every sweep to the dashboard over the live feed socket
 
+# Driver pool
+POOL_SIZE = 3  # number of parallel headless drivers (0: one visible driver getting one stock after another)
+HEADLESS = True  # run the pool drivers without a window
+REFRESH_TABS = True  # reload the tabs every sweep (False: read the values the page keeps streaming)
 
-def get_real_time_data(_symbol):
+# Read every field of a quote page with one WebDriver command
+EXTRACT_SCRIPT = """
+var symbol = arguments[0];
+function text(selector) {
+    var element = document.querySelector(selector);
+    return element ? element.innerText.trim() : null;
+}
+var streamer = 'fin-streamer[data-symbol="' + symbol + '"]';
+return [text(streamer + '[data-field="regularMarketPrice"]'),
+        text(streamer + '[data-field="regularMarketChange"] span'),
+        text(streamer + '[data-field="regularMarketChangePercent"] span'),
+        text(streamer + '[data-field="regularMarketVolume"]')];
+"""
+
+
+def create_driver(headless=False):
+    """
+    Start a chrome driver
+    :param headless: run without a window
+    :return: driver
+    """
+    from selenium import webdriver  # imported by the first driver, importing this module starts nothing
+    from selenium.webdriver.chrome.service import Service
+
+    service = Service(executable_path=chrome_driver_path)
+    option = webdriver.ChromeOptions()
+    if headless:
+        option.add_argument("--headless")
+    return webdriver.Chrome(service=service, options=option)
+
+
+def quote_url(_symbol, base_url=url_home):
+    """
+    Url of the quote page of a stock
+    :param _symbol: stock symbol
+    :param base_url: website, ex: a local fixture server
+    :return: url
+    """
+    return base_url.rstrip("/") + "/quote/" + _symbol + "?p=" + _symbol + "&.tsrc=fin-srch"
+
+
+def accept_consent(_driver):
+    """
+    Handling GDPR popup
+    :param _driver: driver to accept the consent with
+    """
+    from selenium.webdriver.common.by import By
+
+    _driver.get(url_home)
+    _driver.implicitly_wait(5)
+    # # Try to find consent page
+    try:
+        _driver.find_element(By.ID, "consent-page")
+    except Exception as e:
+        print(e)
+
+    # # Try to click agree button
+    try:
+        submit = _driver.find_element(By.NAME, "agree")
+        submit.click()
+    except Exception as e:
+        print(e)
+
+
+@metrics.timed("get_real_time_data_seconds")
+def get_real_time_data(_symbol, base_url=url_home):
     """
     Get real time data with Selenium
     :param _symbol:
+    :param base_url: website, ex: a local fixture server
     :return:
     """
+    from selenium.webdriver.common.by import By
+
     # Open website
-    url = "https://finance.yahoo.com/quote/" + _symbol + "?p=" + _symbol + "&.tsrc=fin-srch"
+    url = quote_url(_symbol, base_url)
     driver.get(url)
 
     # Try to retrieve live data
@@ -51,52 +132,146 @@ def get_real_time_data(_symbol):
     return price, abs_change, volume
 
 
-def start_get_data_selenium():
+def extract_quote(_driver, _symbol):
     """
-    Main loop for getting live data
+    Read the fields of the loaded quote page with a single script call
+    :param _driver: driver showing the quote page
+    :param _symbol: stock symbol
+    :return: (price, change, volume), empty strings if a field is missing
     """
-    # Handling GDPR popup
-    driver.get(url_home)
-    driver.implicitly_wait(5)
-    # # Try to find consent page
     try:
-        driver.find_element(By.ID, "consent-page")
+        price, change, pct_change, volume = _driver.execute_script(EXTRACT_SCRIPT, _symbol)
+        if None in (price, change, pct_change, volume):
+            raise ValueError("Quote fields of " + _symbol + " not found")
     except Exception as e:
         print(e)
+        return "", "", ""
+    return price, change + " " + pct_change, volume
 
-    # # Try to click agree button
-    try:
-        submit = driver.find_element(By.NAME, "agree")
-        submit.click()
-    except Exception as e:
-        print(e)
+
+class DriverPool:
+    """
+    Pool of headless drivers with one persistent tab per stock.
+    The drivers work in parallel, each one refreshes its tabs and reads them with one script call per page.
+    """
+
+    def __init__(self, symbols, size=POOL_SIZE, headless=HEADLESS, base_url=url_home, consent=True):
+        """
+        :param symbols: stock symbols, the tabs are opened once
+        :param size: number of drivers
+        :param headless: run the drivers without a window
+        :param base_url: website, ex: a local fixture server
+        :param consent: accept the GDPR popup before opening the tabs
+        """
+        self.drivers = [create_driver(headless) for _ in range(max(1, min(size, len(symbols))))]
+        self.tabs = {}  # symbol: (driver index, window handle)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.drivers))
+
+        for n, _driver in enumerate(self.drivers):
+            if consent:
+                accept_consent(_driver)
+            for i, symbol in enumerate(symbols[n::len(self.drivers)]):  # stocks are spread round robin
+                if i:
+                    _driver.switch_to.new_window("tab")
+                _driver.get(quote_url(symbol, base_url))
+                self.tabs[symbol] = (n, _driver.current_window_handle)
+
+    def read_tabs(self, n, symbols):
+        """
+        Read the tabs of one driver, runs in the driver's own thread
+        :param n: driver index
+        :param symbols: stocks of the driver
+        :return: dict symbol: (price, change, volume)
+        """
+        _driver = self.drivers[n]
+        values = {}
+        for symbol in symbols:
+            try:
+                with metrics.timer("fetch_seconds", symbol=symbol):
+                    _driver.switch_to.window(self.tabs[symbol][1])
+                    if REFRESH_TABS:
+                        _driver.refresh()
+            except Exception as e:
+                print(e)
+                values[symbol] = "", "", ""
+                continue
+            with metrics.timer("parse_seconds", symbol=symbol):
+                values[symbol] = extract_quote(_driver, symbol)
+        return values
+
+    def get_data(self, symbols):
+        """
+        Get live data of several stocks, the drivers work in parallel
+        :param symbols: stock symbols (opened when the pool was created)
+        :return: list of (price, change, volume), in the order of symbols
+        """
+        jobs = [self.executor.submit(self.read_tabs, n, [s for s in symbols if self.tabs[s][0] == n])
+                for n in range(len(self.drivers))]
+        values = {}
+        for job in jobs:
+            values.update(job.result())
+        return [values[symbol] for symbol in symbols]
+
+    def close(self):
+        """
+        Quit every driver
+        """
+        self.executor.shutdown()
+        for _driver in self.drivers:
+            _driver.quit()
+
+
+def start_get_data_selenium(pool_size=POOL_SIZE, base_url=url_home):
+    """
+    Main loop for getting live data
+    :param pool_size: number of parallel headless drivers (0: one visible driver)
+    :param base_url: website, ex: a local fixture server
+    """
+    global driver
+    metrics.start()  # exporters configured with METRICS_PORT / METRICS_FILE, no-op otherwise
+    pool = None
+    if pool_size:
+        pool = DriverPool(Stock, pool_size, base_url=base_url, consent=base_url == url_home)
+    else:
+        driver = create_driver()
+        if base_url == url_home:  # a fixture server has no GDPR popup
+            accept_consent(driver)
+
+    # Every sweep is published once, the tick store and the csv file are persistence subscribers of the feed
+    store = PartitionedTickStore(STORE_DIR) if PARTITIONED else TickStore(STORE_NAME)
+    feed = start_feed(store, FILE_NAME if WRITE_CSV else None, Stock, FEED_PATH if PUBLISH else None)
+    scheduler = SweepScheduler(Stock, TIME_DELAY, SYMBOL_DELAY, MAX_BACKOFF)
 
     # Loop getting live data
-    time_last_update = time.time()
     while True:  # loop program
-        time_passed = time.time() - time_last_update  # calculate time passed from last update
-        if time_passed > TIME_DELAY:  # Check delay
-            time_last_update = time.time()  # reset delay
-
-            info = []  # create empty list for the data
-            time_stamp = datetime.datetime.now() - datetime.timedelta(hours=6)  # current time of the stock market
-            time_stamp = time_stamp.strftime("%Y-%m-%d %H:%M:%S")  # format time string
-
-            # Getting data for each stock
-            for symbol in Stock:
-                price, change, volume = get_real_time_data(symbol)  # get live data
-                info.append(price)  # add price to info list
-                info.extend([change])  # add changes to info list
-                info.extend([volume])  # add volume to info list
-
-            # Save data to a csv file
-            col = [time_stamp]  # new list with timestamp as first data
-            col.extend(info)  # add stock info to list
-            df = pd.DataFrame(col)  # create dataframe
-            df = df.T  # transpose dataframe
-            df.to_csv(FILE_NAME, mode="a", header=False)  # save data to csv file
-            print(col)  # print stock data to console
-
-
-# Start and loop getting live data
-start_get_data_selenium()
+        deadline, due = scheduler.wait()  # sleep until the next sweep is due
+
+        time_stamp = datetime.datetime.now() - datetime.timedelta(hours=6)  # current time of the stock market
+        time_stamp = time_stamp.strftime("%Y-%m-%d %H:%M:%S")  # format time string
+
+        # Getting data for each stock due in this sweep
+        with metrics.timer("sweep_seconds"):
+            if pool is not None:
+                quotes = dict(zip(due, pool.get_data(due)))
+            else:
+                quotes = {symbol: get_real_time_data(symbol, base_url) for symbol in due}  # get live data
+        for symbol, values in quotes.items():
+            scheduler.report(symbol, values[0] != "")  # failing stocks are retried with a backoff
+            metrics.record_quote(symbol, values if values[0] != "" else None)  # failures and staleness
+
+        info = []  # create empty list for the data
+        for symbol in Stock:
+            info.extend(quotes.get(symbol, ["", "", ""]))  # add price, changes and volume to info list
+
+        # Publish the sweep to the dashboard and the persistence subscribers (tick store, csv file)
+        feed.publish(time_stamp, [(symbol,) + tuple(values) for symbol, values in quotes.items() if values[0] != ""])
+
+        col = [time_stamp]  # new list with timestamp as first data
+        col.extend(info)  # add stock info to list
+        print(col)  # print stock data to console
+
+
+if __name__ == "__main__":
+    # Start and loop getting live data
+    # python get_data_selenium.py http://127.0.0.1:8000 reads the pages of a local fixture server instead
+    start_get_data_selenium(base_url=sys.argv[1] if len(sys.argv) > 1 else url_home)
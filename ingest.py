@@ -0,0 +1,161 @@
+import heapq
+import time
+from collections import Counter
+
+import pandas as pd
+
+import metrics
+
+NAN = float("nan")
+REORDER_WINDOW = 10  # seconds of market time a tick is held so that late ticks of a sweep are put back in order
+MAX_HOLD = 10  # wall seconds a tick is held at most, bounds the latency when no newer tick arrives
+DEDUP_WINDOW = 60  # seconds of market time in which a tick seen twice is dropped
+STALE_SHARED = 2  # a volume reported identically by this many stocks in one sweep is a stale copy
+
+
+class TickIngest:
+    """
+    Streaming clean-up of the ticks before the bar engines:
+    - reorder: ticks are held in a bounded window and released in time order, so the bars are extended in order
+    - duplicates: a tick seen twice (same time, price and volume) is dropped
+    - stale volumes: a volume repeated by several stocks in one sweep is copied from the one stock that really
+      reports it (the page field was not refreshed). Stocks that never reported a volume of their own get an
+      unknown (nan) volume instead of following the copies, whose jumps would drop their candles (negative
+      volume_diff): their candles are drawn without volume bars
+    - late ticks: a tick older than the ticks already released is passed on at once, the bar engine corrects
+      the bar it belongs to
+    """
+
+    def __init__(self, window=REORDER_WINDOW, max_hold=MAX_HOLD, dedup_window=DEDUP_WINDOW,
+                 stale_shared=STALE_SHARED):
+        """
+        :param window: reorder window in seconds of market time (0: release every tick at once)
+        :param max_hold: wall seconds a tick is held at most
+        :param dedup_window: seconds of market time in which duplicates are detected
+        :param stale_shared: number of stocks sharing a volume in one sweep for it to be stale (0: keep every volume)
+        """
+        self.window = pd.Timedelta(seconds=window).value
+        self.max_hold = max_hold
+        self.dedup_window = pd.Timedelta(seconds=dedup_window).value
+        self.stale_shared = stale_shared
+        self.watermark = None  # time of the newest tick in ns
+        self.sequence = 0  # arrival counter, keeps the file order of ticks with the same time
+        self.pending = {}  # symbol: heap of held ticks (time, sequence, price, change, volume, arrival)
+        self.released = {}  # symbol: time of the newest released tick
+        self.seen = {}  # symbol: dict time: set of (price, volume) of the ticks inside the dedup window
+        self.owners = set()  # stocks that reported volumes of their own
+        self.counts = Counter()  # number of dropped duplicates, late and stale ticks
+
+    def push(self, frames, now=None):
+        """
+        Add new ticks and release the ticks that left the reorder window
+        :param frames: dict symbol: dataframe indexed by time with the columns [symbol, "change", "volume"]
+        :param now: wall time in seconds (default: time.monotonic())
+        :return: dict symbol: dataframe of the released ticks in time order, same columns
+        """
+        now = time.monotonic() if now is None else now
+        columns = {symbol: (df.index.asi8, df[symbol].to_numpy(float), df["change"].to_numpy(),
+                            df["volume"].to_numpy(float)) for symbol, df in frames.items() if len(df)}
+
+        # Volumes shared by several stocks at the same time stamp
+        shared = Counter()
+        if self.stale_shared:
+            for times, _, _, volumes in columns.values():
+                shared.update(set(zip(times.tolist(), volumes.tolist())))
+
+        released = {}
+        for symbol, (times, prices, changes, volumes) in columns.items():
+            seen = self.seen.setdefault(symbol, {})
+            pending = self.pending.setdefault(symbol, [])
+            newest = self.released.get(symbol)
+            for tick_time, price, change, volume in zip(times.tolist(), prices.tolist(), changes, volumes.tolist()):
+                keys = seen.setdefault(tick_time, set())
+                if (price, volume) in keys:  # same tick read twice
+                    self.counts["duplicate"] += 1
+                    metrics.inc("ingest_ticks_total", kind="duplicate", symbol=symbol)
+                    continue
+                keys.add((price, volume))
+
+                if self.stale_shared and shared[(tick_time, volume)] >= self.stale_shared:
+                    if symbol not in self.owners:  # copied from another stock, the volume is unknown
+                        self.counts["stale"] += 1
+                        metrics.inc("ingest_ticks_total", kind="stale", symbol=symbol)
+                        volume = NAN
+                else:
+                    self.owners.add(symbol)
+
+                tick = (tick_time, self.sequence, price, change, volume, now)
+                self.sequence += 1
+                self.watermark = tick_time if self.watermark is None else max(self.watermark, tick_time)
+                if newest is not None and tick_time < newest:  # behind the released ticks, corrected by the engine
+                    self.counts["late"] += 1
+                    metrics.inc("ingest_ticks_total", kind="late", symbol=symbol)
+                    released.setdefault(symbol, []).append(tick)
+                else:
+                    heapq.heappush(pending, tick)
+
+        for symbol, pending in self.pending.items():
+            ticks = self.release(symbol, pending, now)
+            if ticks:
+                released.setdefault(symbol, []).extend(ticks)
+            self.prune(symbol)
+        return {symbol: self.ticks_frame(symbol, ticks) for symbol, ticks in released.items()}
+
+    def release(self, symbol, pending, now, flush=False):
+        """
+        Pop the held ticks of a stock that left the reorder window
+        :param symbol: stock symbol
+        :param pending: heap of held ticks
+        :param now: wall time in seconds
+        :param flush: release every held tick
+        :return: list of ticks in time order
+        """
+        if not pending:
+            return []
+        if flush or now - min(tick[-1] for tick in pending) >= self.max_hold:  # no newer tick came in time
+            cutoff = float("inf")
+        else:
+            cutoff = self.watermark - self.window
+        ticks = []
+        while pending and pending[0][0] <= cutoff:
+            ticks.append(heapq.heappop(pending))
+        if ticks:
+            self.released[symbol] = max(self.released.get(symbol, ticks[-1][0]), ticks[-1][0])
+        return ticks
+
+    def prune(self, symbol):
+        """
+        Forget the ticks that left the dedup window
+        :param symbol: stock symbol
+        """
+        seen = self.seen.get(symbol)
+        if seen and self.watermark is not None:
+            cutoff = self.watermark - self.dedup_window
+            for tick_time in [tick_time for tick_time in seen if tick_time < cutoff]:
+                del seen[tick_time]
+
+    def flush(self):
+        """
+        Release every held tick, ex: at the end of a replayed session
+        :return: dict symbol: dataframe of the released ticks in time order
+        """
+        released = {symbol: self.release(symbol, pending, 0, flush=True) for symbol, pending in self.pending.items()}
+        return {symbol: self.ticks_frame(symbol, ticks) for symbol, ticks in released.items() if ticks}
+
+    @property
+    def held(self):
+        """
+        :return: number of ticks held in the reorder window
+        """
+        return sum(len(pending) for pending in self.pending.values())
+
+    @staticmethod
+    def ticks_frame(symbol, ticks):
+        """
+        :param symbol: stock symbol, price column name
+        :param ticks: list of (time, sequence, price, change, volume, arrival)
+        :return: dataframe indexed by time with the columns [symbol, "change", "volume"]
+        """
+        index = pd.DatetimeIndex(pd.to_datetime([tick[0] for tick in ticks]), name="time")
+        return pd.DataFrame({symbol: [tick[2] for tick in ticks], "change": [tick[3] for tick in ticks],
+                             "volume": [tick[4] for tick in ticks]}, index=index)
@@ -0,0 +1,434 @@
+import atexit
+import csv
+import json
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from tick_store import TICK_DTYPE, make_records, format_price, format_change, format_volume
+
+FEED_PATH = os.environ.get("FEED_PATH", "stock_feed.sock")  # unix socket of the live feed
+QUEUE_SIZE = 1024  # messages buffered for a subscriber before it is dropped as too slow
+RECONNECT_DELAY = 1  # seconds between two connection attempts of a subscriber
+
+# Message: kind (1 byte), payload length (4 bytes), payload
+HEADER = struct.Struct("<cI")
+KIND_SYMBOLS = b"S"  # json list with the symbol name of every id
+KIND_TICKS = b"T"  # tick records (TICK_DTYPE)
+
+
+def encode(kind, payload):
+    """
+    :param kind: message kind
+    :param payload: bytes
+    :return: framed message
+    """
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def receive_exactly(sock, size):
+    """
+    Read a number of bytes from a socket
+    :param sock: connected socket
+    :param size: number of bytes
+    :return: bytes, None if the connection was closed
+    """
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+class FeedClient:
+    """
+    Connection of one subscriber process, written by its own thread so a slow subscriber never blocks the collector
+    """
+
+    def __init__(self, sock, queue_size=QUEUE_SIZE):
+        """
+        :param sock: accepted socket
+        :param queue_size: messages buffered before the subscriber is dropped
+        """
+        self.sock = sock
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        threading.Thread(target=self.write_loop, daemon=True).start()
+
+    def send(self, message):
+        """
+        Queue a message
+        :param message: framed message
+        """
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:  # subscriber does not keep up
+            print("Live feed: dropping a slow subscriber")
+            self.close()
+
+    def write_loop(self):
+        """
+        Send the queued messages
+        """
+        while not self.closed:
+            message = self.queue.get()
+            if message is None:
+                break
+            try:
+                self.sock.sendall(message)
+            except OSError:
+                break
+        self.close()
+
+    def close(self):
+        """
+        Close the connection
+        """
+        if not self.closed:
+            self.closed = True
+            try:
+                self.queue.put_nowait(None)  # wake up the writer thread
+            except queue.Full:
+                pass
+            self.sock.close()
+
+
+class FeedPublisher:
+    """
+    Publish every sweep of the collectors to the subscribers, in-process (persistence) and over a unix socket
+    (dashboard and any other consumer). Every sweep is sent as one message of fixed width tick records.
+    The in-process subscribers run on a writer thread, so a slow disk never delays the next sweep.
+    """
+
+    def __init__(self, path=FEED_PATH):
+        """
+        :param path: unix socket to listen on (None: in-process subscribers only)
+        """
+        self.path = path
+        self.symbols = []  # symbol name of every id used in the published records
+        self.symbol_ids = {}
+        self.callbacks = []  # in-process subscribers
+        self.writes = queue.Queue()  # sweeps not passed to the in-process subscribers yet, never dropped
+        self.writer = None  # thread running the in-process subscribers, started by the first subscribe()
+        self.clients = []  # subscriber connections
+        self.lock = threading.Lock()
+        self.server = None
+        if path:
+            if os.path.exists(path):
+                self.check_unused(path)
+                os.remove(path)  # socket left by a previous run
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(path)
+            self.server.listen()
+            threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    @staticmethod
+    def check_unused(path):
+        """
+        Refuse to take over the socket of a running collector, its subscribers would never get a tick again
+        :param path: existing unix socket
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:  # nobody listens, the socket was left by a stopped collector
+            return
+        finally:
+            sock.close()
+        raise RuntimeError("Live feed: another collector publishes on " + path)
+
+    def symbol_id(self, symbol):
+        """
+        Get the id of a symbol, register and announce it if it is new
+        :param symbol: stock symbol
+        :return: symbol id
+        """
+        if symbol not in self.symbol_ids:
+            self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self.broadcast(encode(KIND_SYMBOLS, json.dumps(self.symbols).encode()))
+        return self.symbol_ids[symbol]
+
+    def accept_loop(self):
+        """
+        Accept new subscribers, they get the symbol table first
+        """
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:  # server closed
+                break
+            client = FeedClient(sock)
+            with self.lock:
+                client.send(encode(KIND_SYMBOLS, json.dumps(self.symbols).encode()))
+                self.clients.append(client)
+
+    def subscribe(self, callback):
+        """
+        Add an in-process subscriber
+        :param callback: function(records, symbols) called on the writer thread with every published sweep
+        """
+        self.callbacks.append(callback)
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+            atexit.register(self.close)  # pending sweeps are written before the collector exits
+
+    def write_loop(self):
+        """
+        Pass the published sweeps to the in-process subscribers, in order
+        """
+        while True:
+            sweep = self.writes.get()
+            try:
+                if sweep is None:
+                    break
+                for callback in self.callbacks:
+                    try:
+                        callback(*sweep)
+                    except Exception as e:  # a failing subscriber does not stop the others or the next sweeps
+                        print("Live feed: subscriber failed: " + repr(e))
+            finally:
+                self.writes.task_done()
+
+    def flush(self):
+        """
+        Wait until the in-process subscribers got every published sweep
+        """
+        self.writes.join()
+
+    def broadcast(self, message):
+        """
+        Send a message to every subscriber connection
+        :param message: framed message
+        """
+        with self.lock:
+            self.clients = [client for client in self.clients if not client.closed]
+            for client in self.clients:
+                client.send(message)
+
+    def publish(self, time_stamp, quotes):
+        """
+        Publish one sweep
+        :param time_stamp: time stamp of the sweep
+        :param quotes: list of (symbol, price, change, volume) as returned by the scrapers
+        :return: published records
+        """
+        records = make_records(time_stamp, quotes, self.symbol_id)
+        self.publish_records(records)
+        return records
+
+    def publish_records(self, records):
+        """
+        Publish tick records
+        :param records: record array with the ids of this publisher
+        """
+        if not len(records):
+            return
+        with metrics.timer("publish_seconds"):
+            self.broadcast(encode(KIND_TICKS, records.tobytes()))
+        if self.callbacks:
+            self.writes.put((records, list(self.symbols)))  # symbols copied, new ones may be added meanwhile
+
+    def close(self):
+        """
+        Stop listening, close every subscriber connection and write the pending sweeps
+        """
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        if self.writer is not None:
+            self.writes.put(None)
+            self.writer.join()
+            self.writer = None
+        with self.lock:
+            for client in self.clients:
+                client.close()
+
+
+class FeedSubscriber:
+    """
+    Receive the ticks published on the unix socket in a background thread.
+    Symbol ids are converted into a local symbol table, so they stay valid when the collector restarts.
+    """
+
+    def __init__(self, path=FEED_PATH, reconnect=True):
+        """
+        :param path: unix socket of the publisher
+        :param reconnect: connect again when the publisher goes away
+        """
+        self.path = path
+        self.reconnect = reconnect
+        self.symbols = []  # local symbol table
+        self.symbol_ids = {}
+        self.pending = []  # received record arrays not drained yet
+        self.received = 0  # number of received records
+        self.lock = threading.Lock()
+        self.event = threading.Event()  # set when records are pending
+        self.connected = False
+        self.sock = self.connect()  # raises when no publisher is listening
+        threading.Thread(target=self.read_loop, daemon=True).start()
+
+    def connect(self):
+        """
+        :return: socket connected to the publisher
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.connected = True
+        return sock
+
+    def local_id(self, symbol):
+        """
+        :param symbol: stock symbol
+        :return: id of the symbol in the local symbol table
+        """
+        with self.lock:
+            if symbol not in self.symbol_ids:
+                self.symbol_ids[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            return self.symbol_ids[symbol]
+
+    def read_loop(self):
+        """
+        Receive messages until the connection is closed
+        """
+        remote = np.zeros(1, dtype=np.int32)  # local id of every publisher id
+        while True:
+            header = payload = None
+            try:
+                header = receive_exactly(self.sock, HEADER.size) if self.sock is not None else None
+                if header is not None:
+                    kind, size = HEADER.unpack(header)
+                    payload = receive_exactly(self.sock, size)
+            except OSError:  # closed by close()
+                pass
+            if payload is None:  # publisher went away
+                self.connected = False
+                if not self.reconnect:
+                    break
+                time.sleep(RECONNECT_DELAY)
+                try:
+                    self.sock = self.connect()
+                except OSError:
+                    self.sock = None
+                continue
+
+            if kind == KIND_SYMBOLS:
+                remote = np.array([self.local_id(symbol) for symbol in json.loads(payload)] or [0], dtype=np.int32)
+            elif kind == KIND_TICKS:
+                records = np.frombuffer(payload, dtype=TICK_DTYPE).copy()
+                records["symbol"] = remote[records["symbol"]]
+                with self.lock:
+                    self.pending.append(records)
+                    self.received += len(records)
+                self.event.set()
+
+    def drain(self):
+        """
+        Take the records received since the last call
+        :return: record array with local symbol ids
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.event.clear()
+        if not pending:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return pending[0] if len(pending) == 1 else np.concatenate(pending)
+
+    def close(self):
+        """
+        Stop receiving
+        """
+        self.reconnect = False
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+    def wait(self, timeout=None):
+        """
+        Wait for new records
+        :param timeout: seconds
+        :return: record array, empty after the timeout
+        """
+        self.event.wait(timeout)
+        return self.drain()
+
+
+def store_writer(store):
+    """
+    Persistence subscriber appending every sweep to a tick store
+    :param store: TickStore
+    :return: callback for FeedPublisher.subscribe
+    """
+    def write(records, symbols):
+        with metrics.timer("store_write_seconds"):
+            store.append_records(store.remap(records, symbols))
+    return write
+
+
+def csv_writer(filename, symbols):
+    """
+    Persistence subscriber appending every sweep to the wide csv file (index, time, price, change, volume, ...)
+    :param filename: csv file name
+    :param symbols: symbols of the csv columns, in order
+    :return: callback for FeedPublisher.subscribe
+    """
+    positions = {symbol: n for n, symbol in enumerate(symbols)}
+
+    def write(records, feed_symbols):
+        with metrics.timer("csv_write_seconds"):
+            row = [0, pd.Timestamp(int(records["time"][0])).strftime("%Y-%m-%d %H:%M:%S")] + [""] * (len(symbols) * 3)
+            for record in records:
+                position = positions.get(feed_symbols[record["symbol"]])
+                if position is not None:
+                    row[2 + position * 3] = format_price(record["price"])
+                    row[3 + position * 3] = format_change(record["change"], record["pct"])
+                    row[4 + position * 3] = format_volume(record["volume"])
+            with open(filename, "a", newline="") as f:
+                csv.writer(f).writerow(row)
+    return write
+
+
+def start_feed(store, csv_name=None, symbols=None, path=FEED_PATH):
+    """
+    Create the live feed of a collector with its persistence subscribers
+    :param store: TickStore or PartitionedTickStore
+    :param csv_name: csv file (None: no csv)
+    :param symbols: symbols of the csv columns
+    :param path: unix socket of the feed (None: no socket, persistence only)
+    :return: FeedPublisher
+    """
+    try:
+        feed = FeedPublisher(path)
+    except (OSError, AttributeError) as e:  # no unix sockets on this system
+        print("Live feed disabled: " + repr(e))
+        feed = FeedPublisher(None)
+    feed.subscribe(store_writer(store))
+    if csv_name:
+        feed.subscribe(csv_writer(csv_name, symbols))
+    return feed
+
+
+if __name__ == "__main__":
+    # Usage: python live_feed.py [socket]  prints the ticks published by a running collector
+    subscriber = FeedSubscriber(sys.argv[1] if len(sys.argv) > 1 else FEED_PATH)
+    while True:
+        for record in subscriber.wait():
+            print(pd.Timestamp(int(record["time"])), subscriber.symbols[record["symbol"]], format_price(record["price"]),
+                  format_change(record["change"], record["pct"]), format_volume(record["volume"]))
@@ -0,0 +1,176 @@
+import argparse
+import csv
+import datetime
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark import generate_session, symbol_names
+from live_feed import FeedPublisher
+
+
+class Viewer:
+    """
+    Simulated browser: reads the event stream of the web dashboard in its own thread
+    """
+
+    def __init__(self, host, port):
+        """
+        :param host: host of the web dashboard
+        :param port: port of the web dashboard
+        """
+        self.connection = http.client.HTTPConnection(host, port)
+        self.events = 0  # number of received events
+        self.bytes = 0  # number of received bytes
+        self.closed = False
+        threading.Thread(target=self.read_loop, daemon=True).start()
+
+    def read_loop(self):
+        """
+        Count the received events until the viewer is closed
+        """
+        try:
+            self.connection.request("GET", "/events")
+            response = self.connection.getresponse()
+            while not self.closed:
+                line = response.fp.readline()
+                if not line:
+                    break
+                self.bytes += len(line)
+                if line.startswith(b"event:"):
+                    self.events += 1
+        except OSError:  # closed by close()
+            pass
+
+    def close(self):
+        """
+        Disconnect
+        """
+        self.closed = True
+        try:
+            self.connection.sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, AttributeError):
+            pass
+        self.connection.close()
+
+
+def server_stats(host, port):
+    """
+    :param host: host of the web dashboard
+    :param port: port of the web dashboard
+    :return: dict with the cpu time, viewers and published events of the server
+    """
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    connection.request("GET", "/stats")
+    stats = json.loads(connection.getresponse().read())
+    connection.close()
+    return stats
+
+
+def replay(feed, filename, names, interval, stop):
+    """
+    Publish the sweeps of a session file at a fixed rate
+    :param feed: FeedPublisher
+    :param filename: session file written by benchmark.generate_session
+    :param names: symbols of the columns
+    :param interval: seconds between two sweeps
+    :param stop: threading.Event ending the replay
+    """
+    with open(filename, newline="") as f:
+        for row in csv.reader(f):
+            if stop.is_set():
+                break
+            quotes = [(name,) + tuple(row[2 + n * 3:5 + n * 3]) for n, name in enumerate(names)]
+            feed.publish(row[1], [quote for quote in quotes if quote[1] != ""])
+            time.sleep(interval)
+
+
+def run_load_test(levels, duration, interval, symbols):
+    """
+    Start a web dashboard fed by a replayed session and measure its cpu usage with more and more viewers
+    :param levels: numbers of viewers, ex: [1, 10, 50, 100]
+    :param duration: seconds measured per level
+    :param interval: seconds between two published sweeps
+    :param symbols: number of stocks
+    :return: list with the result of every level
+    """
+    folder = tempfile.mkdtemp(prefix="stock_load_")
+    names = symbol_names(symbols)
+    with open(os.path.join(folder, "symbols.json"), "w") as f:
+        json.dump({"symbols": names}, f)
+    session = os.path.join(folder, "session.csv")
+    generate_session(session, rows=int(len(levels) * (duration + 2) / interval) + 100, symbols=symbols)
+
+    path = os.path.join(folder, "feed.sock")
+    feed = FeedPublisher(path)
+    env = dict(os.environ, FEED_PATH=path, SYMBOLS_FILE=os.path.join(folder, "symbols.json"))
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "web_dashboard.py"), "--port", "0"],
+                              cwd=folder, env=env, stdout=subprocess.PIPE, text=True)
+    stop = threading.Event()
+    results = []
+    try:
+        url = server.stdout.readline().split()[-1]  # "Serving the dashboard on http://127.0.0.1:<port>/"
+        host, port = url.split("//")[1].strip("/").split(":")
+        port = int(port)
+        threading.Thread(target=replay, args=(feed, session, names, interval, stop), daemon=True).start()
+
+        for level in levels:
+            viewers = [Viewer(host, port) for _ in range(level)]
+            time.sleep(1)  # every viewer connected and got its snapshot
+            before, start = server_stats(host, port), time.perf_counter()
+            events = [viewer.events for viewer in viewers]
+            time.sleep(duration)
+            after, elapsed = server_stats(host, port), time.perf_counter() - start
+            received = [viewer.events - n for viewer, n in zip(viewers, events)]
+            results.append({
+                "viewers": level,
+                "connected": after["viewers"],
+                "server_cpu_percent": round((after["cpu_seconds"] - before["cpu_seconds"]) / elapsed * 100, 2),
+                "published_events": after["events"] - before["events"],
+                "min_events_per_viewer": min(received),
+                "mean_bytes_per_viewer": round(sum(viewer.bytes for viewer in viewers) / level),
+            })
+            print(results[-1])
+            for viewer in viewers:
+                viewer.close()
+            time.sleep(1)  # viewers disconnected
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait()
+        feed.close()
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python load_test.py --viewers 1,10,50,100 --duration 10 --output load.json
+    parser = argparse.ArgumentParser(description="Load test of the web dashboard with simulated viewers")
+    parser.add_argument("--viewers", default="1,10,50,100", help="numbers of viewers, comma separated")
+    parser.add_argument("--duration", type=float, default=10, help="seconds measured per number of viewers")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between two published sweeps")
+    parser.add_argument("--symbols", type=int, default=7, help="number of stocks")
+    parser.add_argument("--output", default="", help="json file of the results (default: print)")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.viewers.split(",")]
+    output = json.dumps({
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {"viewers": levels, "duration": args.duration, "interval": args.interval, "symbols": args.symbols},
+        "results": run_load_test(levels, args.duration, args.interval, args.symbols),
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,357 @@
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Exporters, configured from the environment so every process (scrapers, dashboard) can have its own
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # serve the metrics on http://127.0.0.1:<port>/metrics
+METRICS_FILE = os.environ.get("METRICS_FILE", "")  # append a json snapshot of the metrics to this file
+METRICS_INTERVAL = 10  # seconds between two json snapshots
+METRICS_MAX_BYTES = 10 * 1024 * 1024  # size of the json lines file before it is rotated
+METRICS_BACKUPS = 3  # number of rotated json lines files kept
+
+ENABLED = bool(METRICS_PORT or METRICS_FILE)  # timers are no-ops when disabled
+PREFIX = "stock_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # histogram bounds in s
+
+lock = threading.Lock()
+histograms = {}  # (name, labels): Histogram
+counters = {}  # (name, labels): value
+gauges = {}  # (name, labels): value
+last_quotes = {}  # symbol: last retrieved quote, to detect stale values
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values with fixed bucket bounds (Prometheus layout)
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        :param buckets: upper bounds of the buckets, sorted
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """
+        Add a value
+        :param value: observed value
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile from the buckets
+        :param q: quantile between 0 and 1
+        :return: upper bound of the bucket holding the quantile
+        """
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Timer:
+    """
+    Context manager recording the duration of a block into a histogram
+    """
+
+    def __init__(self, name, labels):
+        """
+        :param name: histogram name
+        :param labels: dict of labels
+        """
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class NullTimer:
+    """
+    Timer doing nothing, returned when the metrics are disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def label_key(labels):
+    """
+    :param labels: dict of labels
+    :return: hashable and sorted labels
+    """
+    return tuple(sorted(labels.items()))
+
+
+def timer(name, **labels):
+    """
+    Time a block: with metrics.timer("fetch_seconds", symbol="AAPL"): ...
+    :param name: histogram name
+    :param labels: labels of the measure, ex: symbol="AAPL"
+    :return: context manager
+    """
+    return Timer(name, labels) if ENABLED else NULL_TIMER
+
+
+def timed(name, **labels):
+    """
+    Decorator timing every call of a function
+    :param name: histogram name
+    :param labels: labels of the measure
+    :return: decorator
+    """
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with Timer(name, labels):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def observe(name, value, **labels):
+    """
+    Add a value to a histogram
+    :param name: histogram name
+    :param value: observed value
+    :param labels: labels of the measure
+    """
+    if not ENABLED:
+        return
+    key = (name, label_key(labels))
+    with lock:
+        if key not in histograms:
+            histograms[key] = Histogram()
+        histograms[key].observe(value)
+
+
+def inc(name, value=1, **labels):
+    """
+    Increase a counter
+    :param name: counter name, ex: "fetch_failures_total"
+    :param value: increment
+    :param labels: labels of the counter
+    """
+    if not ENABLED:
+        return
+    key = (name, label_key(labels))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """
+    Set a gauge
+    :param name: gauge name, ex: "last_success_timestamp"
+    :param value: new value
+    :param labels: labels of the gauge
+    """
+    if not ENABLED:
+        return
+    with lock:
+        gauges[(name, label_key(labels))] = value
+
+
+def record_quote(symbol, values):
+    """
+    Record the result of a fetch: failures, time of the last success and
+    number of successive sweeps the quote did not change (stale page or closed market)
+    :param symbol: stock symbol
+    :param values: (price, change, volume), None if the fetch failed
+    """
+    if not ENABLED:
+        return
+    if values is None:
+        inc("fetch_failures_total", symbol=symbol)
+        return
+    values = tuple(values)
+    set_gauge("last_success_timestamp", time.time(), symbol=symbol)
+    with lock:
+        key = ("unchanged_sweeps", label_key({"symbol": symbol}))
+        gauges[key] = gauges.get(key, 0) + 1 if last_quotes.get(symbol) == values else 0
+        last_quotes[symbol] = values
+
+
+def format_labels(labels, extra=()):
+    """
+    :param labels: sorted (name, value) pairs
+    :param extra: additional pairs, ex: (("le", "0.5"),)
+    :return: Prometheus label text, ex: {symbol="AAPL"}
+    """
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (key, str(value).replace('"', '\\"')) for key, value in pairs) + "}"
+
+
+def render_prometheus():
+    """
+    :return: every metric in the Prometheus text format
+    """
+    lines = []
+    with lock:
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append("# TYPE %s%s counter" % (PREFIX, name))
+                typed.add(name)
+            lines.append("%s%s%s %s" % (PREFIX, name, format_labels(labels), value))
+        for (name, labels), value in sorted(gauges.items()):
+            if name not in typed:
+                lines.append("# TYPE %s%s gauge" % (PREFIX, name))
+                typed.add(name)
+            lines.append("%s%s%s %s" % (PREFIX, name, format_labels(labels), value))
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name not in typed:
+                lines.append("# TYPE %s%s histogram" % (PREFIX, name))
+                typed.add(name)
+            total = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                total += count
+                lines.append("%s%s_bucket%s %d" % (PREFIX, name, format_labels(labels, (("le", bound),)), total))
+            lines.append("%s%s_sum%s %r" % (PREFIX, name, format_labels(labels), histogram.sum))
+            lines.append("%s%s_count%s %d" % (PREFIX, name, format_labels(labels), histogram.count))
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """
+    :return: dict with the current value of every metric, histograms summarized
+    """
+    def key_name(name, labels):
+        return name + format_labels(labels)
+
+    with lock:
+        return {
+            "time": time.time(),
+            "counters": {key_name(*key): value for key, value in counters.items()},
+            "gauges": {key_name(*key): value for key, value in gauges.items()},
+            "histograms": {key_name(*key): {"count": h.count, "sum": h.sum, "max": h.max,
+                                            "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                           for key, h in histograms.items()},
+        }
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serve the metrics in the Prometheus text format on /metrics
+    """
+
+    def do_GET(self):
+        """
+        Handle a GET request
+        """
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        Keep the console quiet
+        """
+
+
+def serve_metrics(port=METRICS_PORT):
+    """
+    Start a local http server with the metrics in a background thread
+    :param port: port to listen on (0: any free port)
+    :return: (server, url of the metrics)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d/metrics" % server.server_address[1]
+
+
+def rotate(path, backups=METRICS_BACKUPS):
+    """
+    Rotate a file: path -> path.1 -> path.2 ..., the oldest one is removed
+    :param path: file name
+    :param backups: number of rotated files kept
+    """
+    for n in range(backups - 1, 0, -1):
+        if os.path.exists("%s.%d" % (path, n)):
+            os.replace("%s.%d" % (path, n), "%s.%d" % (path, n + 1))
+    if os.path.exists(path):
+        os.replace(path, path + ".1" if backups else path + ".old")
+
+
+def write_jsonl(path=METRICS_FILE, max_bytes=METRICS_MAX_BYTES, backups=METRICS_BACKUPS):
+    """
+    Append a snapshot of the metrics to a json lines file, rotated when it gets too large
+    :param path: file name
+    :param max_bytes: size of the file before it is rotated
+    :param backups: number of rotated files kept
+    """
+    if os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+        rotate(path, backups)
+    with open(path, "a") as f:
+        f.write(json.dumps(snapshot()) + "\n")
+
+
+def start_jsonl(path=METRICS_FILE, interval=METRICS_INTERVAL):
+    """
+    Write a snapshot of the metrics every interval in a background thread
+    :param path: file name
+    :param interval: seconds between two snapshots
+    :return: thread
+    """
+    def loop():
+        while True:
+            time.sleep(interval)
+            write_jsonl(path)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def start(port=METRICS_PORT, path=METRICS_FILE):
+    """
+    Enable the metrics and start the configured exporters, does nothing when none is configured
+    :param port: port of the Prometheus endpoint (0: no endpoint)
+    :param path: json lines file (empty: no file)
+    """
+    global ENABLED
+    if not (port or path):
+        return
+    ENABLED = True
+    if port:
+        server, url = serve_metrics(port)
+        print("Serving metrics on " + url)
+    if path:
+        start_jsonl(path)
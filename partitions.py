@@ -0,0 +1,331 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from tick_store import TICK_DTYPE, TickStore
+
+PARTITION = "day"  # "day" or "hour"
+KEY_FORMATS = {"day": "%Y-%m-%d", "hour": "%Y-%m-%d_%H"}
+PERIODS = {"day": pd.Timedelta(days=1), "hour": pd.Timedelta(hours=1)}
+CACHE_PARTITIONS = 8  # number of compacted partitions kept in memory
+
+
+class PartitionedTickStore(TickStore):
+    """
+    Tick store split into one partition per day (or hour) of market time.
+    The open partition is an append-only raw file (<key>.ticks), closed partitions are compacted into
+    compressed columnar files (<key>.npz) listed with their min/max time stamps in catalog.json.
+    A range query only opens the partitions overlapping the requested time range.
+    Records of a partition keep their arrival order, so a reader can tail a partition by record number.
+    """
+
+    def __init__(self, directory, partition=PARTITION):
+        """
+        :param directory: folder of the partitions, ex: "stock_data"
+        :param partition: "day" or "hour"
+        """
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(os.path.join(directory, "ticks"), os.path.join(directory, "symbols.json"))
+        self.directory = directory
+        self.partition = partition
+        self.catalog_path = os.path.join(directory, "catalog.json")
+        self.active = None  # key of the partition written last
+        self.cache = {}  # key: (rows, columns) of compacted partitions
+
+    # --- Partitions ---
+
+    def key(self, time_ns):
+        """
+        :param time_ns: time stamp in ns
+        :return: key of the partition holding the time stamp
+        """
+        return pd.Timestamp(int(time_ns)).strftime(KEY_FORMATS[self.partition])
+
+    def bounds(self, key):
+        """
+        :param key: partition key
+        :return: (first, last) time stamp in ns the partition can hold
+        """
+        partition = "hour" if "_" in key else "day"  # from the key, a reader may not know how the store was split
+        start = pd.Timestamp(pd.to_datetime(key, format=KEY_FORMATS[partition]))
+        return start.value, (start + PERIODS[partition]).value - 1
+
+    def raw_path(self, key):
+        """
+        :param key: partition key
+        :return: file of the raw (open) part of a partition
+        """
+        return os.path.join(self.directory, key + ".ticks")
+
+    def compact_path(self, key):
+        """
+        :param key: partition key
+        :return: file of the compacted part of a partition
+        """
+        return os.path.join(self.directory, key + ".npz")
+
+    def load_catalog(self):
+        """
+        :return: dict key: {"rows", "min_time", "max_time", "symbols"} of the compacted partitions
+        """
+        if not os.path.exists(self.catalog_path):
+            return {}
+        with open(self.catalog_path) as f:
+            return json.load(f)
+
+    def save_catalog(self, catalog):
+        """
+        Replace the catalog atomically
+        :param catalog: dict key: partition metadata
+        """
+        temp = self.catalog_path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(catalog, f, indent=1, sort_keys=True)
+        os.replace(temp, self.catalog_path)
+
+    def keys(self):
+        """
+        :return: sorted keys of every partition, compacted or raw
+        """
+        keys = set(self.load_catalog())
+        keys.update(name[:-6] for name in os.listdir(self.directory) if name.endswith(".ticks"))
+        return sorted(keys)
+
+    def raw_store(self, key):
+        """
+        :param key: partition key
+        :return: TickStore of the raw file of a partition, sharing the symbols of the directory
+        """
+        return TickStore(self.raw_path(key), self.symbols_path)
+
+    def partition_length(self, key, catalog=None):
+        """
+        :param key: partition key
+        :param catalog: loaded catalog (optional)
+        :return: number of records of a partition
+        """
+        catalog = self.load_catalog() if catalog is None else catalog
+        return catalog.get(key, {}).get("rows", 0) + len(self.raw_store(key))
+
+    def load_compacted(self, key, rows):
+        """
+        Load a compacted partition, cached since closed partitions do not change
+        :param key: partition key
+        :param rows: number of rows listed in the catalog
+        :return: dict of column arrays
+        """
+        cached = self.cache.get(key)
+        if cached is None or cached[0] != rows:
+            with np.load(self.compact_path(key)) as data:
+                columns = {name: data[name] for name in data.files}
+            if len(self.cache) >= CACHE_PARTITIONS:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[key] = cached = (rows, columns)
+        return cached[1]
+
+    def read_partition(self, key, start=0, stop=None, catalog=None):
+        """
+        Read records of a partition in arrival order
+        :param key: partition key
+        :param start: first record
+        :param stop: end record (default: all records)
+        :param catalog: loaded catalog (optional)
+        :return: record array
+        """
+        catalog = self.load_catalog() if catalog is None else catalog
+        rows = catalog.get(key, {}).get("rows", 0)
+        parts = []
+        if rows and start < rows:
+            columns = self.load_compacted(key, rows)
+            compacted = np.zeros(rows, dtype=TICK_DTYPE)
+            for name in TICK_DTYPE.names:
+                compacted[name] = columns[name][:rows]
+            parts.append(compacted[start:stop])
+        raw = self.raw_store(key)
+        raw_stop = None if stop is None else max(0, stop - rows)
+        if raw_stop is None or raw_stop > 0:
+            parts.append(np.array(raw.read(max(0, start - rows), raw_stop), dtype=TICK_DTYPE))
+        if not parts:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read_symbol_partition(self, key, symbol_id, catalog=None):
+        """
+        Read the records of one symbol in a partition, the compacted part is sliced with the symbol offsets
+        :param key: partition key
+        :param symbol_id: symbol id
+        :param catalog: loaded catalog (optional)
+        :return: record array in arrival order
+        """
+        catalog = self.load_catalog() if catalog is None else catalog
+        rows = catalog.get(key, {}).get("rows", 0)
+        parts = []
+        if rows and symbol_id in catalog[key]["symbols"]:
+            columns = self.load_compacted(key, rows)
+            offsets = columns["symbol_offsets"]
+            positions = columns["symbol_order"][offsets[symbol_id]:offsets[symbol_id + 1]]
+            selected = np.zeros(len(positions), dtype=TICK_DTYPE)
+            for name in TICK_DTYPE.names:
+                selected[name] = columns[name][positions]
+            parts.append(selected)
+        raw = self.raw_store(key).read()
+        parts.append(np.array(raw[raw["symbol"] == symbol_id], dtype=TICK_DTYPE))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    # --- Writing ---
+
+    def append_records(self, records):
+        """
+        Append records to the partitions of their time stamps.
+        When the market time moves to a new partition, the previous partitions are compacted.
+        :param records: record array with TICK_DTYPE
+        """
+        records = records.astype(TICK_DTYPE, copy=False)
+        keys = np.array([self.key(t) for t in records["time"]]) if len(records) else np.empty(0)
+        for key in sorted(set(keys.tolist())):
+            self.raw_store(key).append_records(records[keys == key])
+        if len(records):
+            newest = max(keys.tolist())
+            if self.active is None or newest > self.active:  # new partition (or first write of this process)
+                self.compact(before=newest)
+                self.active = newest
+
+    def compact(self, before=None):
+        """
+        Compact the raw partitions into compressed columnar files
+        :param before: only compact the partitions with a smaller key (default: all but the newest one)
+        """
+        keys = [key for key in self.keys() if os.path.exists(self.raw_path(key))]
+        if before is None:
+            before = max(keys) if keys else ""
+        catalog = self.load_catalog()
+        for key in keys:
+            if key < before:
+                self.compact_partition(key, catalog)
+
+    def compact_partition(self, key, catalog):
+        """
+        Merge the raw file of a partition into its compacted file, records keep their arrival order
+        :param key: partition key
+        :param catalog: loaded catalog, updated in place and saved
+        """
+        records = self.read_partition(key, catalog=catalog)
+        if not len(records):
+            os.remove(self.raw_path(key))
+            return
+        symbol_order = np.argsort(records["symbol"], kind="stable")  # records of every symbol, in arrival order
+        symbol_offsets = np.searchsorted(records["symbol"][symbol_order], np.arange(records["symbol"].max() + 2))
+
+        temp = self.compact_path(key) + ".tmp.npz"
+        np.savez_compressed(temp, **{name: records[name] for name in TICK_DTYPE.names},
+                            symbol_order=symbol_order, symbol_offsets=symbol_offsets)
+        os.replace(temp, self.compact_path(key))
+        os.remove(self.raw_path(key))
+        catalog[key] = {"rows": len(records), "min_time": int(records["time"].min()),
+                        "max_time": int(records["time"].max()),
+                        "symbols": np.unique(records["symbol"]).tolist()}
+        self.save_catalog(catalog)
+        self.cache.pop(key, None)
+
+    # --- Reading ---
+
+    def overlapping(self, start=None, end=None, catalog=None):
+        """
+        Keys of the partitions that may hold ticks between two time stamps, from the catalog metadata
+        :param start: first time stamp in ns (None: no lower bound)
+        :param end: last time stamp in ns (None: no upper bound)
+        :param catalog: loaded catalog (optional)
+        :return: sorted keys
+        """
+        catalog = self.load_catalog() if catalog is None else catalog
+        keys = []
+        for key in self.keys():
+            low, high = self.bounds(key)
+            if key in catalog and not os.path.exists(self.raw_path(key)):  # exact bounds of closed partitions
+                low, high = catalog[key]["min_time"], catalog[key]["max_time"]
+            if (start is None or high >= start) and (end is None or low <= end):
+                keys.append(key)
+        return keys
+
+    def read_range(self, start=None, end=None, symbols=None):
+        """
+        Read the ticks between two time stamps, only the overlapping partitions are opened
+        :param start: first time stamp (string, datetime or ns, None: no lower bound)
+        :param end: last time stamp (None: no upper bound)
+        :param symbols: symbols to read (default: all)
+        :return: record array sorted by partition, in arrival order inside a partition
+        """
+        start = None if start is None else pd.Timestamp(start).value
+        end = None if end is None else pd.Timestamp(end).value
+        catalog = self.load_catalog()
+        ids = None if symbols is None else [self.symbol_ids[s] for s in symbols if s in self.symbol_ids]
+
+        parts = []
+        for key in self.overlapping(start, end, catalog):
+            if ids is None:
+                records = self.read_partition(key, catalog=catalog)
+            else:
+                records = [self.read_symbol_partition(key, symbol_id, catalog) for symbol_id in ids]
+                records = np.concatenate(records) if records else np.empty(0, dtype=TICK_DTYPE)
+            mask = np.ones(len(records), dtype=bool)
+            if start is not None:
+                mask &= records["time"] >= start
+            if end is not None:
+                mask &= records["time"] <= end
+            parts.append(records[mask])
+        if not parts:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return np.concatenate(parts)
+
+    def latest_time(self):
+        """
+        :return: time stamp in ns of the newest tick, None if the store is empty
+        """
+        catalog = self.load_catalog()
+        for key in reversed(self.keys()):
+            records = self.raw_store(key).read()
+            if len(records):
+                return int(records["time"].max())
+            if key in catalog:
+                return catalog[key]["max_time"]
+        return None
+
+    def __len__(self):
+        """
+        :return: number of records of every partition
+        """
+        catalog = self.load_catalog()
+        return sum(self.partition_length(key, catalog) for key in self.keys())
+
+    def read(self, start=0, stop=None):
+        """
+        Read records of every partition (used by the export)
+        :param start: first record
+        :param stop: end record
+        :return: record array
+        """
+        return self.read_range()[start:stop]
+
+    def read_symbol(self, symbol, index=None):
+        """
+        :param symbol: stock symbol
+        :param index: unused, the partitions hold their own symbol offsets
+        :return: record array of the symbol
+        """
+        return self.read_range(symbols=[symbol])
+
+
+if __name__ == "__main__":
+    # Usage: python partitions.py import stock_data.ticks stock_data   split a single store into partitions
+    #        python partitions.py compact stock_data                   compact every partition but the newest one
+    command = sys.argv[1]
+    if command == "import":
+        source = TickStore(sys.argv[2])
+        target = PartitionedTickStore(sys.argv[3])
+        target.append_records(target.remap(source.read(), source.symbols))
+        target.compact()
+    elif command == "compact":
+        PartitionedTickStore(sys.argv[2]).compact()
@@ -0,0 +1,223 @@
+import argparse
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")  # headless frames, set before the dashboard creates its figure
+
+import matplotlib.pyplot as plt
+
+import metrics
+
+RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # render processes, the main process reads the ticks
+RENDER_FORMAT = "png"  # "png" or "svg"
+CACHE_SIZE = 64  # rendered frames kept, keyed by data version and latest quote
+FOCUS_SIZE = (6, 4.5)  # size of a focus chart in inches
+
+focus = None  # (figure, (ax1, ax8, ax9)) of a focus chart, created once per worker
+
+
+def init_worker():
+    """
+    Start a render process: Agg backend before the dashboard module creates its figure
+    """
+    matplotlib.use("Agg")
+
+
+def figure_bytes(figure, fmt=RENDER_FORMAT, dpi=None):
+    """
+    :param figure: figure to save
+    :param fmt: "png" or "svg"
+    :param dpi: resolution (default: dpi of the figure)
+    :return: image bytes
+    """
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt, dpi=dpi, facecolor=figure.get_facecolor())
+    return buffer.getvalue()
+
+
+def focus_figure():
+    """
+    Figure with the layout of the focus chart: candles, volume bars and rsi line
+    :return: (figure, (ax1, ax8, ax9))
+    """
+    global focus
+    if focus is None:
+        figure = plt.figure(figsize=FOCUS_SIZE, dpi=100)
+        figure.patch.set_facecolor("#121416")  # same face color as the dashboard
+        gs = figure.add_gridspec(6, 1)
+        focus = figure, (figure.add_subplot(gs[0:4, 0]), figure.add_subplot(gs[4, 0]), figure.add_subplot(gs[5, 0]))
+    return focus
+
+
+def render_board(shown, all_data, freq, fmt=RENDER_FORMAT, dpi=None):
+    """
+    Render the whole dashboard, runs in a render process
+    :param shown: stock in focus, then the stocks of the small windows
+    :param all_data: (data, latest_price, latest_change, volume) of every shown stock
+    :param freq: timeframe of the focus data
+    :param fmt: "png" or "svg"
+    :param dpi: resolution
+    :return: image bytes
+    """
+    import dashboard
+    dashboard.draw_board(shown, all_data, freq)
+    return figure_bytes(dashboard.fig, fmt, dpi)
+
+
+def render_focus(symbol, stock, freq, fmt=RENDER_FORMAT, dpi=None):
+    """
+    Render the focus chart of one stock, runs in a render process
+    :param symbol: stock symbol
+    :param stock: (data, latest_price, latest_change, volume)
+    :param freq: timeframe of the data
+    :param fmt: "png" or "svg"
+    :param dpi: resolution
+    :return: image bytes
+    """
+    import dashboard
+    figure, axes = focus_figure()
+    for ax in axes:
+        ax.clear()
+    dashboard.draw_focus(*axes, symbol, *stock, freq)
+    return figure_bytes(figure, fmt, dpi)
+
+
+class RenderService:
+    """
+    Render dashboard frames without a window.
+    The ticks are read once in this process (shared snapshot and bar caches of the dashboard module),
+    the frames are drawn by a pool of processes so several frames render at the same time despite the GIL.
+    Frames are cached by data version: a request for data that did not change returns the cached bytes,
+    identical requests arriving together share one render.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, cache_size=CACHE_SIZE):
+        """
+        :param workers: number of render processes
+        :param cache_size: number of frames kept
+        """
+        import dashboard
+        self.dashboard = dashboard
+        # spawn: fresh processes, a fork of a process with a gui backend is not safe
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=init_worker)
+        self.cache_size = cache_size
+        # (kind, symbols, freq, fmt, dpi, (version, latest quote) of the stocks): future with the image bytes
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()  # the snapshot and the bar caches are not thread safe
+
+    def prepare(self, symbols, focus_freq, freq="1Min"):
+        """
+        Read the new ticks and prepare the data of some stocks
+        :param symbols: stocks
+        :param focus_freq: timeframe of the first stock
+        :param freq: timeframe of the other stocks
+        :return: (list of (data, latest_price, latest_change, volume), data version of every stock)
+        """
+        all_data = self.dashboard.read_snapshot_ohlc(symbols, focus_freq, freq)
+        # A held tick changes the latest quote of the texts without changing the bars
+        return all_data, tuple((self.dashboard.engines[symbol].version, self.dashboard.latest.get(symbol))
+                               for symbol in symbols)
+
+    def submit(self, key, function, *args):
+        """
+        Get the render of a frame from the cache or start it in the pool
+        :param key: cache key with the data version
+        :param function: render function
+        :param args: arguments of the render function
+        :return: future with the image bytes
+        """
+        future = self.cache.get(key)
+        if future is not None and not (future.done() and future.exception()):
+            self.cache.move_to_end(key)
+            metrics.inc("render_cache_hits_total", kind=key[0])
+            return future
+        future = self.executor.submit(function, *args)
+        self.cache[key] = future
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return future
+
+    def board(self, symbols=None, freq=None, fmt=RENDER_FORMAT, dpi=None):
+        """
+        Render the dashboard
+        :param symbols: stock in focus, then the stocks of the small windows (default: dashboard.shown_symbols())
+        :param freq: timeframe of the focus chart (default: dashboard.TIMEFRAME)
+        :param fmt: "png" or "svg"
+        :param dpi: resolution
+        :return: image bytes
+        """
+        freq = freq or self.dashboard.TIMEFRAME
+        with self.lock:
+            symbols = list(symbols or self.dashboard.shown_symbols())
+            all_data, versions = self.prepare(symbols, freq)
+            future = self.submit(("board", tuple(symbols), freq, fmt, dpi, versions), render_board, symbols,
+                                 all_data, freq, fmt, dpi)
+        with metrics.timer("render_seconds", kind="board"):
+            return future.result()
+
+    def focus(self, symbol, freq=None, fmt=RENDER_FORMAT, dpi=None):
+        """
+        Render the focus chart of a stock
+        :param symbol: stock symbol
+        :param freq: timeframe (default: dashboard.TIMEFRAME)
+        :param fmt: "png" or "svg"
+        :param dpi: resolution
+        :return: image bytes
+        """
+        return self.focus_all([symbol], freq, fmt, dpi)[symbol]
+
+    def focus_all(self, symbols=None, freq=None, fmt=RENDER_FORMAT, dpi=None):
+        """
+        Render the focus charts of several stocks in parallel
+        :param symbols: stock symbols (default: the whole universe)
+        :param freq: timeframe (default: dashboard.TIMEFRAME)
+        :param fmt: "png" or "svg"
+        :param dpi: resolution
+        :return: dict symbol: image bytes
+        """
+        freq = freq or self.dashboard.TIMEFRAME
+        symbols = list(symbols or self.dashboard.Stock)
+        futures = {}
+        with self.lock:
+            all_data, versions = self.prepare(symbols, freq, freq)  # the new ticks are read once
+            for symbol, stock, version in zip(symbols, all_data, versions):
+                futures[symbol] = self.submit(("focus", symbol, freq, fmt, dpi, version), render_focus, symbol,
+                                              stock, freq, fmt, dpi)
+        with metrics.timer("render_seconds", kind="focus"):
+            return {symbol: future.result() for symbol, future in futures.items()}
+
+    def close(self):
+        """
+        Stop the render processes
+        """
+        self.executor.shutdown()
+
+
+if __name__ == "__main__":
+    # Usage: python render_service.py board.png                  render the dashboard
+    #        python render_service.py charts --focus --format svg  render the focus chart of every stock
+    parser = argparse.ArgumentParser(description="Render dashboard frames without a window")
+    parser.add_argument("output", help="image file of the dashboard, folder of the focus charts with --focus")
+    parser.add_argument("--focus", action="store_true", help="render the focus chart of every stock")
+    parser.add_argument("--freq", default=None, help="timeframe of the focus charts, ex: 5Min")
+    parser.add_argument("--format", default=RENDER_FORMAT, choices=["png", "svg"])
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS)
+    args = parser.parse_args()
+
+    service = RenderService(args.workers)
+    if args.focus:
+        os.makedirs(args.output, exist_ok=True)
+        for name, image in service.focus_all(freq=args.freq, fmt=args.format).items():
+            with open(os.path.join(args.output, "%s.%s" % (name, args.format)), "wb") as f:
+                f.write(image)
+    else:
+        with open(args.output, "wb") as f:
+            f.write(service.board(freq=args.freq, fmt=args.format))
+    service.close()
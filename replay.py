@@ -0,0 +1,241 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from live_feed import FEED_PATH, FeedPublisher, start_feed
+from partitions import PartitionedTickStore
+from symbols import load_symbols
+from tick_snapshot import read_history
+from tick_store import make_records
+
+SPEEDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 0)  # speed multipliers of the probe, 0: as fast as possible
+LEVEL_SECONDS = 5  # seconds replayed per speed of the probe
+MAX_DROPPED = 0.05  # share of frames the dashboard may drop and still keep up
+GRACE_FRAMES = 2  # frames drawn after the end of a level, every published tick must be drawn by then
+
+
+def load_session(filename, symbol_id, symbols=None):
+    """
+    Read a recorded session as sweeps of tick records
+    :param filename: wide csv file (ex: stock_data.csv), tick store file or folder of a partitioned tick store
+    :param symbol_id: function returning the id of a symbol, ex: FeedPublisher.symbol_id
+    :param symbols: symbols of the csv columns (default: symbols.json)
+    :return: list of record arrays, one per time stamp, in file order
+    """
+    if filename.endswith(".csv"):
+        symbols = symbols or load_symbols()
+        sweeps = []
+        with open(filename, newline="") as f:
+            for row in csv.reader(f):
+                quotes = [(symbol,) + tuple(row[2 + n * 3:5 + n * 3]) for n, symbol in enumerate(symbols)]
+                quotes = [quote for quote in quotes if len(quote) == 4 and quote[1] != ""]
+                if quotes:
+                    sweeps.append(make_records(row[1], quotes, symbol_id))
+        return sweeps
+
+    store, records = read_history(filename)
+    ids = np.array([symbol_id(symbol) for symbol in store.symbols] or [0], dtype=np.int32)
+    records["symbol"] = ids[records["symbol"]]
+    boundaries = np.flatnonzero(np.diff(records["time"])) + 1  # a sweep per time stamp, late ticks stay late
+    return [sweep for sweep in np.split(records, boundaries) if len(sweep)]
+
+
+def replay_session(feed, sweeps, speed=1, duration=None):
+    """
+    Publish the sweeps of a session, the gaps between the time stamps are divided by the speed
+    :param feed: FeedPublisher
+    :param sweeps: list of record arrays
+    :param speed: speed multiplier (0: as fast as possible)
+    :param duration: wall seconds after which the replay ends (None: whole session)
+    :return: number of published ticks
+    """
+    if not sweeps:
+        return 0
+    first = int(sweeps[0]["time"][0])
+    start = time.perf_counter()
+    end = float("inf") if duration is None else start + duration
+    published = 0
+    for sweep in sweeps:
+        due = start + (int(sweep["time"][0]) - first) / 1e9 / speed if speed else start
+        if due > end:
+            time.sleep(max(0.0, end - time.perf_counter()))
+            break
+        if due > time.perf_counter():  # late ticks are published at once
+            time.sleep(due - time.perf_counter())
+        if time.perf_counter() > end:
+            break
+        feed.publish_records(sweep)
+        published += len(sweep)
+    return published
+
+
+def run_replay(filename, speed=1, path=FEED_PATH, store_dir=None):
+    """
+    Replay a session to the dashboard through the live feed, like a running collector
+    :param filename: recorded session
+    :param speed: speed multiplier (0: as fast as possible)
+    :param path: unix socket of the feed, a dashboard started afterwards connects to it
+    :param store_dir: partitioned tick store written by the persistence subscriber (None: temporary folder removed
+        at the end, a dashboard only gets the ticks pushed after it connected)
+    """
+    folder = store_dir or tempfile.mkdtemp(prefix="stock_replay_")
+    feed = start_feed(PartitionedTickStore(folder), path=path)
+    try:
+        sweeps = load_session(filename, feed.symbol_id)
+        print("Replaying %d sweeps %s on %s, stored in %s" % (len(sweeps), "at %gx" % speed if speed else
+                                                              "at full speed", path, folder))
+        start = time.perf_counter()
+        published = replay_session(feed, sweeps, speed)
+        print("Published %d ticks in %.1f s" % (published, time.perf_counter() - start))
+    finally:
+        feed.close()
+        if store_dir is None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def probe_level(dashboard, live, feed, path, sweeps, speed, duration):
+    """
+    Replay a session at one speed into a fresh headless dashboard, drawn every REFRESH_INTERVAL
+    :param dashboard: dashboard module
+    :param live: LiveDashboard
+    :param feed: FeedPublisher
+    :param path: unix socket of the feed
+    :param sweeps: list of record arrays
+    :param speed: speed multiplier (0: as fast as possible)
+    :param duration: wall seconds of the level
+    :return: dict with the tick rate, frames and dropped frames
+    """
+    from alerts import AlertEngine
+    from bar_engine import BarCache
+    from ingest import TickIngest
+    from tick_snapshot import FeedSnapshot
+
+    # Fresh dashboard state, subscribed before the first tick is published
+    dashboard.snapshot = FeedSnapshot(path, keep=False)
+    dashboard.engines = {symbol: BarCache() for symbol in dashboard.Stock}
+    dashboard.ingest = TickIngest(window=0)  # ticks go to the bars as they arrive, the reorder delay is no backlog
+    dashboard.alert_engine = AlertEngine(dashboard.Stock)
+    dashboard.latest.clear()
+    dashboard.latest_times.clear()
+    live.offset = None
+
+    result = {}
+
+    def publish():
+        result["published"] = replay_session(feed, sweeps, speed, duration=duration)
+
+    interval = dashboard.REFRESH_INTERVAL / 1000
+    frame_times = []
+    dropped = 0
+    thread = threading.Thread(target=publish, daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    next_frame = start
+    grace_end = None
+    while grace_end is None or time.perf_counter() < grace_end:
+        if grace_end is None and not thread.is_alive():  # replay over, draw the last ticks
+            elapsed = time.perf_counter() - start
+            grace_end = time.perf_counter() + GRACE_FRAMES * interval
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+        frame_start = time.perf_counter()
+        live.refresh()
+        frame_times.append(time.perf_counter() - frame_start)
+        missed = int((time.perf_counter() - next_frame) // interval)  # timer ticks passed while drawing
+        dropped += missed
+        next_frame += (missed + 1) * interval
+
+    published = result.get("published", 0)
+    tick_rate = published / elapsed if elapsed else 0.0
+    # Published ticks not drawn yet: received but not read by a frame, or not added to the bars by the ingest
+    drawn = sum(cache.version for cache in dashboard.engines.values()) + dashboard.ingest.counts["duplicate"]
+    backlog = published - drawn
+    frames = len(frame_times) + dropped
+    kept_up = dropped <= MAX_DROPPED * frames and backlog == 0
+    dashboard.snapshot.subscriber.close()
+    return {
+        "speed": speed or "max",
+        "ticks": published,
+        "seconds": round(elapsed, 2),
+        "tick_rate": round(tick_rate, 1),
+        "frames": frames,
+        "dropped_frames": dropped,
+        "mean_frame_ms": round(float(np.mean(frame_times)) * 1000, 2) if frame_times else None,
+        "max_frame_ms": round(float(np.max(frame_times)) * 1000, 2) if frame_times else None,
+        "backlog": int(backlog),
+        "kept_up": bool(kept_up),
+    }
+
+
+def probe(filename, speeds=SPEEDS, duration=LEVEL_SECONDS):
+    """
+    Find the highest tick rate the dashboard keeps up with: the session is replayed at higher and higher speeds
+    into a headless dashboard until it drops frames or falls behind
+    :param filename: recorded session
+    :param speeds: speed multipliers to try, in increasing order (0: as fast as possible)
+    :param duration: wall seconds per speed
+    :return: dict with the result of every speed and the highest sustained tick rate
+    """
+    import matplotlib
+    matplotlib.use("Agg")  # headless frames, set before the dashboard creates its figure
+    import dashboard
+
+    folder = tempfile.mkdtemp(prefix="stock_replay_")
+    path = os.path.join(folder, "feed.sock")
+    feed = start_feed(PartitionedTickStore(os.path.join(folder, "stock_data")), path=path)
+    levels = []
+    try:
+        sweeps = load_session(filename, feed.symbol_id)
+        dashboard.Stock[:] = list(feed.symbols)  # every replayed stock, the small windows rotate through them
+        figure = dashboard.create_figure()
+        live = dashboard.LiveDashboard(figure)
+        figure.canvas.draw()
+        for speed in speeds:
+            levels.append(probe_level(dashboard, live, feed, path, sweeps, speed, duration))
+            print(levels[-1])
+            if not levels[-1]["kept_up"]:
+                break
+    finally:
+        feed.close()
+        shutil.rmtree(folder, ignore_errors=True)
+    sustained = [level["tick_rate"] for level in levels if level["kept_up"]]
+    return {"levels": levels, "max_sustained_tick_rate": max(sustained) if sustained else 0.0}
+
+
+if __name__ == "__main__":
+    # Usage: python replay.py stock_data.csv --speed 10   replay to the live feed, start python dashboard.py first
+    #                                                    to watch (the replayed ticks go to a temporary store unless
+    #                                                    --store is given, a dashboard started later misses them)
+    #        python replay.py stock_data.csv --probe      highest tick rate a headless dashboard keeps up with
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the live feed")
+    parser.add_argument("session", help="wide csv file, tick store file or partitioned tick store folder")
+    parser.add_argument("--speed", type=float, default=1, help="speed multiplier, 0: as fast as possible")
+    parser.add_argument("--store", default=None,
+                        help="partitioned tick store written during the replay (default: temporary, removed after)")
+    parser.add_argument("--probe", action="store_true", help="find the highest sustained tick rate")
+    parser.add_argument("--duration", type=float, default=LEVEL_SECONDS, help="seconds per speed of the probe")
+    parser.add_argument("--output", default="", help="json file of the probe results (default: print)")
+    args = parser.parse_args()
+
+    if args.probe:
+        output = json.dumps({
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "session": args.session,
+            "results": probe(args.session, duration=args.duration),
+        }, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+    else:
+        run_replay(args.session, args.speed, store_dir=args.store)
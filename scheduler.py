@@ -0,0 +1,83 @@
+import math
+import time
+
+MAX_DOUBLINGS = 32  # failures counted in the backoff, 2 ** failures overflows a float after about 1024
+
+
+class SweepScheduler:
+    """
+    Fire sweeps on fixed wall-clock deadlines and sleep until the next one.
+    Every stock has its own poll interval, failing stocks are retried with an exponential backoff,
+    and deadlines that passed while a sweep was still running are counted as missed.
+    """
+
+    def __init__(self, symbols, interval, intervals=None, max_backoff=300, clock=time.time, sleep=time.sleep):
+        """
+        :param symbols: stock symbols
+        :param interval: default poll interval in seconds
+        :param intervals: dict with the poll interval of some stocks (optional)
+        :param max_backoff: longest delay in seconds before retrying a failing stock
+        :param clock: wall-clock time function
+        :param sleep: sleep function
+        """
+        self.clock = clock
+        self.sleep = sleep
+        self.max_backoff = max_backoff
+        self.intervals = {symbol: (intervals or {}).get(symbol, interval) for symbol in symbols}
+        self.failures = {symbol: 0 for symbol in symbols}  # consecutive failures of every stock
+        self.missed = 0  # number of missed deadlines
+
+        # First deadlines are aligned on the interval, ex: every 30 s on :00 and :30
+        now = self.clock()
+        self.deadlines = {symbol: math.ceil(now / step) * step for symbol, step in self.intervals.items()}
+        self.fired = dict(self.deadlines)  # last deadline that fired for every stock
+
+    def step(self, symbol):
+        """
+        Current poll interval of a stock, doubled for every consecutive failure
+        :param symbol: stock symbol
+        :return: seconds
+        """
+        step = self.intervals[symbol]
+        if self.failures[symbol]:
+            step = min(step * 2 ** min(self.failures[symbol], MAX_DOUBLINGS), max(self.max_backoff, step))
+        return step
+
+    def next_deadline(self):
+        """
+        :return: time of the next sweep
+        """
+        return min(self.deadlines.values())
+
+    def wait(self):
+        """
+        Sleep until the next deadline.
+        If the previous sweep ran over one or more deadlines, they are skipped and counted as missed.
+        :return: (deadline, list of the stocks due at this deadline, in the order of the symbols)
+        """
+        deadline = self.next_deadline()
+        now = self.clock()
+        if deadline > now:
+            self.sleep(deadline - now)
+
+        due = [symbol for symbol, time_due in self.deadlines.items() if time_due <= deadline]
+        for symbol in due:
+            step = self.step(symbol)
+            missed = max(0, math.floor((now - self.deadlines[symbol]) / step))  # whole intervals behind
+            if missed:
+                self.missed += missed
+                print(f"{symbol}: missed {missed} deadline(s)")
+            self.fired[symbol] = self.deadlines[symbol] + missed * step
+            self.deadlines[symbol] = self.fired[symbol] + step
+        return deadline, due
+
+    def report(self, symbol, ok):
+        """
+        Report the result of a fetch, a failing stock is polled less often until it works again
+        :param symbol: stock symbol
+        :param ok: True if the data was retrieved
+        """
+        failures = 0 if ok else self.failures[symbol] + 1
+        if failures != self.failures[symbol]:
+            self.failures[symbol] = failures
+            self.deadlines[symbol] = self.fired[symbol] + self.step(symbol)
@@ -0,0 +1,20 @@
+import json
+import os
+
+SYMBOLS_FILE = os.environ.get("SYMBOLS_FILE", "symbols.json")  # universe shared by the scrapers and the dashboard
+DEFAULT_SYMBOLS = ["AAPL", "MSFT", "NFLX", "PYPL", "FB", "TWTR", "AMZN"]
+
+
+def load_symbols(path=SYMBOLS_FILE):
+    """
+    Load the stock universe from the config file
+    The first symbol is the stock in focus of the dashboard, the csv columns follow the order of the file.
+    :param path: json file with {"symbols": ["AAPL", ...]}
+    :return: list of unique symbols, the default stocks if the file does not exist
+    """
+    if not os.path.exists(path):
+        return list(DEFAULT_SYMBOLS)
+    with open(path) as f:
+        config = json.load(f)
+    symbols = config["symbols"] if isinstance(config, dict) else config
+    return list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_engine
+from bar_engine import BarEngine
+from dashboard import prepare_data_ohlc
+from tick_snapshot import CsvTickSnapshot
+
+SESSION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stock_data.csv")
+SYMBOL = "AAPL"
+
+
+@pytest.fixture(scope="module")
+def ticks():
+    snapshot = CsvTickSnapshot(SESSION)
+    snapshot.refresh()
+    return snapshot.symbol_frame(0, SYMBOL)
+
+
+def expected_frame(ticks):
+    """
+    Bars of the pandas pipeline of the dashboard
+    """
+    return prepare_data_ohlc(ticks.copy(), SYMBOL)[0]
+
+
+def test_same_bars_as_pandas(ticks):
+    engine = BarEngine()
+    engine.update_frame(ticks, SYMBOL)
+    expected = expected_frame(ticks)
+    assert len(expected) > 100
+    pd.testing.assert_frame_equal(engine.to_frame(), expected, check_dtype=False, check_exact=True)
+
+
+def test_same_bars_as_pandas_with_late_ticks(ticks):
+    rng = np.random.default_rng(0)
+    order = np.argsort(np.arange(len(ticks)) + rng.uniform(0, 30, len(ticks)), kind="stable")  # up to 30 ticks late
+    assert (np.diff(ticks.index.asi8[order]) < 0).sum() > len(ticks) // 10
+    engine = BarEngine()
+    for start in range(0, len(ticks), 50):  # several updates, the late ticks correct bars built before
+        engine.update_frame(ticks.iloc[order[start:start + 50]], SYMBOL)
+        engine.to_frame()
+    pd.testing.assert_frame_equal(engine.to_frame(), expected_frame(ticks), check_dtype=False, check_exact=True)
+
+
+def test_old_bars_keep_only_their_first_and_last_tick(ticks, monkeypatch):
+    monkeypatch.setattr(bar_engine, "KEEP_TICKS", 600)
+    late = [10, 11]  # ticks of an early bar arriving at the end of the session
+    engine = BarEngine()
+    engine.update_frame(ticks.iloc[np.setdiff1d(np.arange(len(ticks)), late)], SYMBOL)
+    engine.update_frame(ticks.iloc[late], SYMBOL)
+    kept = sum(len(bar_ticks) for bar_ticks in engine.ticks if isinstance(bar_ticks, list))
+    assert kept < len(ticks) // 10
+    # Exact prices, the volume mean of the corrected bar is summed in arrival order
+    pd.testing.assert_frame_equal(engine.to_frame(), expected_frame(ticks), check_dtype=False, rtol=1e-12)
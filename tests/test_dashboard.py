@@ -0,0 +1,67 @@
+import os
+import shutil
+import time
+
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use("Agg")  # headless figure
+
+import dashboard
+from bar_engine import BarCache
+from ingest import TickIngest
+from tick_snapshot import open_snapshot
+
+SESSION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stock_data.csv")
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    filename = str(tmp_path / "stock_data.csv")
+    with open(SESSION) as source, open(filename, "w") as f:
+        f.writelines(line for _, line in zip(range(200), source))
+    monkeypatch.setattr(dashboard, "snapshot", open_snapshot(filename))
+    monkeypatch.setattr(dashboard, "engines", {symbol: BarCache() for symbol in dashboard.Stock})
+    monkeypatch.setattr(dashboard, "ingest", TickIngest(max_hold=0.2))
+    monkeypatch.setattr(dashboard, "latest", {})
+    monkeypatch.setattr(dashboard, "latest_times", {})
+    monkeypatch.setattr(dashboard, "alert_engine", None)
+    monkeypatch.setattr(dashboard, "compute", None)
+
+
+@pytest.fixture
+def live(session):
+    figure = dashboard.create_figure()
+    live = dashboard.LiveDashboard(figure)
+    figure.canvas.draw()
+    return live
+
+
+def test_released_ticks_are_drawn_without_new_rows(live):
+    live.refresh()
+    assert dashboard.ingest.held  # the newest sweep is held in the reorder window
+    time.sleep(0.3)
+    live.refresh()  # no new row, the held ticks are released after max_hold
+    assert not dashboard.ingest.held
+
+    data = dashboard.engines[dashboard.Stock[0]].to_frame(dashboard.timeframe)
+    np.testing.assert_array_equal(live.ma_lines[0].get_ydata(), data["MA5"].to_numpy(dtype=float))
+    assert live.rsi_text.get_text() == "RSI(14): " + str(round(data["RSI"].iloc[-1], 2))
+    for (_, title, _, price, _), symbol in zip(live.panels, live.shown[1:]):
+        assert price.get_text() == dashboard.latest[symbol][0]
+
+
+def test_render_cache_key_follows_the_latest_quote(session, monkeypatch):
+    from render_service import RenderService
+    monkeypatch.setattr(dashboard, "ingest", TickIngest())  # the held ticks stay held during the test
+    service = RenderService(workers=1)
+    try:
+        symbols = [dashboard.Stock[0]]
+        _, versions = service.prepare(symbols, dashboard.timeframe)
+        assert service.prepare(symbols, dashboard.timeframe)[1] == versions  # same data, the cached frame is used
+        price, change, volume = dashboard.latest[symbols[0]]
+        dashboard.latest[symbols[0]] = ("1" + price, change, volume)  # quote of a held tick, the bars are unchanged
+        assert service.prepare(symbols, dashboard.timeframe)[1] != versions
+    finally:
+        service.close()
@@ -0,0 +1,37 @@
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("selenium")
+
+import get_data_selenium
+from fixture_server import serve_fixtures
+from get_data_bs4 import extract_quote_fast
+from get_data_selenium import DriverPool
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+SYMBOLS = ["AAPL", "AMZN"]
+CHROMEDRIVER = shutil.which("chromedriver")
+
+
+@pytest.fixture
+def server():
+    server, url = serve_fixtures(FIXTURES, port=0)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.skipif(CHROMEDRIVER is None, reason="no chromedriver available")
+def test_pool_reads_the_same_quotes_as_the_html_parser(server, monkeypatch):
+    monkeypatch.setattr(get_data_selenium, "chrome_driver_path", CHROMEDRIVER)
+    pool = DriverPool(SYMBOLS, size=2, headless=True, base_url=server, consent=False)
+    try:
+        values = pool.get_data(SYMBOLS)
+    finally:
+        pool.close()
+    for symbol, (price, change, volume) in zip(SYMBOLS, values):
+        with open(os.path.join(FIXTURES, "quote_%s.html" % symbol), encoding="utf-8") as f:
+            expected_price, expected_volume, expected_change, expected_pct = extract_quote_fast(f.read())
+        assert (price, change, volume) == (expected_price, expected_change + " " + expected_pct, expected_volume)
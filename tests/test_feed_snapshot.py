@@ -0,0 +1,137 @@
+import os
+import socket
+import time
+
+import numpy as np
+import pytest
+
+import tick_snapshot
+from live_feed import start_feed
+from tick_snapshot import FeedSnapshot
+from tick_store import TICK_DTYPE, TickStore
+
+SYMBOLS = ["AAPL", "MSFT"]
+
+
+def sweep(feed, time_stamp, price=100.0):
+    """
+    Publish one sweep of every symbol and wait until it is persisted
+    """
+    feed.publish(time_stamp, [(symbol, str(price + n), "+1.00 (+1.00%)", "1,000") for n, symbol in enumerate(SYMBOLS)])
+    feed.flush()
+
+
+def received(snapshot, count, timeout=5):
+    """
+    Wait until the subscriber received a number of records
+    """
+    deadline = time.monotonic() + timeout
+    while snapshot.subscriber.received < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert snapshot.subscriber.received >= count
+
+
+def subscribed(feed, timeout=5):
+    """
+    Wait until the publisher accepted the subscriber, a sweep published before is not pushed to it
+    """
+    deadline = time.monotonic() + timeout
+    while not feed.clients and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert feed.clients
+
+
+def keys(snapshot):
+    frame = snapshot.frame
+    return sorted(zip(frame["time"].tolist(), frame["symbol"].tolist()))
+
+
+@pytest.fixture
+def feed(tmp_path):
+    store = TickStore(str(tmp_path / "stock_data.ticks"))
+    feed = start_feed(store, path=str(tmp_path / "feed.sock"))
+    feed.store_path = store.path
+    feed.socket_path = str(tmp_path / "feed.sock")
+    yield feed
+    feed.close()
+
+
+def test_sweeps_pushed_while_the_history_is_read_are_taken_once(feed, monkeypatch):
+    sweep(feed, "2022-02-23 10:00:00")
+    read_history = tick_snapshot.read_history
+
+    def read_during_sweep(path, window=None):
+        subscribed(feed)
+        sweep(feed, "2022-02-23 10:00:10")  # persisted and pushed to the new subscriber
+        return read_history(path, window)
+
+    monkeypatch.setattr(tick_snapshot, "read_history", read_during_sweep)
+    snapshot = FeedSnapshot(feed.socket_path, feed.store_path)
+    received(snapshot, len(SYMBOLS))
+    drain = snapshot.subscriber.drain
+    snapshot.subscriber.drain = lambda: np.empty(0, dtype=TICK_DTYPE)  # the pushed copy arrives after the history
+    snapshot.refresh()
+    snapshot.subscriber.drain = drain
+    snapshot.refresh()
+    assert len(snapshot.frame) == 2 * len(SYMBOLS)
+    assert len(set(keys(snapshot))) == len(keys(snapshot))
+
+
+def test_late_pushed_ticks_are_kept(feed, monkeypatch):
+    sweep(feed, "2022-02-23 10:00:00")
+    sweep(feed, "2022-02-23 10:00:10")
+    read_history = tick_snapshot.read_history
+
+    def sweep_after_read(path, window=None):
+        history = read_history(path, window)
+        subscribed(feed)
+        sweep(feed, "2022-02-23 10:00:05")  # late sweep, older than the history but not in it
+        return history
+
+    monkeypatch.setattr(tick_snapshot, "read_history", sweep_after_read)
+    snapshot = FeedSnapshot(feed.socket_path, feed.store_path)
+    received(snapshot, len(SYMBOLS))
+    assert len(snapshot.refresh()) == 3 * len(SYMBOLS)
+
+
+def test_seek_returns_the_history_not_taken_before_the_checkpoint(feed):
+    sweep(feed, "2022-02-23 10:00:00")
+    sweep(feed, "2022-02-23 10:00:10")
+    first = FeedSnapshot(feed.socket_path, feed.store_path)
+    first.refresh()
+    position = first.position()
+    sweep(feed, "2022-02-23 10:00:05")  # late sweep, not taken before the checkpoint
+    sweep(feed, "2022-02-23 10:00:20")
+
+    restarted = FeedSnapshot(feed.socket_path, feed.store_path)
+    assert restarted.seek(position)
+    records = restarted.refresh()
+    assert sorted(set(records["time"].tolist())) == [first.frame["time"].max() - 5 * 10 ** 9,
+                                                     first.frame["time"].max() + 10 * 10 ** 9]
+    assert len(records) == 2 * len(SYMBOLS)
+
+
+def test_running_publisher_keeps_its_socket(feed):
+    with pytest.raises(RuntimeError):
+        start_feed(TickStore(feed.store_path), path=feed.socket_path)
+    assert os.path.exists(feed.socket_path)
+    snapshot = FeedSnapshot(feed.socket_path, feed.store_path)
+    for second in range(50):  # still published on the socket, once the snapshot is accepted
+        sweep(feed, "2022-02-23 10:00:%02d" % second)
+        if snapshot.subscriber.received:
+            break
+        time.sleep(0.1)
+    assert snapshot.subscriber.received
+
+
+def test_socket_of_a_stopped_publisher_is_reused(tmp_path):
+    store = TickStore(str(tmp_path / "stock_data.ticks"))
+    path = str(tmp_path / "feed.sock")
+    stopped = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stopped.bind(path)  # left behind, nobody listens
+    stopped.close()
+    feed = start_feed(store, path=path)
+    try:
+        assert feed.server is not None
+    finally:
+        feed.close()
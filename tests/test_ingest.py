@@ -0,0 +1,33 @@
+import math
+
+import pandas as pd
+
+from bar_engine import BarEngine
+from ingest import TickIngest
+
+
+def sweep_frames(time_stamp, quotes):
+    """
+    Frames of one sweep as read by the snapshots
+    :param quotes: dict symbol: (price, volume)
+    """
+    index = pd.DatetimeIndex([pd.Timestamp(time_stamp)], name="time")
+    return {symbol: pd.DataFrame({symbol: [price], "change": ["+1.00 (+1.00%)"], "volume": [volume]}, index=index)
+            for symbol, (price, volume) in quotes.items()}
+
+
+def test_volume_copied_from_another_stock_is_unknown():
+    ingest = TickIngest(window=0)
+    engine = BarEngine("1Min", ma_windows=(2,), rsi_window=2)
+    for minute in range(6):
+        volume = 1000.0 * (minute + 1)
+        quotes = {"AAPL": (100.0 + minute % 3, volume), "MSFT": (300.0 - minute, 2670653.0),
+                  "NFLX": (400.0 + minute, 2670653.0)}  # the page fields of MSFT and NFLX are not refreshed
+        released = ingest.push(sweep_frames("2022-02-23 10:%02d:00" % minute, quotes))
+        assert released["AAPL"]["volume"].iloc[0] == volume
+        assert math.isnan(released["MSFT"]["volume"].iloc[0])
+        engine.update_frame(released["MSFT"], "MSFT")
+
+    data = engine.to_frame()
+    assert len(data) == 4  # every bar with complete indicators keeps its candle
+    assert data["volume_diff"].isna().all()  # without a volume bar
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from partitions import PartitionedTickStore
+from tick_snapshot import PartitionSnapshot
+
+SYMBOLS = ["AAPL", "MSFT"]
+
+
+def sweep(store, time_stamp):
+    """
+    Append one sweep of every symbol, as the collector does
+    """
+    store.append(time_stamp, [(symbol, "100.0", "+1.00 (+1.00%)", "1,000") for symbol in SYMBOLS])
+
+
+def test_records_appended_during_the_first_read_are_returned_once(tmp_path, monkeypatch):
+    collector = PartitionedTickStore(str(tmp_path))
+    sweep(collector, "2022-02-23 10:00:00")
+    snapshot = PartitionSnapshot(str(tmp_path), pd.Timedelta(hours=1))
+    partition_length = snapshot.store.partition_length
+
+    def length_then_sweep(key, catalog=None):
+        length = partition_length(key, catalog)
+        sweep(collector, "2022-02-23 10:00:10")  # the collector appends between the length and the read
+        return length
+
+    monkeypatch.setattr(snapshot.store, "partition_length", length_then_sweep)
+    first = snapshot.refresh()
+    monkeypatch.setattr(snapshot.store, "partition_length", partition_length)
+    second = snapshot.refresh()
+    assert len(first) == len(SYMBOLS)
+    assert len(second) == len(SYMBOLS)
+
+
+def test_records_are_not_kept_for_the_dashboard(tmp_path):
+    collector = PartitionedTickStore(str(tmp_path))
+    snapshot = PartitionSnapshot(str(tmp_path), keep=False)
+    for second in range(3):
+        sweep(collector, "2022-02-23 10:00:%02d" % second)
+        assert len(snapshot.refresh()) == len(SYMBOLS)
+    assert snapshot.offset == 3 * len(SYMBOLS)
+    assert not len(snapshot.frame)
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from fixture_server import serve_fixtures
+from get_data_bs4 import QuoteFetcher, create_session
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+SYMBOL = "AAPL"
+PATH = "/quote/" + SYMBOL
+
+
+class SlowSession:
+    """
+    Session counting the GET requests, every request waits a bit so concurrent callers overlap
+    """
+
+    def __init__(self, delay=0.2):
+        self.session = create_session(4)
+        self.headers = self.session.headers
+        self.delay = delay
+        self.gets = 0
+
+    def get(self, url, **kwargs):
+        self.gets += 1
+        time.sleep(self.delay)
+        return self.session.get(url, **kwargs)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    Fixture server on an ephemeral port serving a copy of the saved quote pages
+    """
+    shutil.copy(os.path.join(FIXTURES, "quote_%s.html" % SYMBOL), tmp_path)
+    server, url = serve_fixtures(str(tmp_path), port=0)
+    server.directory = tmp_path
+    server.url = url
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_ttl_cache_hit_sends_no_request(server):
+    fetcher = QuoteFetcher(create_session(1), base_url=server.url, ttl=60)
+    page = fetcher.fetch(SYMBOL)
+    assert fetcher.fetch(SYMBOL) == page
+    assert server.stats[PATH]["requests"] == 1
+
+
+def test_expired_page_is_revalidated_with_304(server):
+    fetcher = QuoteFetcher(create_session(1), base_url=server.url, ttl=0)
+    page = fetcher.fetch(SYMBOL)
+    assert fetcher.fetch(SYMBOL) == page
+    assert server.stats[PATH] == {"requests": 2, "not_modified": 1, "bytes": server.stats[PATH]["bytes"]}
+
+    # A changed page is sent again
+    with open(server.directory / ("quote_%s.html" % SYMBOL), "a") as f:
+        f.write("<!-- new quote -->")
+    assert fetcher.fetch(SYMBOL).endswith("<!-- new quote -->")
+    assert server.stats[PATH]["not_modified"] == 1
+
+
+def test_304_without_cached_page_fetches_the_page(server):
+    with open(server.directory / ("quote_%s.html" % SYMBOL), "rb") as f:
+        body = f.read()
+    session = create_session(1)
+    session.headers["If-None-Match"] = '"%s"' % hashlib.md5(body).hexdigest()  # stale validator, nothing cached
+    fetcher = QuoteFetcher(session, base_url=server.url, ttl=0)
+    assert fetcher.fetch(SYMBOL) == body.decode()
+    assert server.stats[PATH]["not_modified"] == 1
+
+
+def test_concurrent_callers_share_one_request(server):
+    session = SlowSession()
+    fetcher = QuoteFetcher(session, base_url=server.url, ttl=0)
+    barrier = threading.Barrier(2)
+    pages = []
+
+    def fetch():
+        barrier.wait()
+        pages.append(fetcher.fetch(SYMBOL))
+
+    threads = [threading.Thread(target=fetch) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pages) == 2 and pages[0] == pages[1]
+    assert session.gets == 1
+    assert server.stats[PATH]["requests"] == 1
+
+
+def test_bytes_received_are_counted(server):
+    fetcher = QuoteFetcher(create_session(1), base_url=server.url, ttl=0)
+    fetcher.fetch(SYMBOL)
+    sent = server.stats[PATH]["bytes"]  # gzip compressed body
+    assert 0 < fetcher.take_bytes() == sent
+    assert fetcher.take_bytes() == 0
+
+    fetcher.fetch(SYMBOL)  # 304, no body
+    assert fetcher.take_bytes() == 0
+    assert server.stats[PATH]["bytes"] == sent
@@ -0,0 +1,10 @@
+from scheduler import SweepScheduler
+
+
+def test_backoff_of_a_stock_failing_for_days():
+    scheduler = SweepScheduler(["AAPL"], 0.5, max_backoff=300, clock=lambda: 1000.0, sleep=lambda seconds: None)
+    for _ in range(2000):  # 2 ** 1024 * 0.5 overflows a float
+        scheduler.report("AAPL", ok=False)
+    assert scheduler.step("AAPL") == 300
+    scheduler.report("AAPL", ok=True)
+    assert scheduler.step("AAPL") == 0.5
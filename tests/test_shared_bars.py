@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_engine import BarCache, TIMEFRAMES
+from compute_worker import SharedBars
+
+SYMBOLS = ["AAPL", "MSFT"]
+START = pd.Timestamp("2022-02-23 09:30:00").value
+SECOND = 1000000000
+
+
+@pytest.fixture
+def buffers():
+    writer = SharedBars(SYMBOLS, capacity=4)
+    reader = SharedBars(SYMBOLS, writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def ticks(cache, start, count, step=7):
+    """
+    Add ticks every few seconds with a varying price and volume
+    """
+    for n in range(start, start + count):
+        cache.update(START + n * step * SECOND, 100.0 + (n * 37 % 11), 1000.0 + n * 10)
+
+
+def check(reader, cache, symbol):
+    """
+    Every timeframe read from the buffer matches the bars computed in-process
+    """
+    for freq in TIMEFRAMES:
+        data = reader.read([symbol], freq)[0][0]
+        expected = cache.to_frame(freq)
+        assert len(data) == len(expected)
+        assert (data["time"].values == expected["time"].dt.floor("ms").values).all()
+        for column in ["open", "high", "low", "close", "MA5", "RSI", "volume_diff"]:
+            np.testing.assert_allclose(data[column].values, expected[column].values.astype(np.float64))
+
+
+def test_buffer_grows_with_the_session(buffers):
+    writer, reader = buffers
+    cache = BarCache()
+    ticks(cache, 0, 600)  # 600 bars of 1s, far more than the 4 allocated
+    writer.write({"AAPL": (cache, ("100.00", "+1.00 (+1.00%)", 1000.0))})
+    assert writer.bars[0].shape[1] >= 600
+    check(reader, cache, "AAPL")
+
+    ticks(cache, 600, 600)
+    writer.write({"AAPL": (cache, ("100.00", "+1.00 (+1.00%)", 1000.0))})
+    check(reader, cache, "AAPL")  # the reader attached to the replaced buffer
+
+
+def test_only_changed_rows_are_written(buffers):
+    writer, reader = buffers
+    cache = BarCache()
+    ticks(cache, 0, 300)
+    writer.write({"AAPL": (cache, ("100.00", "+1.00 (+1.00%)", 1000.0))})
+    m = writer.timeframes.index("1Min")
+    first = writer.bars[m][0, :5].copy()
+    writer.bars[m][0, :5] = -1  # rows of bars the next update does not change
+
+    ticks(cache, 300, 20)
+    cache.update(START + 2000 * SECOND, 90.0, 5000.0)  # late tick inside an old bar
+    writer.write({"AAPL": (cache, ("100.00", "+1.00 (+1.00%)", 1000.0))})
+    assert (writer.bars[m][0, :5] == -1).all()
+    writer.bars[m][0, :5] = first
+    check(reader, cache, "AAPL")
@@ -0,0 +1,604 @@
+import hashlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from live_feed import FeedSubscriber
+from partitions import PartitionedTickStore
+from tick_store import TICK_DTYPE, TickStore, SymbolIndex, NO_VOLUME, format_change
+
+FINGERPRINT_BYTES = 4096  # bytes hashed at the start of a file and before a saved read position
+FEED_OVERLAP = 60  # seconds of history tail the pushed ticks are compared with, pushed copies of its ticks are dropped
+
+
+def records_frame(records, symbol):
+    """
+    Convert the tick records of one symbol into the symbol frame layout
+    :param records: record array of one symbol
+    :param symbol: short stock name symbol, used as price column name
+    :return: dataframe with the columns [symbol, "change", "volume"] and incomplete ticks dropped
+    """
+    records = records[(records["volume"] != NO_VOLUME) & ~np.isnan(records["price"]) & ~np.isnan(records["pct"])]
+    return pd.DataFrame({symbol: records["price"],
+                         "change": [format_change(c, p) for c, p in zip(records["change"], records["pct"])],
+                         "volume": records["volume"].astype(float)},
+                        index=pd.DatetimeIndex(records["time"], name="time"))
+
+
+def file_fingerprint(filename, offset, size=FINGERPRINT_BYTES):
+    """
+    Fingerprint of a file up to a read position: hash of its first bytes and of the bytes before the position
+    :param filename: file name
+    :param offset: read position in bytes
+    :param size: bytes hashed at both ends
+    :return: hex digest, None if the file is shorter than the position
+    """
+    try:
+        if os.path.getsize(filename) < offset:
+            return None
+        with open(filename, "rb") as f:
+            head = f.read(min(size, offset))
+            f.seek(max(0, offset - size))
+            tail = f.read(offset - max(0, offset - size))
+    except OSError:
+        return None
+    return hashlib.sha1(head + tail).hexdigest()
+
+
+def records_fingerprint(records):
+    """
+    :param records: record array
+    :return: hex digest of the records
+    """
+    return hashlib.sha1(np.ascontiguousarray(records).tobytes()).hexdigest()
+
+
+class CsvTickSnapshot:
+    """
+    Shared, incrementally tailed view of the wide csv file written by the scrapers.
+    The file is only read from the last consumed byte offset, so a refresh costs as much as the newly appended rows.
+    """
+
+    def __init__(self, filename, keep=True):
+        """
+        :param filename: csv file written by get_data_bs4 / get_data_selenium
+        :param keep: keep the rows read for frame (False: only the rows returned by refresh, ex: the dashboard)
+        """
+        self.filename = filename
+        self.keep = keep
+        self.offset = 0  # byte offset of the first unread line
+        self.chunks = []  # parsed chunks, concatenated lazily
+        self._frame = None  # cached concatenation of the chunks
+
+    def reset(self):
+        """
+        Forget everything read so far (used when the file was truncated or replaced)
+        """
+        self.offset = 0
+        self.chunks = []
+        self._frame = None
+
+    def refresh(self):
+        """
+        Read the rows appended to the file since the last refresh
+        :return: dataframe with the new rows (empty if nothing new arrived)
+        """
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:  # file not created yet
+            return self.parse_chunk(b"")
+
+        if size < self.offset:  # file was truncated or replaced, start over
+            self.reset()
+        if size == self.offset:  # nothing new
+            return self.parse_chunk(b"")
+
+        with open(self.filename, "rb") as f:
+            f.seek(self.offset)
+            raw = f.read(size - self.offset)
+
+        # Only consume complete lines, a scraper may be in the middle of writing the last one
+        end = raw.rfind(b"\n") + 1
+        raw = raw[:end]
+        self.offset += end
+
+        chunk = self.parse_chunk(raw)
+        if len(chunk) and self.keep:
+            self.chunks.append(chunk)
+            self._frame = None
+        return chunk
+
+    def position(self):
+        """
+        Read position, saved with a checkpoint
+        :return: dict with the file, the byte offset and a fingerprint of the bytes read
+        """
+        return {"kind": "csv", "source": self.filename, "offset": self.offset,
+                "fingerprint": file_fingerprint(self.filename, self.offset)}
+
+    def seek(self, position):
+        """
+        Continue from a saved read position if the file still starts with the same bytes
+        :param position: dict returned by position()
+        :return: True if the position was restored (False: nothing changed)
+        """
+        if position.get("kind") != "csv" or position.get("source") != self.filename:
+            return False
+        if file_fingerprint(self.filename, position["offset"]) != position["fingerprint"]:  # replaced or rewritten
+            return False
+        self.reset()
+        self.offset = position["offset"]
+        return True
+
+    @staticmethod
+    def parse_chunk(raw):
+        """
+        Parse raw csv lines into a typed dataframe
+        Index is the time stamp, price and volume columns are floats, change columns stay strings.
+        :param raw: bytes with complete csv lines
+        :return: dataframe, columns keep the positions of the csv file (2, 3, 4, 5, ...)
+        """
+        if not raw.strip():
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="time"))
+
+        df = pd.read_csv(io.BytesIO(raw), header=None, dtype=str, keep_default_na=False, na_values=[""])
+        df.index = pd.DatetimeIndex(pd.to_datetime(df[1]), name="time")  # column 1 holds the time stamp
+        df = df.drop(columns=[0, 1])  # column 0 is the index written by pandas
+
+        for column in df.columns:
+            position = (column - 2) % 3  # 0: price, 1: change, 2: volume
+            if position == 0:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+            elif position == 2:
+                df[column] = pd.to_numeric(df[column].str.replace(",", ""), errors="coerce").astype(float)
+        return df
+
+    @property
+    def frame(self):
+        """
+        All rows read so far (empty if they are not kept)
+        :return: dataframe
+        """
+        if self._frame is None:
+            if not self.chunks:
+                return self.parse_chunk(b"")
+            self._frame = pd.concat(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+            self.chunks = [self._frame]
+        return self._frame
+
+    @staticmethod
+    def symbols_in(df, symbols):
+        """
+        Symbols with at least one price in the rows
+        :param df: parsed rows
+        :param symbols: stock universe, in the order of the csv columns
+        :return: list of symbols
+        """
+        return [symbol for n, symbol in enumerate(symbols) if 2 + n * 3 in df.columns and df[2 + n * 3].notna().any()]
+
+    def symbol_frame(self, position, symbol, df=None):
+        """
+        Select the price, change and volume of one symbol
+        :param position: position of the symbol in the stock list (0 for the first stock)
+        :param symbol: short stock name symbol, used as price column name
+        :param df: dataframe to select from (default: all rows read so far)
+        :return: dataframe with the columns [symbol, "change", "volume"] and rows with null values dropped
+        """
+        if df is None:
+            df = self.frame
+        columns = [2 + position * 3, 3 + position * 3, 4 + position * 3]
+        if not set(columns).issubset(df.columns):
+            return pd.DataFrame(columns=[symbol, "change", "volume"], index=pd.DatetimeIndex([], name="time"))
+        df = df[columns]
+        df.columns = [symbol, "change", "volume"]
+        return df.dropna()
+
+
+class TickStoreSnapshot:
+    """
+    Shared, incrementally read view of a binary tick store (see tick_store.TickStore).
+    Same interface as CsvTickSnapshot, new records are read zero-copy from the last consumed record.
+    """
+
+    def __init__(self, filename, keep=True):
+        """
+        :param filename: tick store written by get_data_bs4 / get_data_selenium
+        :param keep: index the records read for symbol_frame (False: symbol_frame scans the store)
+        """
+        self.store = TickStore(filename)
+        self.keep = keep
+        self.offset = 0  # index of the first unread record
+        self.index = SymbolIndex()  # record numbers of every symbol
+
+    def refresh(self):
+        """
+        Read the records appended to the store since the last refresh
+        :return: record array with the new records
+        """
+        size = len(self.store)
+        if size < self.offset:  # store was truncated or replaced, start over
+            self.offset = 0
+            self.index = SymbolIndex()
+        records = self.store.read(self.offset, size)
+        if self.keep:
+            self.index.update(records, self.offset)
+        self.offset = size
+        return records
+
+    def position(self):
+        """
+        Read position, saved with a checkpoint
+        :return: dict with the store, the number of records read and a fingerprint of the first and last of them
+        """
+        records = self.store.read(0, min(1, self.offset))
+        last = self.store.read(max(0, self.offset - 1), self.offset)
+        return {"kind": "ticks", "source": self.store.path, "offset": self.offset,
+                "fingerprint": records_fingerprint(records) + records_fingerprint(last)}
+
+    def seek(self, position):
+        """
+        Continue from a saved read position if the store still holds the same records
+        :param position: dict returned by position()
+        :return: True if the position was restored (False: nothing changed)
+        """
+        if position.get("kind") != "ticks" or position.get("source") != self.store.path:
+            return False
+        offset = position["offset"]
+        if len(self.store) < offset:  # truncated or replaced
+            return False
+        records = self.store.read(0, min(1, offset))
+        last = self.store.read(max(0, offset - 1), offset)
+        if records_fingerprint(records) + records_fingerprint(last) != position["fingerprint"]:
+            return False
+        self.offset = offset
+        self.index = SymbolIndex()  # ticks before the position are in the checkpoint, not in the index
+        return True
+
+    @property
+    def frame(self):
+        """
+        All records read so far
+        :return: record array
+        """
+        return self.store.read(0, self.offset)
+
+    def reload_symbols(self, symbol):
+        """
+        Reload the symbols registered by the collectors if a symbol is unknown
+        :param symbol: stock symbol
+        """
+        if symbol not in self.store.symbol_ids:
+            self.store.load_symbols()
+
+    def symbols_in(self, records, symbols):
+        """
+        Symbols with at least one tick in the records
+        :param records: record array
+        :param symbols: stock universe
+        :return: list of symbols, in the order of the universe
+        """
+        ids = set(np.unique(records["symbol"]).tolist())
+        if len(ids) and max(ids) >= len(self.store.symbols):
+            self.store.load_symbols()
+        return [symbol for symbol in symbols if self.store.symbol_ids.get(symbol, -1) in ids]
+
+    def symbol_frame(self, position, symbol, df=None):
+        """
+        Select the price, change and volume of one symbol
+        :param position: position of the symbol in the stock list (unused, symbols are stored by name)
+        :param symbol: short stock name symbol, used as price column name
+        :param df: record array to select from (default: all records read so far, through the symbol index)
+        :return: dataframe with the columns [symbol, "change", "volume"] and incomplete ticks dropped
+        """
+        self.reload_symbols(symbol)
+        if df is None:
+            records = self.store.read_symbol(symbol, self.index if self.keep else None)
+        else:
+            records = df[df["symbol"] == self.store.symbol_ids.get(symbol, -1)]
+        return records_frame(records, symbol)
+
+
+class PartitionSnapshot(TickStoreSnapshot):
+    """
+    View of a partitioned tick store (see partitions.PartitionedTickStore).
+    The first refresh only loads the partitions of the visible window, later refreshes tail
+    the newest partitions by record number, so neither cost depends on the total history.
+    """
+
+    def __init__(self, directory, window=None, keep=True):
+        """
+        :param directory: folder of the partitions
+        :param window: history to load before the newest tick (pd.Timedelta, None: everything)
+        :param keep: keep the records read for frame (False: only the records returned by refresh, ex: the dashboard)
+        """
+        self.store = PartitionedTickStore(directory)
+        self.window = window
+        self.keep = keep
+        self.offset = 0  # number of records read
+        self.index = SymbolIndex()  # record numbers of every symbol in self.frame
+        self.chunks = []  # read record arrays, concatenated lazily
+        self.tails = None  # key: number of records read of every partition from the first loaded one
+
+    def refresh(self):
+        """
+        Read the records appended since the last refresh (the visible window on the first call)
+        :return: record array with the new records
+        """
+        catalog = self.store.load_catalog()
+        if self.tails is None:  # first refresh: load the visible window only
+            latest = self.store.latest_time()
+            if latest is None:
+                return np.empty(0, dtype=TICK_DTYPE)
+            start = None if self.window is None else latest - pd.Timedelta(self.window).value
+            keys = self.store.overlapping(start, None, catalog)
+            self.tails = {key: self.store.partition_length(key, catalog) for key in keys}
+            parts = []
+            for key in keys:  # up to the recorded lengths, later records are read by the next refresh
+                records = self.store.read_partition(key, 0, self.tails[key], catalog)
+                parts.append(records if start is None else records[records["time"] >= start])
+            records = np.concatenate(parts) if parts else np.empty(0, dtype=TICK_DTYPE)
+        else:
+            parts = []
+            first = min(self.tails) if self.tails else ""
+            for key in self.store.keys():
+                if key < first:  # late ticks of partitions older than the window are ignored
+                    continue
+                length = self.store.partition_length(key, catalog)
+                if length > self.tails.get(key, 0):
+                    parts.append(self.store.read_partition(key, self.tails.get(key, 0), length, catalog))
+                    self.tails[key] = length
+            records = np.concatenate(parts) if parts else np.empty(0, dtype=TICK_DTYPE)
+
+        if len(records) and self.keep:
+            self.chunks.append(records)
+            self.index.update(records, self.offset)
+        self.offset += len(records)
+        return records
+
+    def tail_fingerprints(self, tails, catalog):
+        """
+        :param tails: number of records read of every partition
+        :param catalog: loaded catalog
+        :return: dict key: fingerprint of the last read record of the partition, None if the partition is shorter
+        """
+        fingerprints = {}
+        for key, length in tails.items():
+            if self.store.partition_length(key, catalog) < length:
+                fingerprints[key] = None
+            elif length:
+                fingerprints[key] = records_fingerprint(self.store.read_partition(key, length - 1, length, catalog))
+        return fingerprints
+
+    def position(self):
+        """
+        Read position, saved with a checkpoint
+        :return: dict with the folder, the number of records read of every partition and their fingerprints
+        """
+        tails = dict(self.tails or {})
+        return {"kind": "partitions", "source": self.store.directory, "tails": tails,
+                "fingerprints": self.tail_fingerprints(tails, self.store.load_catalog())}
+
+    def seek(self, position):
+        """
+        Continue from a saved read position if the partitions still hold the same records
+        :param position: dict returned by position()
+        :return: True if the position was restored (False: nothing changed)
+        """
+        if position.get("kind") != "partitions" or position.get("source") != self.store.directory:
+            return False
+        if not position["tails"]:  # nothing was read, the visible window is loaded as usual
+            return False
+        if self.tail_fingerprints(position["tails"], self.store.load_catalog()) != position["fingerprints"]:
+            return False
+        self.tails = dict(position["tails"])
+        self.offset = 0  # records counted from the restart, the ticks before are in the checkpoint
+        self.index = SymbolIndex()
+        self.chunks = []
+        return True
+
+    @property
+    def frame(self):
+        """
+        All records read so far (empty if they are not kept)
+        :return: record array
+        """
+        if len(self.chunks) > 1:
+            self.chunks[:] = [np.concatenate(self.chunks)]
+        return self.chunks[0] if self.chunks else np.empty(0, dtype=TICK_DTYPE)
+
+    def symbol_frame(self, position, symbol, df=None):
+        """
+        Select the price, change and volume of one symbol
+        :param position: position of the symbol in the stock list (unused, symbols are stored by name)
+        :param symbol: short stock name symbol, used as price column name
+        :param df: record array to select from (default: all records read so far, through the symbol index)
+        :return: dataframe with the columns [symbol, "change", "volume"] and incomplete ticks dropped
+        """
+        self.reload_symbols(symbol)
+        symbol_id = self.store.symbol_ids.get(symbol, -1)
+        if df is None:
+            records = self.frame[self.index.positions(symbol_id)]
+        else:
+            records = df[df["symbol"] == symbol_id]
+        return records_frame(records, symbol)
+
+
+def read_history(path, window=None):
+    """
+    Read the ticks of a tick store
+    :param path: tick store file or folder of a partitioned tick store
+    :param window: history loaded from a partitioned store, before its newest tick (pd.Timedelta, None: everything)
+    :return: (store, record array)
+    """
+    if not os.path.isdir(path):
+        store = TickStore(path)
+        return store, np.array(store.read(), dtype=TICK_DTYPE)
+    store = PartitionedTickStore(path)
+    latest = store.latest_time()
+    start = None if window is None or latest is None else latest - pd.Timedelta(window).value
+    return store, store.read_range(start)
+
+
+class FeedSnapshot:
+    """
+    View of the ticks pushed by the collectors over the live feed (see live_feed.FeedPublisher).
+    Same interface as TickStoreSnapshot, the history is read once from the tick store and
+    new ticks are taken from memory, so a refresh no longer reads or parses any file.
+    """
+
+    def __init__(self, path, history=None, window=None, keep=True):
+        """
+        :param path: unix socket of the live feed
+        :param history: tick store (file or partition folder) with the ticks published before the dashboard started
+        :param window: history loaded from a partitioned store (pd.Timedelta, None: everything)
+        :param keep: keep the records taken for frame (False: only the last FEED_OVERLAP seconds, ex: the dashboard)
+        """
+        self.subscriber = FeedSubscriber(path)  # subscribe first so no tick is missed while reading the history
+        self.keep = keep
+        self.chunks = []  # received record arrays, concatenated lazily
+        self.offset = 0  # number of records received
+        self.index = SymbolIndex()  # record numbers of every symbol
+        self.overlap = set()  # (time, symbol id) of the history tail, pushed ticks already in the history
+        self.pending = np.empty(0, dtype=TICK_DTYPE)  # history, returned by the first refresh
+        self.newest = None  # time of the newest tick taken
+
+        if history is not None and os.path.exists(history):
+            store, records = read_history(history, window)
+            if len(records):
+                ids = np.array([self.subscriber.local_id(symbol) for symbol in store.symbols], dtype=np.int32)
+                records["symbol"] = ids[records["symbol"]]
+                self.overlap = self.tail_keys(records)
+                self.pending = records
+
+    @staticmethod
+    def tail_keys(records, end=None):
+        """
+        :param records: record array
+        :param end: end of the tail (default: newest tick of the records)
+        :return: set of (time, symbol id) of the ticks in the FEED_OVERLAP seconds before the end
+        """
+        if not len(records):
+            return set()
+        end = records["time"].max() if end is None else end
+        tail = records[records["time"] >= end - pd.Timedelta(seconds=FEED_OVERLAP).value]
+        return set(zip(tail["time"].tolist(), tail["symbol"].tolist()))
+
+    def drop_overlap(self, records):
+        """
+        Drop the pushed ticks already read from the history (sweeps published while the history was read),
+        late ticks that are not in the history are kept
+        :param records: pushed record array
+        :return: record array
+        """
+        if not self.overlap or not len(records):
+            return records
+        keep = np.array([key not in self.overlap for key in zip(records["time"].tolist(),
+                                                                 records["symbol"].tolist())])
+        newest = max(records["time"].max(), self.newest or 0)
+        cutoff = newest - pd.Timedelta(seconds=FEED_OVERLAP).value
+        self.overlap = {key for key in self.overlap if key[0] >= cutoff}  # the feed moved past the rest
+        return records[keep]
+
+    def refresh(self):
+        """
+        Take the ticks pushed since the last refresh
+        :return: record array with the new records
+        """
+        records = self.drop_overlap(self.subscriber.drain())
+        if len(self.pending):
+            records = np.concatenate([self.pending, records])
+            self.pending = records[:0]
+        if len(records):
+            self.chunks.append(records)
+            self.offset += len(records)
+            newest = int(records["time"].max())
+            self.newest = newest if self.newest is None else max(self.newest, newest)
+            if self.keep:
+                self.index.update(records, self.offset - len(records))
+            else:  # the tail is kept for position()
+                frame = self.frame
+                self.chunks[:] = [frame[frame["time"] >= self.newest - pd.Timedelta(seconds=FEED_OVERLAP).value]]
+        return records
+
+    def position(self):
+        """
+        Read position, saved with a checkpoint: the ticks pushed over the feed are not kept,
+        so the position is the time of the newest tick taken and the ticks taken shortly before it
+        :return: dict with the socket, the time and the (time, symbol) of the ticks of the last FEED_OVERLAP seconds
+        """
+        keys = self.tail_keys(self.frame, self.newest) if self.newest is not None else set()
+        return {"kind": "feed", "source": self.subscriber.path, "time": self.newest,
+                "taken": sorted((time, self.subscriber.symbols[symbol]) for time, symbol in keys)}
+
+    def seek(self, position):
+        """
+        Continue after the ticks taken before a checkpoint: the first refresh returns the newer history and the
+        late history ticks of the last FEED_OVERLAP seconds that were not taken
+        :param position: dict returned by position()
+        :return: True if the position was restored (False: nothing changed)
+        """
+        if position.get("kind") != "feed" or position.get("source") != self.subscriber.path:
+            return False
+        if position["time"] is not None:
+            taken = {(time, self.subscriber.local_id(symbol)) for time, symbol in position.get("taken", [])}
+            cutoff = position["time"] - pd.Timedelta(seconds=FEED_OVERLAP).value
+            keep = self.pending["time"] >= cutoff  # older ticks were taken before the checkpoint
+            tail = self.pending[keep]
+            keep[keep] = [key not in taken for key in zip(tail["time"].tolist(), tail["symbol"].tolist())]
+            self.pending = self.pending[keep]
+            self.newest = position["time"]
+        return True
+
+    @property
+    def frame(self):
+        """
+        All records received so far (the last FEED_OVERLAP seconds if they are not kept)
+        :return: record array
+        """
+        if len(self.chunks) > 1:
+            self.chunks[:] = [np.concatenate(self.chunks)]
+        return self.chunks[0] if self.chunks else np.empty(0, dtype=TICK_DTYPE)
+
+    def symbols_in(self, records, symbols):
+        """
+        Symbols with at least one tick in the records
+        :param records: record array
+        :param symbols: stock universe
+        :return: list of symbols, in the order of the universe
+        """
+        ids = set(np.unique(records["symbol"]).tolist())
+        return [symbol for symbol in symbols if self.subscriber.symbol_ids.get(symbol, -1) in ids]
+
+    def symbol_frame(self, position, symbol, df=None):
+        """
+        Select the price, change and volume of one symbol
+        :param position: position of the symbol in the stock list (unused, symbols are sent by name)
+        :param symbol: short stock name symbol, used as price column name
+        :param df: record array to select from (default: all records received so far, through the symbol index)
+        :return: dataframe with the columns [symbol, "change", "volume"] and incomplete ticks dropped
+        """
+        symbol_id = self.subscriber.symbol_ids.get(symbol, -1)
+        if df is None and self.keep:
+            records = self.frame[self.index.positions(symbol_id)]
+        elif df is None:
+            records = self.frame[self.frame["symbol"] == symbol_id]
+        else:
+            records = df[df["symbol"] == symbol_id]
+        return records_frame(records, symbol)
+
+
+def open_snapshot(filename, window=None, keep=True):
+    """
+    Open a snapshot matching the file type
+    :param filename: csv file, binary tick store (".ticks") or folder of a partitioned tick store
+    :param window: history loaded from a partitioned store (pd.Timedelta, None: everything)
+    :param keep: keep the records read for frame and symbol_frame (False: only return the new records)
+    :return: CsvTickSnapshot, TickStoreSnapshot or PartitionSnapshot
+    """
+    if os.path.isdir(filename):
+        return PartitionSnapshot(filename, window, keep)
+    if filename.endswith(".ticks"):
+        return TickStoreSnapshot(filename, keep)
+    return CsvTickSnapshot(filename, keep)
@@ -0,0 +1,300 @@
+import csv
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Fixed width tick record
+TICK_DTYPE = np.dtype([("time", "<i8"),  # time stamp in ns
+                       ("symbol", "<i4"),  # symbol id, see TickStore.symbols
+                       ("price", "<f8"),
+                       ("change", "<f8"),  # price change
+                       ("pct", "<f8"),  # price change in percentage
+                       ("volume", "<i8")], align=True)
+NO_VOLUME = -1  # volume value when the volume could not be retrieved
+
+CHANGE_PATTERN = re.compile(r"([+-]?[\d,.]+)\s*\(([+-]?[\d,.]+)%?\)%?")
+
+
+def parse_number(text):
+    """
+    Convert a scraped number ("2,670,653", "166.15", 166.15) into float
+    :param text: string or number
+    :return: float, nan if the text is empty
+    """
+    if isinstance(text, np.floating):  # float32 prices of the scrapers, keep their written value (166.15)
+        text = str(text)
+    if isinstance(text, str):
+        text = text.replace(",", "").strip()
+        if not text:
+            return float("nan")
+    return float(text)
+
+
+def parse_change(text):
+    """
+    Split a scraped change text ("+0.91 (+0.01)%") into the change and the change in percentage
+    :param text: change text
+    :return: (change, pct), nan if the text cannot be parsed
+    """
+    match = CHANGE_PATTERN.search(text) if isinstance(text, str) else None
+    if match is None:
+        return float("nan"), float("nan")
+    return parse_number(match.group(1)), parse_number(match.group(2))
+
+
+def format_price(price):
+    """
+    Format a price the way it is written in the csv file
+    :param price: float
+    :return: string, empty for nan
+    """
+    if price != price:
+        return ""
+    text = repr(float(price))
+    return text[:-2] if text.endswith(".0") else text
+
+
+def format_change(change, pct):
+    """
+    Format a change the way it is written in the csv file ("+0.91 (+0.01)%")
+    :param change: price change
+    :param pct: price change in percentage
+    :return: string, empty for nan
+    """
+    if change != change or pct != pct:
+        return ""
+    return f"{change:+} ({pct:+})%"
+
+
+def format_volume(volume):
+    """
+    Format a volume the way it is written in the csv file ("2,670,653")
+    :param volume: integer
+    :return: string, empty when there is no volume
+    """
+    return "" if volume == NO_VOLUME else f"{int(volume):,}"
+
+
+def make_records(time_stamp, quotes, symbol_id):
+    """
+    Convert one sweep of scraped values into tick records
+    :param time_stamp: time stamp of the sweep (string or datetime)
+    :param quotes: list of (symbol, price, change, volume) as returned by the scrapers
+    :param symbol_id: function returning the id of a symbol
+    :return: record array
+    """
+    records = np.zeros(len(quotes), dtype=TICK_DTYPE)
+    records["time"] = pd.Timestamp(time_stamp).value
+    for n, (symbol, price, change, volume) in enumerate(quotes):
+        volume = parse_number(volume)
+        records[n]["symbol"] = symbol_id(symbol)
+        records[n]["price"] = parse_number(price)
+        records[n]["change"], records[n]["pct"] = parse_change(change)
+        records[n]["volume"] = NO_VOLUME if volume != volume else int(volume)
+    return records
+
+
+class SymbolIndex:
+    """
+    Record numbers of every symbol in a tick store, built incrementally from the appended records.
+    Reading the history of one symbol then only touches its own records instead of scanning the whole store.
+    """
+
+    def __init__(self):
+        self.chunks = {}  # symbol id: list of record number arrays
+        self.size = 0  # number of indexed records
+
+    def update(self, records, start=None):
+        """
+        Index new records
+        :param records: record array with TICK_DTYPE
+        :param start: record number of the first record (default: right after the indexed records)
+        """
+        start = self.size if start is None else start
+        ids = np.asarray(records["symbol"])
+        order = np.argsort(ids, kind="stable")  # group by symbol, keep the file order inside a group
+        unique, first = np.unique(ids[order], return_index=True)
+        for symbol_id, group in zip(unique.tolist(), np.split(order, first[1:])):
+            self.chunks.setdefault(symbol_id, []).append(group + start)
+        self.size = start + len(ids)
+
+    def positions(self, symbol_id):
+        """
+        :param symbol_id: symbol id
+        :return: sorted record numbers of the symbol
+        """
+        chunks = self.chunks.get(symbol_id)
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+
+class TickStore:
+    """
+    Append-only binary tick store with fixed width records (see TICK_DTYPE).
+    A sweep is appended with a single write and read back zero-copy through numpy.memmap.
+    Symbol names are kept in a small json file next to the store.
+    """
+
+    def __init__(self, path, symbols_path=None):
+        """
+        :param path: store file name, ex: "stock_data.ticks"
+        :param symbols_path: json file with the symbol names (default: path + ".symbols")
+        """
+        self.path = path
+        self.symbols_path = path + ".symbols" if symbols_path is None else symbols_path
+        self.load_symbols()
+
+    def load_symbols(self):
+        """
+        (Re)load the symbol names, ex: after a collector registered new symbols
+        """
+        self.symbols = []  # symbol name of every symbol id
+        if os.path.exists(self.symbols_path):
+            with open(self.symbols_path) as f:
+                self.symbols = json.load(f)
+        self.symbol_ids = {symbol: n for n, symbol in enumerate(self.symbols)}
+
+    def symbol_id(self, symbol):
+        """
+        Get the id of a symbol, register it if it is new
+        :param symbol: stock symbol
+        :return: symbol id
+        """
+        if symbol not in self.symbol_ids:
+            self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            with open(self.symbols_path, "w") as f:
+                json.dump(self.symbols, f)
+        return self.symbol_ids[symbol]
+
+    def make_records(self, time_stamp, quotes):
+        """
+        Convert one sweep of scraped values into tick records
+        :param time_stamp: time stamp of the sweep (string or datetime)
+        :param quotes: list of (symbol, price, change, volume) as returned by the scrapers
+        :return: record array
+        """
+        return make_records(time_stamp, quotes, self.symbol_id)
+
+    def append(self, time_stamp, quotes):
+        """
+        Append one sweep to the store
+        :param time_stamp: time stamp of the sweep
+        :param quotes: list of (symbol, price, change, volume) as returned by the scrapers
+        """
+        self.append_records(self.make_records(time_stamp, quotes))
+
+    def append_records(self, records):
+        """
+        Append records to the store with a single write
+        :param records: record array with TICK_DTYPE
+        """
+        with open(self.path, "ab") as f:
+            f.write(records.astype(TICK_DTYPE, copy=False).tobytes())
+
+    def __len__(self):
+        """
+        :return: number of complete records in the store
+        """
+        try:
+            return os.path.getsize(self.path) // TICK_DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def read(self, start=0, stop=None):
+        """
+        Read records without copying them
+        :param start: first record
+        :param stop: end record (default: all complete records)
+        :return: read-only memory mapped record array
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if stop <= start:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return np.memmap(self.path, dtype=TICK_DTYPE, mode="r",
+                         offset=start * TICK_DTYPE.itemsize, shape=(stop - start,))
+
+    def remap(self, records, symbols):
+        """
+        Convert the symbol ids of records from another symbol table into the ids of this store
+        :param records: record array
+        :param symbols: symbol name of every id used by the records
+        :return: copy of the records with the ids of this store
+        """
+        ids = np.array([self.symbol_id(symbol) for symbol in symbols] or [0], dtype=np.int32)
+        records = np.array(records, dtype=TICK_DTYPE)
+        records["symbol"] = ids[records["symbol"]]
+        return records
+
+    def read_symbol(self, symbol, index=None):
+        """
+        Read the records of one symbol
+        :param symbol: stock symbol
+        :param index: SymbolIndex of the store (default: scan every record)
+        :return: record array of the symbol
+        """
+        symbol_id = self.symbol_ids.get(symbol, -1)
+        if index is None:
+            records = self.read()
+            return records[records["symbol"] == symbol_id]
+        positions = index.positions(symbol_id)
+        return self.read(0, index.size)[positions]
+
+    def export_csv(self, filename, symbols=None):
+        """
+        Export the store into the wide csv layout written by the scrapers
+        (index, time, then price, change and volume of every symbol)
+        :param filename: csv file name
+        :param symbols: symbols and order of the columns (default: all symbols of the store)
+        """
+        symbols = self.symbols if symbols is None else symbols
+        positions = {self.symbol_ids[symbol]: n for n, symbol in enumerate(symbols) if symbol in self.symbol_ids}
+        records = self.read()
+
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            row = None
+            last_time = None
+            for record in records:
+                time_stamp = int(record["time"])
+                position = positions.get(int(record["symbol"]))
+                # A new row starts with a new sweep time, or when a symbol repeats
+                if row is None or time_stamp != last_time or (position is not None and row[2 + position * 3]):
+                    if row is not None:
+                        writer.writerow(row)
+                    row = [0, pd.Timestamp(time_stamp).strftime("%Y-%m-%d %H:%M:%S")] + [""] * (len(symbols) * 3)
+                    last_time = time_stamp
+                if position is not None:
+                    row[2 + position * 3] = format_price(record["price"])
+                    row[3 + position * 3] = format_change(record["change"], record["pct"])
+                    row[4 + position * 3] = format_volume(record["volume"])
+            if row is not None:
+                writer.writerow(row)
+
+    def import_csv(self, filename, symbols):
+        """
+        Append the rows of a wide csv file to the store
+        :param filename: csv file name
+        :param symbols: symbols of the csv columns, in order
+        """
+        with open(filename, newline="") as f:
+            for row in csv.reader(f):
+                quotes = [(symbol, row[2 + n * 3], row[3 + n * 3], row[4 + n * 3]) for n, symbol in enumerate(symbols)]
+                self.append(row[1], quotes)
+
+
+if __name__ == "__main__":
+    # Usage: python tick_store.py export stock_data.ticks stock_data.csv
+    #        python tick_store.py import stock_data.csv stock_data.ticks AAPL MSFT ...
+    command, source, target = sys.argv[1:4]
+    if command == "export":
+        TickStore(source).export_csv(target)
+    elif command == "import":
+        TickStore(target).import_csv(source, sys.argv[4:])
@@ -0,0 +1,377 @@
+import argparse
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import metrics
+
+PORT = 8050  # http://127.0.0.1:8050
+FREQ = "1Min"  # bar timeframe sent to the browsers
+HISTORY = 256  # events kept for the viewers catching up, a viewer further behind gets a new snapshot
+KEEPALIVE = 15  # seconds between two keep-alive comments on an idle stream
+DECIMALS = 4  # rounding of the values sent to the browsers
+COLUMNS = ["time", "open", "high", "low", "close", "MA5", "MA10", "MA20", "RSI", "volume_diff"]  # time in ms
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Live Financial Data</title>
+<style>
+body { background: #121416; color: white; font-family: sans-serif; margin: 20px; }
+table { border-collapse: collapse; }
+td, th { padding: 4px 12px; text-align: right; }
+tr { cursor: pointer; }
+tr.focus td:first-child { background: #FFBF00; color: black; }
+.up { color: #18b800; } .down { color: #ff3503; }
+canvas { background: #0a1014; margin-top: 16px; }
+</style>
+</head>
+<body>
+<table><thead><tr><th>Stock</th><th>Price</th><th>Change</th><th>Volume</th><th>RSI(14)</th></tr></thead>
+<tbody id="rows"></tbody></table>
+<canvas id="chart" width="800" height="300"></canvas>
+<script>
+var bars = {}, latest = {}, focus = null;
+var CLOSE = 4, RSI = 8;
+
+function apply(symbols) {
+    for (var symbol in symbols) {
+        var update = symbols[symbol];
+        var rows = bars[symbol] || [];
+        rows.length = update.from;  // rows from this index changed
+        bars[symbol] = rows.concat(update.bars);
+        latest[symbol] = update;
+        if (focus === null) focus = symbol;
+    }
+    render();
+}
+
+function cell(row, text, className) {
+    // scraped values are set as text, never parsed as html
+    var td = row.insertCell();
+    td.textContent = text;
+    if (className) td.className = className;
+}
+
+function render() {
+    var body = document.createElement("tbody");
+    body.id = "rows";
+    Object.keys(latest).forEach(function (symbol) {
+        var info = latest[symbol], rows = bars[symbol];
+        var rsi = rows.length ? rows[rows.length - 1][RSI].toFixed(2) : "...";
+        var row = body.insertRow();
+        if (symbol === focus) row.className = "focus";
+        row.addEventListener("click", function () { focus = symbol; render(); });
+        cell(row, symbol);
+        cell(row, info.price);
+        cell(row, info.change, String(info.change)[0] === "+" ? "up" : "down");
+        cell(row, Number(info.volume).toLocaleString());
+        cell(row, rsi);
+    });
+    var old = document.getElementById("rows");
+    old.parentNode.replaceChild(body, old);
+
+    var canvas = document.getElementById("chart"), ctx = canvas.getContext("2d");
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    var rows = bars[focus] || [];
+    if (rows.length < 2) return;
+    var low = Infinity, high = -Infinity;
+    rows.forEach(function (row) { low = Math.min(low, row[CLOSE]); high = Math.max(high, row[CLOSE]); });
+    ctx.strokeStyle = "white";
+    ctx.beginPath();
+    rows.forEach(function (row, n) {
+        var x = n / (rows.length - 1) * (canvas.width - 20) + 10;
+        var y = canvas.height - 10 - (row[CLOSE] - low) / ((high - low) || 1) * (canvas.height - 20);
+        n ? ctx.lineTo(x, y) : ctx.moveTo(x, y);
+    });
+    ctx.stroke();
+}
+
+var source = new EventSource("/events");
+source.addEventListener("snapshot", function (e) { bars = {}; apply(JSON.parse(e.data).symbols); });
+source.addEventListener("delta", function (e) { apply(JSON.parse(e.data).symbols); });
+</script>
+</body>
+</html>
+"""
+
+
+def encode_event(kind, version, payload):
+    """
+    :param kind: event name, "snapshot" or "delta"
+    :param version: data version, event id
+    :param payload: json serializable data
+    :return: server-sent event bytes
+    """
+    data = json.dumps(payload, separators=(",", ":"))
+    return ("id: %d\nevent: %s\ndata: %s\n\n" % (version, kind, data)).encode()
+
+
+def frame_values(data):
+    """
+    :param data: prepared data of one stock
+    :return: 2d float array with the COLUMNS, time in ms
+    """
+    values = np.empty((len(data), len(COLUMNS)))
+    values[:, 0] = data["time"].to_numpy("datetime64[ms]").astype(np.int64)
+    for n, column in enumerate(COLUMNS[1:], 1):
+        values[:, n] = data[column].to_numpy(float)
+    return values
+
+
+def first_changed(previous, values):
+    """
+    :param previous: values sent before
+    :param values: current values
+    :return: index of the first row that changed or was added
+    """
+    if previous is None:
+        return 0
+    common = min(len(previous), len(values))
+    before, after = previous[:common], values[:common]
+    changed = np.flatnonzero(((before != after) & ~(np.isnan(before) & np.isnan(after))).any(axis=1))  # nan: unknown
+    return int(changed[0]) if len(changed) else common
+
+
+class Broadcaster:
+    """
+    Fan-out of encoded events: an event is encoded once and written as is to every viewer.
+    The viewers follow the events with a cursor, so publishing never waits for a slow viewer.
+    """
+
+    def __init__(self, history=HISTORY):
+        """
+        :param history: events kept for the viewers catching up
+        """
+        self.condition = threading.Condition()
+        self.events = collections.deque(maxlen=history)
+        self.sequence = 0  # number of published events
+
+    def publish(self, event):
+        """
+        :param event: encoded event
+        """
+        with self.condition:
+            self.events.append(event)
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def wait(self, cursor, timeout=KEEPALIVE):
+        """
+        Wait for the events after a cursor
+        :param cursor: number of events the viewer has
+        :param timeout: seconds
+        :return: (events, new cursor), events is None if the viewer is too far behind
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > cursor, timeout)
+            missed = self.sequence - cursor
+            if missed > len(self.events):
+                return None, self.sequence
+            return list(self.events)[len(self.events) - missed:], self.sequence
+
+
+class DashboardState:
+    """
+    Data of every stock computed once per update: bars and indicators come from the bar caches of the
+    dashboard module, only the rows that changed since the last update are published as a delta.
+    """
+
+    def __init__(self, symbols=None, freq=FREQ, broadcaster=None):
+        """
+        :param symbols: stocks (default: dashboard.Stock)
+        :param freq: bar timeframe
+        :param broadcaster: Broadcaster of the deltas
+        """
+        import dashboard
+        self.dashboard = dashboard
+        self.symbols = list(symbols or dashboard.Stock)
+        self.freq = freq
+        self.broadcaster = broadcaster or Broadcaster()
+        self.lock = threading.Lock()  # one update at a time, a snapshot matches the cursor of the broadcaster
+        self.versions = {}  # symbol: bar cache version of the published data
+        self.values = {}  # symbol: published values
+        self.latest = {}  # symbol: (latest price, latest change, volume)
+        self.version = 0  # number of published updates
+        self.snapshot = None  # encoded snapshot event of the current version
+
+    def payload(self, symbol, start):
+        """
+        :param symbol: stock symbol
+        :param start: first row to send
+        :return: json serializable update of a stock
+        """
+        price, change, volume = self.latest[symbol]
+        values = np.round(self.values[symbol][start:], DECIMALS).astype(object)
+        values[np.isnan(values.astype(float))] = None  # unknown volume differences, json has no nan
+        return {"price": price, "change": change, "volume": int(volume), "from": start, "bars": values.tolist()}
+
+    def update(self):
+        """
+        Read the new ticks and publish the changed rows of every stock
+        :return: number of changed stocks
+        """
+        with self.lock, metrics.timer("web_update_seconds"):
+            all_data = self.dashboard.read_snapshot_ohlc(self.symbols, self.freq, self.freq)
+            changes = {}
+            for symbol, (data, price, change, volume) in zip(self.symbols, all_data):
+                version = self.dashboard.engines[symbol].version
+                if self.versions.get(symbol) == version:  # no new tick
+                    continue
+                values = frame_values(data)
+                start = first_changed(self.values.get(symbol), values)
+                self.versions[symbol] = version
+                self.values[symbol] = values
+                self.latest[symbol] = (price, change, volume)
+                changes[symbol] = self.payload(symbol, start)
+            if changes:
+                self.version += 1
+                self.snapshot = None
+                self.broadcaster.publish(encode_event("delta", self.version, {"symbols": changes}))
+            return len(changes)
+
+    def subscribe(self):
+        """
+        :return: (encoded snapshot event, cursor of the broadcaster after the snapshot)
+        """
+        with self.lock:
+            if self.snapshot is None:  # encoded once per version for every viewer joining
+                symbols = {symbol: self.payload(symbol, 0) for symbol in self.values}
+                self.snapshot = encode_event("snapshot", self.version, {"symbols": symbols})
+            return self.snapshot, self.broadcaster.sequence
+
+    def run(self, interval):
+        """
+        Update loop
+        :param interval: seconds between two updates
+        """
+        while True:
+            self.update()
+            time.sleep(interval)
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """
+    /          page of the dashboard
+    /events    server-sent events: a snapshot, then the deltas
+    /snapshot  current data as json
+    /stats     cpu time and viewers of the server, used by the load test
+    """
+    state = None  # DashboardState shared by every request
+    viewers = 0  # number of open event streams
+    lock = threading.Lock()
+
+    def do_GET(self):
+        """
+        Handle a GET request
+        """
+        path = self.path.split("?")[0]
+        if path == "/":
+            self.send_body(INDEX_HTML.encode(), "text/html; charset=utf-8")
+        elif path == "/snapshot":
+            event, _ = self.state.subscribe()
+            self.send_body(event.split(b"data: ", 1)[1].strip(), "application/json")
+        elif path == "/stats":
+            stats = {"cpu_seconds": time.process_time(), "viewers": DashboardHandler.viewers,
+                     "version": self.state.version, "events": self.state.broadcaster.sequence}
+            self.send_body(json.dumps(stats).encode(), "application/json")
+        elif path == "/events":
+            self.stream()
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        """
+        :param body: bytes
+        :param content_type: mime type
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self):
+        """
+        Send the events to a viewer until it disconnects
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        with DashboardHandler.lock:
+            DashboardHandler.viewers += 1
+            metrics.set_gauge("web_viewers", DashboardHandler.viewers)
+        try:
+            snapshot, cursor = self.state.subscribe()
+            self.wfile.write(snapshot)
+            self.wfile.flush()
+            while True:
+                events, cursor = self.state.broadcaster.wait(cursor)
+                if events is None:  # too far behind, start again from a snapshot
+                    snapshot, cursor = self.state.subscribe()
+                    events = [snapshot]
+                self.wfile.write(b"".join(events) if events else b": keep-alive\n\n")
+                self.wfile.flush()
+        except OSError:  # viewer went away
+            pass
+        finally:
+            with DashboardHandler.lock:
+                DashboardHandler.viewers -= 1
+                metrics.set_gauge("web_viewers", DashboardHandler.viewers)
+
+    def log_message(self, format, *args):
+        """
+        Keep the console quiet
+        """
+
+
+class DashboardServer(ThreadingHTTPServer):
+    """
+    Http server with one thread per request and room for many viewers connecting at once
+    """
+    daemon_threads = True
+    request_queue_size = 128  # pending connections (default: 5)
+
+
+def start_web_dashboard(port=PORT, freq=FREQ, interval=None):
+    """
+    Serve the dashboard to any number of browsers, the data is computed once per update
+    :param port: port to listen on (0: any free port)
+    :param freq: bar timeframe
+    :param interval: seconds between two updates (default: dashboard.REFRESH_INTERVAL)
+    :return: (server, url)
+    """
+    metrics.start()  # exporters configured with METRICS_PORT / METRICS_FILE, no-op otherwise
+    state = DashboardState(freq=freq)
+    interval = state.dashboard.REFRESH_INTERVAL / 1000 if interval is None else interval
+    threading.Thread(target=state.run, args=(interval,), daemon=True).start()
+
+    DashboardHandler.state = state
+    server = DashboardServer(("127.0.0.1", port), DashboardHandler)
+    return server, "http://127.0.0.1:%d/" % server.server_address[1]
+
+
+if __name__ == "__main__":
+    # Usage: python web_dashboard.py [--port 8050] [--freq 5Min]  then open http://127.0.0.1:8050/
+    parser = argparse.ArgumentParser(description="Serve the dashboard to browsers with server-sent events")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--freq", default=FREQ, help="bar timeframe, ex: 5Min")
+    parser.add_argument("--alerts", action="store_true",
+                        help="append the alert notifications to alerts.jsonl (off when a dashboard also runs)")
+    args = parser.parse_args()
+
+    if args.alerts:
+        import dashboard
+        from alerts import AlertSink
+        if dashboard.alert_engine is not None:
+            dashboard.alert_engine.sink = AlertSink()
+
+    server, url = start_web_dashboard(args.port, args.freq)
+    print("Serving the dashboard on " + url, flush=True)
+    server.serve_forever()